@@ -4,28 +4,35 @@ import "./App.css";
 function App() {
   const [currentChat, setCurrentChat] = useState([]);
   const [chatHistory, setChatHistory] = useState({});
-  const [chatIdCounter, setChatIdCounter] = useState(1);
   const [userInput, setUserInput] = useState("");
   const [selectedChat, setSelectedChat] = useState(null);
   const [sidebarOpen, setSidebarOpen] = useState(true);
+  const [nextCursor, setNextCursor] = useState(null);
 
-  // Fetch saved chats from the backend on component mount
-  useEffect(() => {
-    async function fetchChats() {
-      try {
-        const res = await fetch("/chats");
-        const chats = await res.json();
-        const history = {};
-        // Build chatHistory object: key as session_id, value as chat object
-        chats.forEach((chat) => {
-          history[chat.session_id] = chat;
+  // Fetch one page of chat summaries (title + timestamp); pass the previous
+  // page's next_cursor to continue where it left off.
+  const loadChats = async (cursor = null) => {
+    try {
+      const url = cursor ? `/chats?cursor=${encodeURIComponent(cursor)}` : "/chats";
+      const res = await fetch(url);
+      const page = await res.json();
+      // Build chatHistory object: key as session_id, value as chat summary
+      setChatHistory((prev) => {
+        const history = { ...prev };
+        page.chats.forEach((chat) => {
+          history[chat.session_id] = { ...chat, ...prev[chat.session_id] };
         });
-        setChatHistory(history);
-      } catch (error) {
-        console.error("Error fetching chats:", error);
-      }
+        return history;
+      });
+      setNextCursor(page.next_cursor);
+    } catch (error) {
+      console.error("Error fetching chats:", error);
     }
-    fetchChats();
+  };
+
+  // Fetch the first page of saved chats on component mount
+  useEffect(() => {
+    loadChats();
   }, []);
 
   // Generate a friendly chat title from the first query.
@@ -42,9 +49,24 @@ function App() {
     setSidebarOpen(!sidebarOpen);
   };
 
-  const handleChatSelect = (chatId) => {
+  const handleChatSelect = async (chatId) => {
     setSelectedChat(chatId);
-    setCurrentChat(chatHistory[chatId]?.messages || []);
+    const loaded = chatHistory[chatId]?.messages;
+    if (loaded) {
+      setCurrentChat(loaded);
+      return;
+    }
+    // The sidebar only has summaries; fetch this session's latest messages.
+    setCurrentChat([]);
+    try {
+      const res = await fetch(`/chats/${encodeURIComponent(chatId)}`);
+      const chat = await res.json();
+      const messages = chat.messages || [];
+      setChatHistory(prev => ({ ...prev, [chatId]: { ...prev[chatId], messages } }));
+      setCurrentChat(messages);
+    } catch (error) {
+      console.error("Error fetching chat messages:", error);
+    }
   };
 
   const handleNewChat = () => {
@@ -53,56 +75,90 @@ function App() {
     setSelectedChat(null);
   };
 
+  // Read a server-sent event stream from /query/stream, calling onEvent for
+  // each parsed event as soon as it arrives.
+  const readEventStream = async (res, onEvent) => {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = "";
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+      let boundary;
+      while ((boundary = buffer.indexOf("\n\n")) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        let event = "message";
+        let data = "";
+        rawEvent.split("\n").forEach((line) => {
+          if (line.startsWith("event: ")) event = line.slice(7);
+          else if (line.startsWith("data: ")) data += line.slice(6);
+        });
+        if (data) onEvent(event, JSON.parse(data));
+      }
+    }
+  };
+
   const handleSend = async (e) => {
     e.preventDefault();
     if (!userInput.trim()) return;
 
-    const newUserMsg = { role: "user", content: userInput.trim() };
-    const updatedChat = [...currentChat, newUserMsg];
+    const query = userInput.trim();
+    const newUserMsg = { role: "user", content: query };
+    const baseChat = [...currentChat, newUserMsg];
+    let answer = "";
+    let chatId = selectedChat;
+
+    // Show the user's message and an empty assistant bubble that fills in as tokens stream.
+    setCurrentChat([...baseChat, { role: "assistant", content: "" }]);
+    setUserInput("");
 
     try {
-      const payload = { query: userInput.trim() };
+      const payload = { query };
       if (selectedChat) {
         payload.chat_id = selectedChat;
       }
-      const res = await fetch("/query", {
+      const res = await fetch("/query/stream", {
         method: "POST",
         headers: { "Content-Type": "application/json" },
         body: JSON.stringify(payload),
       });
-      const data = await res.json();
-      const backendResponse = data.answer || "No answer received.";
-      const newAssistantMsg = { role: "assistant", content: backendResponse };
-      updatedChat.push(newAssistantMsg);
-
-      // If no chat is selected, create a new one and generate a friendly title
-      let chatId = selectedChat;
-      if (!chatId) {
-        chatId = `Chat ${chatIdCounter}`;
-        setChatIdCounter(prev => prev + 1);
-        // Add title based on the first query
-        const newChat = {
-          session_id: chatId,
-          title: generateChatTitle(userInput.trim()),
-          messages: updatedChat,
-        };
-        setChatHistory(prev => ({ ...prev, [chatId]: newChat }));
-        setSelectedChat(chatId);
-      } else {
-        // Update existing chat session
-        setChatHistory(prev => ({
-          ...prev,
-          [chatId]: { ...prev[chatId], messages: updatedChat },
-        }));
-      }
+      await readEventStream(res, (event, data) => {
+        if (event === "meta") {
+          chatId = data.chat_id;
+        } else if (event === "error") {
+          answer = data.error || "Error fetching response.";
+        } else if (data.token) {
+          answer += data.token;
+          setCurrentChat([...baseChat, { role: "assistant", content: answer }]);
+        }
+      });
     } catch (error) {
       console.error("Error fetching response:", error);
-      const newAssistantMsg = { role: "assistant", content: "Error fetching response." };
-      updatedChat.push(newAssistantMsg);
+      answer = "Error fetching response.";
+    }
+
+    const updatedChat = [...baseChat, { role: "assistant", content: answer || "No answer received." }];
+
+    if (!selectedChat && chatId) {
+      // New session: use the server's session id so follow-ups append to it.
+      const newChat = {
+        session_id: chatId,
+        title: generateChatTitle(query),
+        messages: updatedChat,
+      };
+      setChatHistory(prev => ({ [chatId]: newChat, ...prev }));
+      setSelectedChat(chatId);
+    } else if (chatId) {
+      // Update existing chat session
+      setChatHistory(prev => ({
+        ...prev,
+        [chatId]: { ...prev[chatId], messages: updatedChat },
+      }));
     }
 
     setCurrentChat(updatedChat);
-    setUserInput("");
   };
 
   return (
@@ -131,6 +187,11 @@ function App() {
                 </li>
               ))}
             </ul>
+            {nextCursor && (
+              <button onClick={() => loadChats(nextCursor)} className="load-more">
+                Load more
+              </button>
+            )}
           </div>
         )}
       </div>
@@ -1,24 +1,102 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-from retriever import get_retriever
-from prompt_llm import build_prompt, get_llm_response
+from retriever import get_retriever_service
+from pipeline import answer_query, stream_answer, sse_event
+from ioc_index import get_ioc_index
+from chat_store import (
+    ChatWriter, save_chat_turn, prepare_chat_collection, list_chats, get_chat,
+    page_limit, message_window,
+)
+from prompt_llm import answer_cache
 from pymongo import MongoClient
-from datetime import datetime
+import time
 import uuid
-from config import MONGODB_URI, MONGODB_DB, MONGODB_COLLECTION
+from metrics import (
+    registry, start_request, request_timings, observe_request,
+    server_timing_header, PROMETHEUS_CONTENT_TYPE,
+)
+from config import MONGODB_URI, MONGODB_DB, MONGODB_COLLECTION, PRELOAD_RETRIEVER, IOC_LOOKUP_MAX_BATCH, CHAT_WRITE_BEHIND
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})  # Allow all origins
 
-# Initialize MongoDB client and collection
-client = MongoClient(MONGODB_URI)
-db = client[MONGODB_DB]
-chat_collection = db[MONGODB_COLLECTION]
+client = None
+chat_collection = None
+chat_writer = None
+
+def connect_chat_store():
+    # pymongo clients aren't fork-safe, so with PRELOAD_RETRIEVER the
+    # gunicorn master skips this and each worker calls it from post_fork.
+    # Indexes and the legacy migration run once, from gunicorn's on_starting
+    # (or below when run directly), not in every worker.
+    global client, chat_collection, chat_writer
+    client = MongoClient(MONGODB_URI)
+    chat_collection = client[MONGODB_DB][MONGODB_COLLECTION]
+    # Chat turns are written behind the response (see chat_store.ChatWriter).
+    chat_writer = ChatWriter(chat_collection) if CHAT_WRITE_BEHIND else None
+    if chat_writer is not None:
+        registry.gauge("rag_chat_write_queue_depth", "Chat turns waiting to be written.", chat_writer.depth)
+
+if not PRELOAD_RETRIEVER:
+    connect_chat_store()
+
+def persist_turn(chat_id, user_query, answer):
+    if chat_writer is not None:
+        chat_writer.enqueue(chat_id, user_query, answer)
+    else:
+        save_chat_turn(chat_collection, chat_id, user_query, answer)
+
+# Shared retriever: the embedding model is loaded once per process. With
+# PRELOAD_RETRIEVER the gunicorn master loads it before forking workers
+# (weights only; the warm-up encode runs in each worker).
+retriever_service = get_retriever_service()
+if PRELOAD_RETRIEVER:
+    retriever_service.warm_up(encode=False)
+
+@app.before_request
+def start_timing():
+    if registry.enabled:
+        g.request_started = time.perf_counter()
+        start_request()
+
+@app.after_request
+def record_timing(response):
+    # Stage breakdown for this request as a Server-Timing header. Streamed
+    # responses record their total when the stream ends instead.
+    started = g.pop("request_started", None)
+    if started is not None and not g.get("streaming"):
+        elapsed = time.perf_counter() - started
+        observe_request(request.endpoint or "unknown", elapsed)
+        response.headers["Server-Timing"] = server_timing_header(request_timings(), elapsed * 1000)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    if not registry.enabled:
+        return jsonify({"error": "metrics disabled"}), 404
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
 
 @app.route("/", methods=["GET"])
 def home():
     return "Backend is running. Use POST /query to get answers.", 200
 
+@app.route("/health", methods=["GET"])
+def health():
+    # Liveness: the process is up, whether or not the model is warm yet.
+    return jsonify({
+        "status": "ok",
+        "retriever": retriever_service.health(),
+        "answer_cache": answer_cache.stats(),
+        "chat_writer": chat_writer.stats() if chat_writer is not None else None,
+    }), 200
+
+@app.route("/ready", methods=["GET"])
+def ready():
+    # Readiness: only report ready once the retriever has been warmed.
+    status = retriever_service.health()
+    return jsonify(status), (200 if status["ready"] else 503)
+
 @app.route("/query", methods=["POST"])
 def query():
     data = request.get_json()
@@ -28,56 +106,98 @@ def query():
     if not user_query:
         return jsonify({"error": "Query not provided"}), 400
 
-    try:
-        retriever = get_retriever()
-        docs = retriever.invoke(user_query)
-
-        # Concatenate retrieved text from documents.
-        context_parts = []
-        for doc in docs:
-            text = doc.metadata.get("text") if doc.metadata.get("text") else doc.page_content
-            if text:
-                context_parts.append(text)
-        context = "\n\n".join(context_parts)
-
-        final_prompt = build_prompt(user_query, context)
-        answer = get_llm_response(final_prompt)
-
-        if chat_id:
-            # Update existing session: append new messages and update timestamp.
-            update_result = chat_collection.update_one(
-                {"session_id": chat_id},
-                {"$push": {"messages": {"$each": [
-                    {"role": "user", "content": user_query},
-                    {"role": "assistant", "content": answer}
-                ]}},
-                 "$set": {"timestamp": datetime.utcnow()}}
-            )
-        else:
-            # Create a new session with a friendly title.
-            chat_id = str(uuid.uuid4())
-            title = user_query if len(user_query) <= 30 else user_query[:30].strip() + "..."
-            chat_document = {
-                "session_id": chat_id,
-                "title": title,
-                "messages": [
-                    {"role": "user", "content": user_query},
-                    {"role": "assistant", "content": answer}
-                ],
-                "timestamp": datetime.utcnow()
-            }
-            chat_collection.insert_one(chat_document)
+    if not chat_id:
+        chat_id = str(uuid.uuid4())
 
+    try:
+        answer = answer_query(user_query)["answer"]
+        persist_turn(chat_id, user_query, answer)
         return jsonify({"answer": answer, "chat_id": chat_id})
     except Exception as e:
         print("Error processing query:", e)
         return jsonify({"error": "Error processing query."}), 500
 
+@app.route("/query/stream", methods=["POST"])
+def query_stream():
+    # Same contract as /query, but the answer is sent as server-sent events:
+    # a "meta" event with the chat id, unnamed events with {"token": ...}
+    # pieces, then "done" once the full answer has been saved.
+    data = request.get_json()
+    user_query = data.get("query", "")
+    chat_id = data.get("chat_id")
+
+    if not user_query:
+        return jsonify({"error": "Query not provided"}), 400
+
+    if not chat_id:
+        chat_id = str(uuid.uuid4())
+
+    started = time.perf_counter()
+    g.streaming = True
+
+    def generate():
+        yield sse_event({"chat_id": chat_id}, event="meta")
+        parts = []
+        try:
+            for token in stream_answer(user_query):
+                parts.append(token)
+                yield sse_event({"token": token})
+            persist_turn(chat_id, user_query, "".join(parts).strip())
+        except Exception as e:
+            print("Error streaming query:", e)
+            yield sse_event({"error": "Error processing query."}, event="error")
+            return
+        # Headers are long gone by now, so the stage breakdown rides on "done".
+        elapsed = time.perf_counter() - started
+        observe_request("query_stream", elapsed)
+        yield sse_event({"chat_id": chat_id, "timings": request_timings()}, event="done")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return Response(stream_with_context(generate()), mimetype="text/event-stream", headers=headers)
+
+@app.route("/ioc/lookup", methods=["POST"])
+def ioc_lookup():
+    # Batched indicator lookup against the in-memory IOC index: exact matches,
+    # CIDR ranges containing an IP and parent domains of a host.
+    data = request.get_json() or {}
+    indicators = data.get("indicators")
+    if isinstance(indicators, str):
+        indicators = [indicators]
+    if not indicators or not isinstance(indicators, list):
+        return jsonify({"error": "indicators not provided"}), 400
+    if len(indicators) > IOC_LOOKUP_MAX_BATCH:
+        return jsonify({"error": f"at most {IOC_LOOKUP_MAX_BATCH} indicators per request"}), 400
+
+    index = get_ioc_index()
+    results = index.lookup_many(str(item) for item in indicators)
+    return jsonify({"results": results, "index": index.stats()})
+
 @app.route("/chats", methods=["GET"])
 def get_chats():
-    # Fetch the last 50 chat sessions, sorted by most recent.
-    chats = list(chat_collection.find({}, {"_id": 0}).sort("timestamp", -1).limit(50))
-    return jsonify(chats)
+    # Newest sessions first, titles and timestamps only; pass next_cursor
+    # back as ?cursor= for the following page.
+    try:
+        limit = page_limit(request.args.get("limit"))
+        page = list_chats(chat_collection, request.args.get("cursor"), limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+@app.route("/chats/<session_id>", methods=["GET"])
+def get_chat_messages(session_id):
+    # One session with a slice of its messages: ?offset=-50&limit=50 (the
+    # default) is the latest 50; message_count gives the total.
+    try:
+        offset, limit = message_window(request.args.get("offset"), request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    chat = get_chat(chat_collection, session_id, offset, limit)
+    if chat is None:
+        return jsonify({"error": "Chat not found"}), 404
+    return jsonify(chat)
 
 if __name__ == "__main__":
+    if chat_collection is None:
+        connect_chat_store()
+    prepare_chat_collection(chat_collection)
     app.run(debug=True, use_reloader=False)
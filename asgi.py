@@ -0,0 +1,200 @@
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+from motor.motor_asyncio import AsyncIOMotorClient
+from retriever import get_retriever_service
+from pipeline import aanswer_query, astream_answer, sse_event
+from prompt_llm import answer_cache
+from ioc_index import get_ioc_index
+from chat_store import (
+    AsyncChatWriter, asave_chat_turn, aensure_indexes, alist_chats, aget_chat,
+    page_limit, message_window,
+)
+import asyncio
+import time
+import uuid
+from metrics import (
+    registry, start_request, request_timings, observe_request,
+    server_timing_header, PROMETHEUS_CONTENT_TYPE,
+)
+from concurrent.futures import ThreadPoolExecutor
+from config import MONGODB_URI, MONGODB_DB, MONGODB_COLLECTION, PRELOAD_RETRIEVER, IOC_LOOKUP_MAX_BATCH, ASYNC_IO_THREADS, CHAT_WRITE_BEHIND
+
+# Async twin of app.py: same routes and payloads, served from an ASGI worker so
+# one process can hold many queries in flight while they wait on Pinecone,
+# Groq and MongoDB. Run with:
+#   gunicorn asgi:app -k uvicorn.workers.UvicornWorker -c gunicorn.conf.py
+app = Quart(__name__)
+app = cors(app, allow_origin="*")  # Allow all origins
+
+retriever_service = get_retriever_service()
+if PRELOAD_RETRIEVER:
+    retriever_service.warm_up(encode=False)  # the encode runs per worker (post_worker_init)
+
+chat_collection = None
+chat_writer = None
+
+async def persist_turn(chat_id, user_query, answer):
+    if chat_writer is not None:
+        await chat_writer.enqueue(chat_id, user_query, answer)
+    else:
+        await asave_chat_turn(chat_collection, chat_id, user_query, answer)
+
+@app.before_serving
+async def startup():
+    # Blocking Pinecone/embedding calls run on the default executor; size it
+    # for the number of queries we expect to have in flight.
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=ASYNC_IO_THREADS))
+    # Motor binds to the running event loop, so connect once the loop exists.
+    global chat_collection, chat_writer
+    client = AsyncIOMotorClient(MONGODB_URI)
+    chat_collection = client[MONGODB_DB][MONGODB_COLLECTION]
+    await aensure_indexes(chat_collection)
+    if CHAT_WRITE_BEHIND:
+        chat_writer = AsyncChatWriter(chat_collection).start()
+        registry.gauge("rag_chat_write_queue_depth", "Chat turns waiting to be written.", chat_writer.depth)
+
+@app.after_serving
+async def shutdown():
+    # Write out any queued chat turns before the worker exits.
+    if chat_writer is not None:
+        await chat_writer.close()
+
+@app.before_request
+async def start_timing():
+    if registry.enabled:
+        g.request_started = time.perf_counter()
+        start_request()
+
+@app.after_request
+async def record_timing(response):
+    started = g.pop("request_started", None)
+    if started is not None and not g.get("streaming"):
+        elapsed = time.perf_counter() - started
+        observe_request(request.endpoint or "unknown", elapsed)
+        response.headers["Server-Timing"] = server_timing_header(request_timings(), elapsed * 1000)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    if not registry.enabled:
+        return jsonify({"error": "metrics disabled"}), 404
+    return Response(registry.render(), content_type=PROMETHEUS_CONTENT_TYPE)
+
+@app.route("/", methods=["GET"])
+async def home():
+    return "Backend is running. Use POST /query to get answers.", 200
+
+@app.route("/health", methods=["GET"])
+async def health():
+    return jsonify({
+        "status": "ok",
+        "retriever": retriever_service.health(),
+        "answer_cache": answer_cache.stats(),
+        "chat_writer": chat_writer.stats() if chat_writer is not None else None,
+    }), 200
+
+@app.route("/ready", methods=["GET"])
+async def ready():
+    status = retriever_service.health()
+    return jsonify(status), (200 if status["ready"] else 503)
+
+@app.route("/query", methods=["POST"])
+async def query():
+    data = await request.get_json()
+    user_query = data.get("query", "")
+    chat_id = data.get("chat_id")  # Provided if continuing a session
+
+    if not user_query:
+        return jsonify({"error": "Query not provided"}), 400
+
+    if not chat_id:
+        chat_id = str(uuid.uuid4())
+
+    try:
+        answer = (await aanswer_query(user_query))["answer"]
+        await persist_turn(chat_id, user_query, answer)
+        return jsonify({"answer": answer, "chat_id": chat_id})
+    except Exception as e:
+        print("Error processing query:", e)
+        return jsonify({"error": "Error processing query."}), 500
+
+@app.route("/query/stream", methods=["POST"])
+async def query_stream():
+    data = await request.get_json()
+    user_query = data.get("query", "")
+    chat_id = data.get("chat_id")
+
+    if not user_query:
+        return jsonify({"error": "Query not provided"}), 400
+
+    if not chat_id:
+        chat_id = str(uuid.uuid4())
+
+    started = time.perf_counter()
+    timings = request_timings()
+    g.streaming = True
+
+    async def generate():
+        yield sse_event({"chat_id": chat_id}, event="meta")
+        parts = []
+        try:
+            async for token in astream_answer(user_query):
+                parts.append(token)
+                yield sse_event({"token": token})
+            await persist_turn(chat_id, user_query, "".join(parts).strip())
+        except Exception as e:
+            print("Error streaming query:", e)
+            yield sse_event({"error": "Error processing query."}, event="error")
+            return
+        observe_request("query_stream", time.perf_counter() - started)
+        yield sse_event({"chat_id": chat_id, "timings": timings}, event="done")
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    response = Response(generate(), mimetype="text/event-stream", headers=headers)
+    response.timeout = None  # Streams can outlive Quart's default response timeout.
+    return response
+
+@app.route("/ioc/lookup", methods=["POST"])
+async def ioc_lookup():
+    # Batched indicator lookup against the in-memory IOC index: exact matches,
+    # CIDR ranges containing an IP and parent domains of a host.
+    data = await request.get_json() or {}
+    indicators = data.get("indicators")
+    if isinstance(indicators, str):
+        indicators = [indicators]
+    if not indicators or not isinstance(indicators, list):
+        return jsonify({"error": "indicators not provided"}), 400
+    if len(indicators) > IOC_LOOKUP_MAX_BATCH:
+        return jsonify({"error": f"at most {IOC_LOOKUP_MAX_BATCH} indicators per request"}), 400
+
+    index = await asyncio.to_thread(get_ioc_index)
+    results = index.lookup_many(str(item) for item in indicators)
+    return jsonify({"results": results, "index": index.stats()})
+
+@app.route("/chats", methods=["GET"])
+async def get_chats():
+    # Newest sessions first, titles and timestamps only; pass next_cursor
+    # back as ?cursor= for the following page.
+    try:
+        limit = page_limit(request.args.get("limit"))
+        page = await alist_chats(chat_collection, request.args.get("cursor"), limit)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(page)
+
+@app.route("/chats/<session_id>", methods=["GET"])
+async def get_chat_messages(session_id):
+    # One session with a slice of its messages: ?offset=-50&limit=50 (the
+    # default) is the latest 50; message_count gives the total.
+    try:
+        offset, limit = message_window(request.args.get("offset"), request.args.get("limit"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    chat = await aget_chat(chat_collection, session_id, offset, limit)
+    if chat is None:
+        return jsonify({"error": "Chat not found"}), 404
+    return jsonify(chat)
+
+if __name__ == "__main__":
+    app.run(debug=True, use_reloader=False)
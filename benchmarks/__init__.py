@@ -0,0 +1,2 @@
+# Offline benchmarks; run each as a module from the repository root, e.g.
+#   python -m benchmarks.embedding_backends
@@ -0,0 +1,50 @@
+import json
+import math
+import os
+import sys
+from document_store import DocumentStore, record_id
+
+def load_corpus(path: str = None, store_path: str = None) -> list:
+    # Live documents from the document store, or the legacy data.json when the
+    # store is empty. Returns [{"id", "page_content", "metadata"}].
+    store = DocumentStore(store_path) if store_path else DocumentStore()
+    docs = [entry for entry in store.iter_documents() if entry["page_content"]]
+    if docs and path is None:
+        return docs
+    with open(path or "data.json", "r", encoding="utf-8") as f:
+        records = json.load(f)
+    # Content-hash ids, as the indexer assigns them, so golden sets built
+    # from data.json line up with a live (Pinecone) index; duplicates collapse.
+    docs = {}
+    for record in records:
+        if record.get("page_content"):
+            docs.setdefault(record_id(record), {
+                "id": record_id(record), "page_content": record["page_content"], "metadata": record.get("metadata") or {},
+            })
+    return list(docs.values())
+
+def percentile(values, pct: float) -> float:
+    # Nearest-rank percentile; 0.0 for an empty list.
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+def latency_summary(seconds) -> dict:
+    ms = [value * 1000 for value in seconds]
+    return {
+        "count": len(ms),
+        "mean_ms": sum(ms) / len(ms) if ms else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+    }
+
+def write_report(report: dict, output: str = None):
+    text = json.dumps(report, indent=2)
+    if output:
+        os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.stdout.write(text + "\n")
@@ -0,0 +1,87 @@
+import argparse
+import time
+import numpy as np
+from embedder import EMBEDDING_BACKENDS, Embedder
+from benchmarks.common import load_corpus, latency_summary, write_report
+
+# Compares embedding runtimes on the local corpus: model load time, batch
+# encode throughput, single-query latency, and how much top-k retrieval drifts
+# from the fp32 ("torch") baseline.
+#
+#   python -m benchmarks.embedding_backends --backends torch int8 onnx --output bench/embed.json
+
+def sample_queries(corpus, count: int) -> list:
+    # The opening words of each document stand in for user questions.
+    step = max(1, len(corpus) // count)
+    return [" ".join(doc["page_content"].split()[:12]) for doc in corpus[::step][:count]]
+
+def top_k(doc_vectors, query_vectors, k: int) -> list:
+    scores = query_vectors @ doc_vectors.T
+    return [set(np.argsort(-row)[:k].tolist()) for row in scores]
+
+def run_backend(backend, texts, queries, batch_size, repeats):
+    started = time.perf_counter()
+    embedder = Embedder(backend=backend)
+    load_seconds = time.perf_counter() - started
+    embedder.encode(["warm up"])
+
+    started = time.perf_counter()
+    doc_vectors = embedder.encode(texts, batch_size=batch_size)
+    encode_seconds = time.perf_counter() - started
+
+    query_latencies, query_vectors = [], []
+    for _ in range(repeats):
+        query_vectors = []
+        for query in queries:
+            started = time.perf_counter()
+            query_vectors.append(embedder.encode([query])[0])
+            query_latencies.append(time.perf_counter() - started)
+
+    result = {
+        "load_seconds": load_seconds,
+        "documents": len(texts),
+        "encode_seconds": encode_seconds,
+        "docs_per_second": len(texts) / encode_seconds if encode_seconds else 0.0,
+        "query_latency": latency_summary(query_latencies),
+    }
+    return result, doc_vectors, np.array(query_vectors)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare embedding backends against fp32.")
+    parser.add_argument("--backends", nargs="+", default=list(EMBEDDING_BACKENDS), choices=EMBEDDING_BACKENDS)
+    parser.add_argument("--data", default=None, help="JSON list of records (default: document store, else data.json)")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data)
+    texts = [doc["page_content"] for doc in corpus]
+    queries = sample_queries(corpus, args.queries)
+    k = min(args.k, len(texts))
+
+    report = {"corpus_size": len(texts), "queries": len(queries), "k": k, "backends": {}}
+    baseline = None
+    # fp32 first: it is the reference for the recall comparison.
+    for backend in sorted(args.backends, key=lambda name: name != "torch"):
+        try:
+            result, doc_vectors, query_vectors = run_backend(backend, texts, queries, args.batch_size, args.repeats)
+        except Exception as e:
+            report["backends"][backend] = {"error": str(e)}
+            continue
+        hits = top_k(doc_vectors, query_vectors, k)
+        if backend == "torch":
+            baseline = hits
+        if baseline is not None:
+            # Fraction of the fp32 top-k each backend still returns.
+            overlap = [len(a & b) / k for a, b in zip(hits, baseline)]
+            result["recall_vs_fp32"] = sum(overlap) / len(overlap)
+            result["recall_delta"] = result["recall_vs_fp32"] - 1.0
+        report["backends"][backend] = result
+
+    write_report(report, args.output)
+
+if __name__ == "__main__":
+    main()
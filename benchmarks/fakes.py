@@ -0,0 +1,68 @@
+import hashlib
+import re
+import time
+from types import SimpleNamespace
+import numpy as np
+
+# Local stand-ins for the external services, for benchmarks only.
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+class HashingEmbedder:
+    # Deterministic bag-of-words hashing embedder with the Embedder interface
+    # (encode / embed_query / embed_documents). No model download; similar
+    # texts still get similar vectors, so retrieval behaves plausibly.
+    max_seq_length = 256
+    tokenizer = None
+
+    def __init__(self, dimension: int = 384, delay_ms: float = 0.0):
+        self.dimension = dimension
+        self.delay = delay_ms / 1000.0
+
+    def _vector(self, text: str):
+        vector = np.zeros(self.dimension, dtype="float32")
+        for token in _TOKEN_RE.findall(text.lower()):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dimension
+            vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def encode(self, texts, batch_size: int = 64, **kwargs):
+        if self.delay:
+            time.sleep(self.delay)  # One "model call" per batch
+        return np.array([self._vector(text) for text in texts], dtype="float32")
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str):
+        return self.encode([text])[0].tolist()
+
+class FakeLLMClient:
+    # Mimics the part of the Groq client prompt_llm.py uses:
+    # client.chat.completions.create(model, messages, temperature, stream).
+    # Answers are derived from the prompt, so they are deterministic; latency
+    # is spread over the streamed tokens.
+    def __init__(self, latency_ms: float = 300.0, tokens: int = 40):
+        self.latency = latency_ms / 1000.0
+        self.tokens = tokens
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def answer_tokens(self, messages) -> list:
+        digest = hashlib.sha1(messages[-1]["content"].encode("utf-8")).hexdigest()
+        return [f"{digest[i % len(digest)]}{i} " for i in range(self.tokens)]
+
+    def create(self, model=None, messages=None, temperature=None, stream=False):
+        tokens = self.answer_tokens(messages)
+        if stream:
+            return self._stream(tokens)
+        time.sleep(self.latency)
+        message = SimpleNamespace(content="".join(tokens))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+    def _stream(self, tokens):
+        delay = self.latency / max(1, len(tokens))
+        for token in tokens:
+            time.sleep(delay)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
@@ -0,0 +1,268 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# End-to-end load test of app.py with every external service replaced by a
+# local stand-in:
+#   - Pinecone -> LocalVectorIndex built from the corpus in a temp directory
+#   - Groq     -> FakeLLMClient (deterministic answers, configurable latency)
+#   - MongoDB  -> mongomock
+#   - model    -> the configured embedder, or --embedder hashing for a
+#                 download-free stand-in
+# The app is served by a threaded werkzeug server and driven over HTTP by
+# concurrent clients. Reports client-side latency percentiles, throughput and
+# the per-stage breakdown from each response's Server-Timing header (or the
+# "done" event's timings when streaming).
+#
+#
+#   pip install mongomock   # benchmark-only, not in requirements.txt
+#   python -m benchmarks.load_test --requests 500 --concurrency 16 --llm-latency-ms 300
+#
+# With --max-p95-ms / --min-rps it exits non-zero when the run misses the
+# target, so it can gate a deploy.
+
+def configure_environment(workdir: str, args):
+    # Must run before anything imports config.py.
+    paths = {
+        "VECTOR_BACKEND": "local",
+        "LOCAL_INDEX_DIR": os.path.join(workdir, "local_index"),
+        "LOCAL_INDEX_MODE": args.index_mode,
+        "DOCUMENT_STORE_PATH": os.path.join(workdir, "documents.jsonl"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical_index.db"),
+        "INDEX_VERSION_FILE": os.path.join(workdir, "index_version.txt"),
+        "PROCESSED_IDS_DB": os.path.join(workdir, "processed_ids.db"),
+        "METRICS_ENABLED": "true",
+        "PRELOAD_RETRIEVER": "false",
+        "RERANK_ENABLED": "true" if args.rerank else "false",
+        "HYBRID_RETRIEVAL": "false" if args.no_hybrid else "true",
+        "MONGODB_DB": "loadtest",
+        "MONGODB_COLLECTION": "chats",
+    }
+    if not args.answer_cache:
+        # Near-identical load-test queries would otherwise be served from the
+        # semantic answer cache and never reach the (fake) LLM.
+        paths["ANSWER_CACHE_THRESHOLD"] = "1.01"
+    os.environ.update(paths)
+    os.environ.setdefault("GROQ_API_KEY", "loadtest")  # the client is replaced before use
+
+def expand_corpus(corpus: list, size: int) -> list:
+    # Pads a small corpus (data.json has a handful of records) up to `size`
+    # distinct documents so the index has a realistic number of rows.
+    records = [{"page_content": doc["page_content"], "metadata": dict(doc["metadata"])} for doc in corpus]
+    variant = 0
+    while len(records) < size:
+        doc = corpus[variant % len(corpus)]
+        records.append({
+            "page_content": f"{doc['page_content']} (variant {variant})",
+            "metadata": dict(doc["metadata"], source=f"loadtest-{variant}"),
+        })
+        variant += 1
+    return records
+
+def build_app(args, workdir: str, source_store: str, source_data: str):
+    import mongomock
+    import pymongo
+    pymongo.MongoClient = mongomock.MongoClient  # before app.py is imported
+
+    from benchmarks.common import load_corpus
+    from benchmarks.fakes import FakeLLMClient, HashingEmbedder
+    from document_store import DocumentStore
+    from lexical_index import LexicalIndex
+    from processed_store import ProcessedStore
+    from vector_backend import LocalVectorIndex
+    import embedder
+    import index
+    import prompt_llm
+    import retriever
+
+    if args.embedder == "hashing":
+        model = HashingEmbedder(delay_ms=args.embed_latency_ms)
+        retriever.get_embedder = lambda: model
+    else:
+        model = embedder.get_embedder()
+
+    corpus = load_corpus(source_data, source_store)
+    documents = DocumentStore()
+    documents.sync_source("loadtest", expand_corpus(corpus, args.corpus_size))
+    # Straight to embed_and_upsert, as benchmarks.retrieval does: run_indexing
+    # also migrates and imports legacy files, and a benchmark must not touch
+    # anything outside workdir.
+    pending = []
+    for doc in documents.iter_documents():
+        metadata = dict(doc.get("metadata") or {}, text=doc["page_content"])
+        pending.append((doc["id"], doc["page_content"], metadata, doc["fingerprint"]))
+    store = ProcessedStore(os.path.join(workdir, "processed_ids.db"))
+    lexical = LexicalIndex(os.path.join(workdir, "lexical_index.db"))
+    try:
+        index.embed_and_upsert(LocalVectorIndex(), model, pending, store, lexical)
+        lexical.flush()
+    finally:
+        store.close()
+
+    prompt_llm.client = FakeLLMClient(args.llm_latency_ms, args.llm_tokens)
+
+    import app as app_module
+    app_module.retriever_service.warm_up()
+    return app_module, corpus
+
+def parse_server_timing(header: str) -> dict:
+    stages = {}
+    for part in (header or "").split(","):
+        name, _, duration = part.strip().partition(";dur=")
+        if name and duration:
+            stages[name] = float(duration)
+    return stages
+
+def make_queries(corpus: list, count: int, distinct: int) -> list:
+    # Opening words of corpus documents; unless --distinct-queries is set,
+    # every request gets its own text so the caches don't hide the pipeline.
+    bases = [" ".join(doc["page_content"].split()[:10]) for doc in corpus]
+    if distinct:
+        return [bases[i % len(bases)] + f" ({i % distinct})" for i in range(count)]
+    return [bases[i % len(bases)] + f" ({i})" for i in range(count)]
+
+class Client:
+    def __init__(self, base_url: str, stream: bool):
+        import requests
+        self.base_url = base_url
+        self.stream = stream
+        self.local = threading.local()
+        self.requests = requests
+
+    def session(self):
+        if not hasattr(self.local, "session"):
+            self.local.session = self.requests.Session()
+        return self.local.session
+
+    def send(self, query: str) -> dict:
+        started = time.perf_counter()
+        try:
+            return self._send(query, started)
+        except self.requests.RequestException:
+            return {"status": 0, "latency": time.perf_counter() - started, "stages": {}}
+
+    def _send(self, query: str, started: float) -> dict:
+        if not self.stream:
+            res = self.session().post(f"{self.base_url}/query", json={"query": query}, timeout=120)
+            return {
+                "status": res.status_code,
+                "latency": time.perf_counter() - started,
+                "stages": parse_server_timing(res.headers.get("Server-Timing")),
+            }
+        first_token, stages = None, {}
+        with self.session().post(f"{self.base_url}/query/stream", json={"query": query}, stream=True, timeout=120) as res:
+            event = None
+            for line in res.iter_lines(decode_unicode=True):
+                if line.startswith("event: "):
+                    event = line[7:]
+                elif line.startswith("data: "):
+                    if event is None and first_token is None:
+                        first_token = time.perf_counter() - started
+                    elif event == "done":
+                        stages = json.loads(line[6:]).get("timings", {})
+                elif not line:
+                    event = None
+            status = res.status_code
+        return {"status": status, "latency": time.perf_counter() - started, "first_token": first_token, "stages": stages}
+
+def summarize(results: list, elapsed: float) -> dict:
+    from benchmarks.common import latency_summary
+    ok = [r for r in results if r["status"] == 200]
+    stage_names = sorted({name for r in ok for name in r["stages"]})
+    summary = {
+        "requests": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_seconds": elapsed,
+        "throughput_rps": len(ok) / elapsed if elapsed else 0.0,
+        "latency": latency_summary([r["latency"] for r in ok]),
+        # Server-side stage durations arrive in milliseconds.
+        "stages": {
+            name: latency_summary([r["stages"][name] / 1000 for r in ok if name in r["stages"]])
+            for name in stage_names
+        },
+    }
+    first_tokens = [r["first_token"] for r in ok if r.get("first_token") is not None]
+    if first_tokens:
+        summary["time_to_first_token"] = latency_summary(first_tokens)
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test app.py against local stand-ins.")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--stream", action="store_true", help="Drive /query/stream instead of /query")
+    parser.add_argument("--distinct-queries", type=int, default=0,
+                        help="Cycle through this many query texts (0 = every request unique)")
+    parser.add_argument("--corpus-size", type=int, default=1000)
+    parser.add_argument("--data", default=None, help="JSON list of records (default: document store, else data.json)")
+    parser.add_argument("--embedder", choices=("configured", "hashing"), default="configured")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Per-batch delay for --embedder hashing")
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens", type=int, default=40)
+    parser.add_argument("--index-mode", choices=("exact", "ivf"), default="exact")
+    parser.add_argument("--rerank", action="store_true")
+    parser.add_argument("--answer-cache", action="store_true", help="Leave the semantic answer cache on")
+    parser.add_argument("--no-hybrid", action="store_true")
+    parser.add_argument("--max-p95-ms", type=float, default=None)
+    parser.add_argument("--min-rps", type=float, default=None)
+    parser.add_argument("--workdir", default=None, help="Scratch directory (default: a new temp dir)")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    # The corpus comes from the real store; everything written goes to workdir.
+    source_store = os.path.abspath(os.getenv("DOCUMENT_STORE_PATH", "documents.jsonl"))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-loadtest-")
+    configure_environment(workdir, args)
+
+    from werkzeug.serving import make_server
+    from benchmarks.common import write_report
+
+    app_module, corpus = build_app(args, workdir, source_store, args.data)
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = Client(f"http://127.0.0.1:{server.server_port}", args.stream)
+
+    try:
+        for query in make_queries(corpus, args.warmup, 0):
+            client.send("warmup " + query)
+
+        queries = make_queries(corpus, args.requests, args.distinct_queries)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(client.send, queries))
+        elapsed = time.perf_counter() - started
+    finally:
+        server.shutdown()
+        if app_module.chat_writer is not None:
+            app_module.chat_writer.close()
+
+    report = {
+        "config": {
+            key: value for key, value in vars(args).items() if key not in ("output", "workdir", "max_p95_ms", "min_rps")
+        },
+        "workdir": workdir,
+        "endpoint": "/query/stream" if args.stream else "/query",
+        "results": summarize(results, elapsed),
+        "query_cache": app_module.retriever_service.health()["query_cache"],
+        "answer_cache": app_module.answer_cache.stats(),
+        "chat_sessions_written": app_module.chat_collection.count_documents({}),
+    }
+    write_report(report, args.output)
+
+    results = report["results"]
+    failed = results["errors"] > 0
+    if args.max_p95_ms is not None and results["latency"]["p95_ms"] > args.max_p95_ms:
+        failed = True
+    if args.min_rps is not None and results["throughput_rps"] < args.min_rps:
+        failed = True
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
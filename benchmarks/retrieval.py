@@ -0,0 +1,227 @@
+import argparse
+import contextlib
+import json
+import os
+import re
+import sys
+import tempfile
+import time
+from benchmarks.common import load_corpus, latency_summary, write_report
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, HYBRID_RETRIEVAL, RERANK_ENABLED
+from document_store import record_fingerprint
+from ioc_index import extract_iocs
+from embedder import EMBEDDING_BACKENDS, Embedder
+from lexical_index import LexicalIndex
+from processed_store import ProcessedStore
+from vector_backend import LocalVectorIndex, get_vector_index
+from retriever import RetrieverService, document_ids
+from metrics import start_request
+import index as indexing
+
+# Retrieval quality and latency over a golden query -> relevant-record set.
+# The golden set is generated from the corpus (document store, else data.json)
+# or loaded from a file, and every combination of k, vector backend, embedding
+# model/runtime, hybrid and reranking is run through RetrieverService.retrieve
+# so the numbers include the production code path. Local backends get a
+# scratch index per embedding model; "pinecone" queries the live index, which
+# only makes sense for the model it was built with.
+#
+#   python -m benchmarks.retrieval --k 1 5 10 --backends local-exact local-ivf \
+#       --rerank off on --write-golden bench/golden.json --output bench/retrieval.json
+#
+# Golden entries: {"query", "relevant": [record ids], "kind": "ioc" | "content"}.
+
+BACKENDS = ("local-exact", "local-ivf", "pinecone")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+
+def content_query(text: str, words: int = 12) -> str:
+    # A question-sized slice from the middle of the record's first sentence,
+    # so the query isn't just the record's opening verbatim.
+    sentence = SENTENCE_RE.split(text.strip(), maxsplit=1)[0].split()
+    start = max(0, min(len(sentence) - words, len(sentence) // 4))
+    return " ".join(sentence[start:start + words])
+
+def build_golden(corpus, max_ioc_queries: int = 200, max_content_queries: int = 200) -> list:
+    # IOC queries: every record mentioning the indicator is relevant.
+    # Content queries: only the record the text was taken from is relevant.
+    by_ioc = {}
+    for doc in corpus:
+        for ioc in extract_iocs(doc["page_content"]):
+            by_ioc.setdefault(ioc, []).append(doc["id"])
+    golden = [
+        {"query": f"What is known about {ioc}?", "relevant": sorted(set(ids)), "kind": "ioc"}
+        for ioc, ids in sorted(by_ioc.items())
+    ][:max_ioc_queries]
+
+    step = max(1, len(corpus) // max_content_queries)
+    for doc in corpus[::step][:max_content_queries]:
+        title = (doc.get("metadata") or {}).get("title")
+        query = title or content_query(doc["page_content"])
+        if len(query.split()) >= 3:
+            golden.append({"query": query, "relevant": [doc["id"]], "kind": "content"})
+    return golden
+
+def load_golden(path: str) -> list:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_embedder(model_name: str, backend: str):
+    if model_name == "hashing":
+        from benchmarks.fakes import HashingEmbedder
+        return HashingEmbedder()
+    return Embedder(model_name=model_name, backend=backend)
+
+def build_local_index(corpus, model, path: str) -> float:
+    # Same chunking/encode/upsert path as index.py, into a scratch directory.
+    # Record ids are kept as-is so they line up with the golden set.
+    os.makedirs(path, exist_ok=True)
+    pending = []
+    for doc in corpus:
+        metadata = dict(doc.get("metadata") or {})
+        metadata["text"] = doc["page_content"]
+        pending.append((doc["id"], doc["page_content"], metadata, record_fingerprint(doc)))
+    # Built in ivf mode so the clustering is persisted for the local-ivf runs.
+    vectors = LocalVectorIndex(path, mode="ivf")
+    store = ProcessedStore(os.path.join(path, "processed_ids.db"))
+    lexical = LexicalIndex(os.path.join(path, "lexical_index.db"))
+    started = time.perf_counter()
+    try:
+        # Indexing progress goes to stderr; stdout carries the JSON report.
+        with contextlib.redirect_stdout(sys.stderr):
+            indexing.embed_and_upsert(vectors, model, pending, store, lexical)
+        lexical.flush()
+    finally:
+        store.close()
+    return time.perf_counter() - started
+
+def open_backend(backend: str, path: str):
+    if backend == "pinecone":
+        return get_vector_index("pinecone")
+    return LocalVectorIndex(path, mode=backend.split("-", 1)[1])
+
+def score(ranked: list, relevant: list, k: int) -> tuple:
+    # (recall@k, hit@k, reciprocal rank of the first relevant hit in the top k)
+    top = ranked[:k]
+    relevant = set(relevant)
+    found = relevant.intersection(top)
+    reciprocal = next((1.0 / rank for rank, doc_id in enumerate(top, 1) if doc_id in relevant), 0.0)
+    return len(found) / len(relevant), 1.0 if found else 0.0, reciprocal
+
+def aggregate(rows: list) -> dict:
+    n = len(rows) or 1
+    return {
+        "queries": len(rows),
+        "recall": sum(row[0] for row in rows) / n,
+        "hit_rate": sum(row[1] for row in rows) / n,
+        "mrr": sum(row[2] for row in rows) / n,
+    }
+
+def run_setting(service, golden, k: int, warmup: int) -> dict:
+    for entry in golden[:warmup]:
+        service.retrieve(entry["query"])
+    latencies, stages, by_kind, fallbacks = [], {}, {}, 0
+    for entry in golden:
+        # Every query should measure a full retrieval, not a cache hit.
+        service.clear_caches()
+        timings = start_request()
+        started = time.perf_counter()
+        docs, info = service.retrieve(entry["query"])
+        latencies.append(time.perf_counter() - started)
+        for stage, ms in timings.items():
+            stages.setdefault(stage, []).append(ms / 1000)
+        fallbacks += info.get("reranked") is False
+        by_kind.setdefault(entry["kind"], []).append(score(document_ids(docs), entry["relevant"], k))
+    all_rows = [row for rows in by_kind.values() for row in rows]
+    result = aggregate(all_rows)
+    result["by_kind"] = {kind: aggregate(rows) for kind, rows in sorted(by_kind.items())}
+    result["latency"] = latency_summary(latencies)
+    result["stages"] = {stage: latency_summary(values) for stage, values in sorted(stages.items())}
+    if service.reranker is not None:
+        result["rerank_fallbacks"] = fallbacks
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k / MRR / latency of retriever settings over golden queries.")
+    parser.add_argument("--data", default=None, help="JSON list of records (default: document store, else data.json)")
+    parser.add_argument("--golden", default=None, help="Golden set to load (default: generate from the corpus)")
+    parser.add_argument("--write-golden", default=None, help="Save the generated golden set here")
+    parser.add_argument("--max-queries", type=int, default=200, help="Per kind, when generating")
+    parser.add_argument("--k", type=int, nargs="+", default=[5])
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=["local-exact", "local-ivf"])
+    parser.add_argument("--models", nargs="+", default=[EMBEDDING_MODEL],
+                        help='Embedding models; "hashing" is a download-free baseline')
+    parser.add_argument("--embedding-backends", nargs="+", choices=EMBEDDING_BACKENDS, default=[EMBEDDING_BACKEND])
+    parser.add_argument("--hybrid", nargs="+", choices=("off", "on"), default=["on" if HYBRID_RETRIEVAL else "off"])
+    parser.add_argument("--rerank", nargs="+", choices=("off", "on"), default=["on" if RERANK_ENABLED else "off"])
+    parser.add_argument("--rerank-budget-ms", type=float, default=None)
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--workdir", default=None, help="Scratch directory for local indexes (default: a new temp dir)")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.data)
+    golden = load_golden(args.golden) if args.golden else build_golden(corpus, args.max_queries, args.max_queries)
+    if args.write_golden:
+        os.makedirs(os.path.dirname(args.write_golden) or ".", exist_ok=True)
+        with open(args.write_golden, "w", encoding="utf-8") as f:
+            json.dump(golden, f, indent=2)
+    workdir = args.workdir or tempfile.mkdtemp(prefix="rag-retrieval-")
+
+    report = {
+        "corpus_size": len(corpus),
+        "golden": {
+            "source": args.golden or "generated",
+            "queries": len(golden),
+            "by_kind": {kind: sum(entry["kind"] == kind for entry in golden) for kind in sorted({e["kind"] for e in golden})},
+        },
+        "embeddings": [],
+        "settings": [],
+    }
+    for model_name in args.models:
+        for embedding_backend in (["-"] if model_name == "hashing" else args.embedding_backends):
+            embedding = {"model": model_name, "embedding_backend": embedding_backend}
+            path = os.path.join(workdir, re.sub(r"[^A-Za-z0-9_.-]+", "_", f"{model_name}-{embedding_backend}"))
+            try:
+                started = time.perf_counter()
+                model = load_embedder(model_name, embedding_backend)
+                embedding["load_seconds"] = time.perf_counter() - started
+                if any(backend.startswith("local") for backend in args.backends):
+                    embedding["index_seconds"] = build_local_index(corpus, model, path)
+            except Exception as e:
+                embedding["error"] = str(e)
+                report["embeddings"].append(embedding)
+                continue
+            report["embeddings"].append(embedding)
+
+            for backend in args.backends:
+                for hybrid in args.hybrid:
+                    for rerank in args.rerank:
+                        for k in args.k:
+                            setting = dict(embedding, backend=backend, hybrid=hybrid, rerank=rerank, k=k)
+                            setting.pop("load_seconds", None)
+                            setting.pop("index_seconds", None)
+                            try:
+                                service = RetrieverService(
+                                    k=k, backend=backend, hybrid=hybrid == "on", rerank=rerank == "on"
+                                )
+                                # Inject this run's model and index instead of warm_up()'s configured ones.
+                                service.embeddings = model
+                                service.index = open_backend(backend, path)
+                                if service.hybrid:
+                                    # The live index pairs with the live lexical index.
+                                    service.lexical = LexicalIndex() if backend == "pinecone" else \
+                                        LexicalIndex(os.path.join(path, "lexical_index.db"))
+                                if service.reranker is not None:
+                                    if args.rerank_budget_ms is not None:
+                                        service.reranker.budget_ms = args.rerank_budget_ms
+                                    service.reranker.load()
+                                setting.update(run_setting(service, golden, k, args.warmup))
+                            except Exception as e:
+                                setting["error"] = str(e)
+                            report["settings"].append(setting)
+
+    report["workdir"] = workdir
+    write_report(report, args.output)
+
+if __name__ == "__main__":
+    main()
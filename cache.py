@@ -0,0 +1,172 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(text: str) -> str:
+    # Queries that differ only in case/spacing share a cache entry.
+    return _WHITESPACE.sub(" ", text).strip().lower()
+
+class TTLCache:
+    # Thread-safe LRU cache whose entries also expire after `ttl` seconds.
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, expires_at = item
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+def _unit(vector):
+    norm = sum(x * x for x in vector) ** 0.5
+    if not norm:
+        return list(vector)
+    return [x / norm for x in vector]
+
+class SemanticAnswerCache:
+    # Caches LLM answers per bucket (e.g. retrieved-docs hash + model + temperature)
+    # and serves them to any later query whose embedding is at least
+    # `threshold` cosine-similar to a cached one in the same bucket.
+    def __init__(self, maxsize: int = 512, ttl: float = 1800.0, threshold: float = 0.95):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # entry id -> (bucket, unit vector, answer, expires_at)
+        self._buckets = {}             # bucket -> set of entry ids
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _remove(self, entry_id):
+        bucket = self._entries.pop(entry_id)[0]
+        ids = self._buckets.get(bucket)
+        if ids is not None:
+            ids.discard(entry_id)
+            if not ids:
+                del self._buckets[bucket]
+
+    def lookup(self, vector, bucket):
+        query = _unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            best_id, best_score = None, self.threshold
+            for entry_id in list(self._buckets.get(bucket, ())):
+                _, cached, _, expires_at = self._entries[entry_id]
+                if expires_at <= now:
+                    self._remove(entry_id)
+                    continue
+                score = sum(a * b for a, b in zip(query, cached))
+                if score >= best_score:
+                    best_id, best_score = entry_id, score
+            if best_id is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            return self._entries[best_id][2]
+
+    def store(self, vector, bucket, answer):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (bucket, _unit(vector), answer, time.monotonic() + self.ttl)
+            self._buckets.setdefault(bucket, set()).add(entry_id)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+def bump_index_version(path: str):
+    # Called by the indexer after writing vectors; readers compare the marker
+    # to decide whether their cached retrievals/answers are stale.
+    with open(path, "w") as f:
+        f.write(str(time.time()))
+
+class IndexVersionWatcher:
+    # Cheap per-request check (one stat call) for index changes.
+    def __init__(self, path: str):
+        self.path = path
+        self._seen = self._read()
+
+    def _read(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def changed(self) -> bool:
+        current = self._read()
+        if current != self._seen:
+            self._seen = current
+            return True
+        return False
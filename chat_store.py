@@ -0,0 +1,545 @@
+import asyncio
+import atexit
+import base64
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError, PyMongoError
+from metrics import timed
+from config import (
+    CHAT_FLUSH_BATCH_SIZE, CHAT_FLUSH_INTERVAL_MS, CHAT_QUEUE_MAX, CHAT_FLUSH_RETRIES,
+    CHATS_PAGE_SIZE, CHATS_MAX_PAGE_SIZE, CHAT_MESSAGES_LIMIT,
+    CHAT_RECENT_MESSAGES, CHAT_BUCKET_SIZE, MONGODB_MESSAGES_COLLECTION,
+)
+
+# Chat persistence shared by the WSGI (pymongo) and ASGI (motor) apps.
+# Both build the same documents; only the driver call differs.
+#
+# A session document holds the title, timestamp, message_count and only the
+# latest CHAT_RECENT_MESSAGES messages. Every message is also stored in a
+# bucket document {session_id, bucket, messages: {"<slot>": message}} in the
+# messages collection, where message number n lives in bucket
+# n // CHAT_BUCKET_SIZE at slot n % CHAT_BUCKET_SIZE. Writing a turn touches
+# one session document and at most two buckets; reading a window touches the
+# session document plus the buckets the window spans, whatever the length of
+# the session.
+
+def chat_title(user_query: str) -> str:
+    # Create a friendly title from the first query.
+    return user_query if len(user_query) <= 30 else user_query[:30].strip() + "..."
+
+def turn_messages(user_query: str, answer: str) -> list:
+    return [
+        {"role": "user", "content": user_query},
+        {"role": "assistant", "content": answer}
+    ]
+
+def messages_collection(collection):
+    # Bucket collection next to the sessions collection (works for pymongo and motor).
+    return collection.database[MONGODB_MESSAGES_COLLECTION or f"{collection.name}_messages"]
+
+def session_turn_update(first_query: str, messages: list) -> dict:
+    # Upserts the session: the title is set on the first turn, the recent
+    # window is capped, and message_count tells where the new messages go.
+    return {
+        "$setOnInsert": {"title": chat_title(first_query)},
+        "$push": {"messages": {"$each": messages, "$slice": -CHAT_RECENT_MESSAGES}},
+        "$inc": {"message_count": len(messages)},
+        "$set": {"timestamp": datetime.utcnow()},
+    }
+
+# Turn updates only match sessions already in the bucketed layout. A legacy
+# session (inline history, no message_count) fails the upsert on the unique
+# session_id index instead, and is migrated before the update is retried.
+MIGRATED_SESSION = {"$or": [{"message_count": {"$exists": True}}, {"messages": {"$exists": False}}]}
+
+def bucket_operations(session_id: str, first_number: int, messages: list) -> list:
+    # One upsert per bucket touched. Slots are set by message number, so
+    # replaying the same operations is harmless.
+    slots = OrderedDict()
+    for number, message in enumerate(messages, start=first_number):
+        bucket, slot = divmod(number, CHAT_BUCKET_SIZE)
+        slots.setdefault(bucket, {})[f"messages.{slot}"] = message
+    return [
+        UpdateOne({"session_id": session_id, "bucket": bucket}, {"$set": fields}, upsert=True)
+        for bucket, fields in slots.items()
+    ]
+
+class TurnBatch:
+    # Chat turns grouped per session: one session upsert per session, then a
+    # single bulk write of bucket updates. apply() can be called again after a
+    # failure; sessions already updated are not incremented twice. A legacy
+    # session is migrated the first time it gets a turn.
+    def __init__(self, turns):
+        self.pending = OrderedDict()   # session_id -> (first query, messages)
+        for chat_id, user_query, answer in turns:
+            first_query, messages = self.pending.setdefault(chat_id, (user_query, []))
+            messages.extend(turn_messages(user_query, answer))
+        self.bucket_ops = []
+        self.turns = len(turns)
+
+    def _session_updated(self, chat_id, session):
+        _, messages = self.pending.pop(chat_id)
+        first_number = session["message_count"] - len(messages)
+        self.bucket_ops.extend(bucket_operations(chat_id, first_number, messages))
+
+    def apply(self, collection):
+        while self.pending:
+            chat_id, (first_query, messages) = next(iter(self.pending.items()))
+            try:
+                session = collection.find_one_and_update(
+                    {"session_id": chat_id, **MIGRATED_SESSION}, session_turn_update(first_query, messages),
+                    projection={"_id": 0, "message_count": 1}, upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                legacy = collection.find_one({"session_id": chat_id}, LEGACY_PROJECTION)
+                if legacy is None:
+                    raise
+                migrate_session(collection, legacy)
+                continue
+            self._session_updated(chat_id, session)
+        if self.bucket_ops:
+            messages_collection(collection).bulk_write(self.bucket_ops, ordered=False)
+            self.bucket_ops = []
+
+    async def aapply(self, collection):
+        while self.pending:
+            chat_id, (first_query, messages) = next(iter(self.pending.items()))
+            try:
+                session = await collection.find_one_and_update(
+                    {"session_id": chat_id, **MIGRATED_SESSION}, session_turn_update(first_query, messages),
+                    projection={"_id": 0, "message_count": 1}, upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            except DuplicateKeyError:
+                legacy = await collection.find_one({"session_id": chat_id}, LEGACY_PROJECTION)
+                if legacy is None:
+                    raise
+                await amigrate_session(collection, legacy)
+                continue
+            self._session_updated(chat_id, session)
+        if self.bucket_ops:
+            await messages_collection(collection).bulk_write(self.bucket_ops, ordered=False)
+            self.bucket_ops = []
+
+def save_chat_turn(collection, chat_id, user_query, answer):
+    with timed("persist"):
+        TurnBatch([(chat_id, user_query, answer)]).apply(collection)
+
+async def asave_chat_turn(collection, chat_id, user_query, answer):
+    with timed("persist"):
+        await TurnBatch([(chat_id, user_query, answer)]).aapply(collection)
+
+# -------------------- Indexes and migration --------------------
+CHAT_INDEXES = [
+    ([("session_id", ASCENDING)], {"unique": True, "name": "session_id_unique"}),
+    ([("timestamp", DESCENDING), ("session_id", DESCENDING)], {"name": "timestamp_session_id"}),
+]
+BUCKET_INDEXES = [
+    ([("session_id", ASCENDING), ("bucket", ASCENDING)], {"unique": True, "name": "session_id_bucket"}),
+]
+
+def ensure_indexes(collection):
+    for target, indexes in ((collection, CHAT_INDEXES), (messages_collection(collection), BUCKET_INDEXES)):
+        for keys, options in indexes:
+            try:
+                target.create_index(keys, **options)
+            except PyMongoError as e:
+                print(f"Could not create chat index {options['name']}: {e}")
+
+async def aensure_indexes(collection):
+    for target, indexes in ((collection, CHAT_INDEXES), (messages_collection(collection), BUCKET_INDEXES)):
+        for keys, options in indexes:
+            try:
+                await target.create_index(keys, **options)
+            except PyMongoError as e:
+                print(f"Could not create chat index {options['name']}: {e}")
+
+LEGACY_PROJECTION = {"session_id": 1, "messages": 1, "message_count": 1}
+
+def _legacy_migration(session):
+    # (bucket operations, trim update) for one legacy session document.
+    messages = session.get("messages") or []
+    ops = bucket_operations(session["session_id"], 0, messages) if messages else []
+    trim = {"$set": {"message_count": len(messages), "messages": messages[-CHAT_RECENT_MESSAGES:]}}
+    return ops, trim
+
+def migrate_session(collection, session) -> bool:
+    # Copies one legacy session's history into buckets, then trims the inline
+    # list. The bucket writes are idempotent and the trim only applies while
+    # message_count is still missing, so concurrent runs are safe.
+    if "message_count" in session:
+        return False
+    ops, trim = _legacy_migration(session)
+    if ops:
+        messages_collection(collection).bulk_write(ops, ordered=False)
+    result = collection.update_one({"_id": session["_id"], "message_count": {"$exists": False}}, trim)
+    return result.modified_count > 0
+
+async def amigrate_session(collection, session) -> bool:
+    if "message_count" in session:
+        return False
+    ops, trim = _legacy_migration(session)
+    if ops:
+        await messages_collection(collection).bulk_write(ops, ordered=False)
+    result = await collection.update_one({"_id": session["_id"], "message_count": {"$exists": False}}, trim)
+    return result.modified_count > 0
+
+def migrate_legacy_sessions(collection) -> int:
+    # Sessions written before bucketing keep every message inline and have no
+    # message_count. Sessions that get a new turn first are migrated by
+    # TurnBatch; this moves the rest at startup.
+    migrated = 0
+    for session in collection.find({"message_count": {"$exists": False}}, LEGACY_PROJECTION):
+        migrated += migrate_session(collection, session)
+    if migrated:
+        print(f"Moved the history of {migrated} chat sessions into message buckets.")
+    return migrated
+
+def prepare_chat_collection(collection):
+    # Startup: indexes first (the migration's bucket upserts rely on them).
+    ensure_indexes(collection)
+    try:
+        migrate_legacy_sessions(collection)
+    except PyMongoError as e:
+        print(f"Chat session migration failed: {e}")
+
+# -------------------- Reads --------------------
+# /chats pages through sessions newest first with a keyset cursor on
+# (timestamp, session_id), so each page is an index range scan no matter how
+# much history exists. Only titles and timestamps are returned; messages come
+# from /chats/<session_id>, sliced.
+
+SUMMARY_PROJECTION = {"_id": 0, "session_id": 1, "title": 1, "timestamp": 1}
+
+def encode_cursor(chat: dict) -> str:
+    position = {"t": chat["timestamp"].isoformat(), "s": chat["session_id"]}
+    return base64.urlsafe_b64encode(json.dumps(position).encode("utf-8")).decode("ascii")
+
+def page_filter(cursor: str = None) -> dict:
+    # Sessions strictly after the cursor in (timestamp desc, session_id desc)
+    # order. Raises ValueError for a malformed cursor.
+    if not cursor:
+        return {}
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        timestamp, session_id = datetime.fromisoformat(position["t"]), position["s"]
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+    return {"$or": [
+        {"timestamp": {"$lt": timestamp}},
+        {"timestamp": timestamp, "session_id": {"$lt": session_id}},
+    ]}
+
+def page_limit(value, default: int = CHATS_PAGE_SIZE) -> int:
+    try:
+        limit = int(value) if value is not None else default
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, CHATS_MAX_PAGE_SIZE))
+
+def chat_page(chats: list, limit: int) -> dict:
+    # chats was fetched with limit + 1 rows to tell whether more exist.
+    has_more = len(chats) > limit
+    chats = chats[:limit]
+    return {"chats": chats, "next_cursor": encode_cursor(chats[-1]) if has_more and chats else None}
+
+def list_chats(collection, cursor: str = None, limit: int = CHATS_PAGE_SIZE) -> dict:
+    rows = (
+        collection.find(page_filter(cursor), SUMMARY_PROJECTION)
+        .sort([("timestamp", DESCENDING), ("session_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    return chat_page(list(rows), limit)
+
+async def alist_chats(collection, cursor: str = None, limit: int = CHATS_PAGE_SIZE) -> dict:
+    rows = (
+        collection.find(page_filter(cursor), SUMMARY_PROJECTION)
+        .sort([("timestamp", DESCENDING), ("session_id", DESCENDING)])
+        .limit(limit + 1)
+    )
+    return chat_page(await rows.to_list(length=limit + 1), limit)
+
+MAX_MESSAGES_PER_REQUEST = 500
+
+def message_window(offset=None, limit=None) -> tuple:
+    # (offset, limit) from query-string values; raises ValueError.
+    try:
+        offset = int(offset) if offset is not None else -CHAT_MESSAGES_LIMIT
+        limit = int(limit) if limit is not None else CHAT_MESSAGES_LIMIT
+    except ValueError:
+        raise ValueError("offset and limit must be integers")
+    return offset, max(1, min(limit, MAX_MESSAGES_PER_REQUEST))
+
+def _window(chat: dict, offset: int, limit: int) -> tuple:
+    # Resolves the request to [start, end) message numbers and reports whether
+    # the session's recent window already covers it.
+    recent = chat.pop("messages", None) or []
+    # Unmigrated sessions have no message_count and keep everything inline.
+    count = chat.setdefault("message_count", len(recent))
+    start = max(0, count + offset) if offset < 0 else min(offset, count)
+    end = min(count, start + limit)
+    recent_start = count - len(recent)
+    if start >= recent_start:
+        return start, end, recent[start - recent_start:end - recent_start]
+    return start, end, None
+
+def bucket_query(session_id: str, start: int, end: int) -> dict:
+    return {
+        "session_id": session_id,
+        "bucket": {"$gte": start // CHAT_BUCKET_SIZE, "$lte": max(start, end - 1) // CHAT_BUCKET_SIZE},
+    }
+
+def messages_from_buckets(buckets, start: int, end: int) -> list:
+    messages = []
+    for bucket in sorted(buckets, key=lambda doc: doc["bucket"]):
+        base = bucket["bucket"] * CHAT_BUCKET_SIZE
+        for slot, message in sorted(bucket.get("messages", {}).items(), key=lambda item: int(item[0])):
+            if start <= base + int(slot) < end:
+                messages.append(message)
+    return messages
+
+def get_chat(collection, session_id: str, offset: int = -CHAT_MESSAGES_LIMIT, limit: int = CHAT_MESSAGES_LIMIT):
+    chat = collection.find_one({"session_id": session_id}, {"_id": 0})
+    if chat is None:
+        return None
+    start, end, messages = _window(chat, offset, limit)
+    if messages is None:
+        buckets = messages_collection(collection).find(bucket_query(session_id, start, end), {"_id": 0})
+        messages = messages_from_buckets(buckets, start, end)
+    chat.update({"offset": start, "messages": messages})
+    return chat
+
+async def aget_chat(collection, session_id: str, offset: int = -CHAT_MESSAGES_LIMIT, limit: int = CHAT_MESSAGES_LIMIT):
+    chat = await collection.find_one({"session_id": session_id}, {"_id": 0})
+    if chat is None:
+        return None
+    start, end, messages = _window(chat, offset, limit)
+    if messages is None:
+        cursor = messages_collection(collection).find(bucket_query(session_id, start, end), {"_id": 0})
+        messages = messages_from_buckets(await cursor.to_list(length=None), start, end)
+    chat.update({"offset": start, "messages": messages})
+    return chat
+
+# -------------------- Write-behind persistence --------------------
+# Requests enqueue their turn and return; a background writer applies queued
+# turns as one TurnBatch per flush (a session upsert per session touched,
+# then one bulk write of bucket updates). Queues are drained on shutdown:
+# atexit and gunicorn's worker_exit for the thread writer, Quart's
+# after_serving for the asyncio one.
+
+_writers = []
+
+class ChatWriter:
+    # Thread-based writer for pymongo (app.py).
+    def __init__(self, collection, batch_size: int = CHAT_FLUSH_BATCH_SIZE,
+                 interval_ms: float = CHAT_FLUSH_INTERVAL_MS, maxsize: int = CHAT_QUEUE_MAX):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.queue = queue.Queue(maxsize)
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self._pending = 0   # taken off the queue but not yet written
+        self._worker_pid = None
+        self._closed = False
+        self._lock = threading.Lock()
+        _writers.append(self)
+
+    def _ensure_worker(self):
+        if self._worker_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                # Started lazily so a forked worker gets its own thread.
+                self.queue = queue.Queue(self.queue.maxsize)
+            elif self._thread.is_alive():
+                return
+            else:
+                # Should never happen (_run survives any error), but a dead
+                # writer would leave enqueue() blocking once the queue fills.
+                print("Chat writer thread died; restarting it.")
+            self._thread = threading.Thread(target=self._run, name="chat-writer", daemon=True)
+            self._thread.start()
+            self._worker_pid = os.getpid()
+
+    def enqueue(self, chat_id, user_query, answer):
+        if self._closed:
+            save_chat_turn(self.collection, chat_id, user_query, answer)
+            return
+        self._ensure_worker()
+        with timed("persist"):
+            # Blocks only if Mongo has fallen CHAT_QUEUE_MAX turns behind.
+            self.queue.put((chat_id, user_query, answer))
+
+    def _run(self):
+        while True:
+            turn = self.queue.get()
+            if turn is None:
+                return
+            batch = [turn]
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    turn = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if turn is None:
+                    stop = True
+                    break
+                batch.append(turn)
+            self._pending = len(batch)
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Never let one bad batch stop the writer.
+                print(f"Dropping {len(batch)} chat turns: {e}")
+                self.dropped += len(batch)
+            self._pending = 0
+            if stop:
+                return
+
+    def _write(self, turns):
+        batch = TurnBatch(turns)
+        for attempt in range(CHAT_FLUSH_RETRIES + 1):
+            try:
+                with timed("persist_flush"):
+                    batch.apply(self.collection)
+                self.written += batch.turns
+                self.flushes += 1
+                return
+            except Exception as e:
+                # Only Mongo errors are worth retrying; anything else would fail again.
+                if attempt == CHAT_FLUSH_RETRIES or not isinstance(e, PyMongoError):
+                    print(f"Dropping {batch.turns} chat turns after {attempt + 1} attempts: {e}")
+                    self.dropped += batch.turns
+                    return
+                delay = 0.5 * 2 ** attempt
+                print(f"Chat flush failed ({e}); retrying in {delay}s...")
+                time.sleep(delay)
+
+    def depth(self) -> int:
+        return self.queue.qsize() + self._pending
+
+    def close(self, timeout: float = 10.0):
+        # Stop accepting turns, write everything queued, then stop the thread.
+        if self._closed:
+            return
+        self._closed = True
+        if self._worker_pid == os.getpid():
+            self.queue.put(None)
+            self._thread.join(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth(),
+            "written": self.written,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+        }
+
+class AsyncChatWriter:
+    # asyncio writer for motor (asgi.py); start() from before_serving,
+    # close() from after_serving.
+    def __init__(self, collection, batch_size: int = CHAT_FLUSH_BATCH_SIZE,
+                 interval_ms: float = CHAT_FLUSH_INTERVAL_MS, maxsize: int = CHAT_QUEUE_MAX):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000.0
+        self.queue = asyncio.Queue(maxsize)
+        self.written = 0
+        self.flushes = 0
+        self.dropped = 0
+        self._pending = 0
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        return self
+
+    async def enqueue(self, chat_id, user_query, answer):
+        if self._task is None or self._task.done():
+            await asave_chat_turn(self.collection, chat_id, user_query, answer)
+            return
+        with timed("persist"):
+            await self.queue.put((chat_id, user_query, answer))
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            turn = await self.queue.get()
+            if turn is None:
+                return
+            batch = [turn]
+            deadline = loop.time() + self.interval
+            stop = False
+            while len(batch) < self.batch_size:
+                remaining = deadline - loop.time()
+                try:
+                    turn = await asyncio.wait_for(self.queue.get(), remaining) if remaining > 0 else self.queue.get_nowait()
+                except (asyncio.TimeoutError, asyncio.QueueEmpty):
+                    break
+                if turn is None:
+                    stop = True
+                    break
+                batch.append(turn)
+            self._pending = len(batch)
+            try:
+                await self._write(batch)
+            except Exception as e:
+                print(f"Dropping {len(batch)} chat turns: {e}")
+                self.dropped += len(batch)
+            self._pending = 0
+            if stop:
+                return
+
+    async def _write(self, turns):
+        batch = TurnBatch(turns)
+        for attempt in range(CHAT_FLUSH_RETRIES + 1):
+            try:
+                with timed("persist_flush"):
+                    await batch.aapply(self.collection)
+                self.written += batch.turns
+                self.flushes += 1
+                return
+            except Exception as e:
+                if attempt == CHAT_FLUSH_RETRIES or not isinstance(e, PyMongoError):
+                    print(f"Dropping {batch.turns} chat turns after {attempt + 1} attempts: {e}")
+                    self.dropped += batch.turns
+                    return
+                delay = 0.5 * 2 ** attempt
+                print(f"Chat flush failed ({e}); retrying in {delay}s...")
+                await asyncio.sleep(delay)
+
+    def depth(self) -> int:
+        return self.queue.qsize() + self._pending
+
+    async def close(self):
+        if self._task is None or self._task.done():
+            return
+        await self.queue.put(None)
+        await self._task
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.depth(),
+            "written": self.written,
+            "flushes": self.flushes,
+            "dropped": self.dropped,
+        }
+
+def drain_chat_writers():
+    # Flush every thread writer in this process (atexit / gunicorn worker_exit).
+    for writer in list(_writers):
+        writer.close()
+
+atexit.register(drain_chat_writers)
@@ -0,0 +1,121 @@
+import re
+from config import CHUNK_MAX_TOKENS, CHUNK_OVERLAP_TOKENS
+
+# Splits long documents into overlapping token windows before embedding, and
+# stitches retrieved windows back into their parent document at query time.
+# Chunk 0 keeps the parent's ID, so short documents index exactly as before;
+# later windows are "<parent>#<n>".
+
+WORD_SPAN_RE = re.compile(r"\S+")
+
+# Metadata keys added to every chunk; dropped again on reassembly.
+CHUNK_FIELDS = ("parent_id", "chunk_index", "chunk_count", "chunk_start", "chunk_end")
+
+def chunk_id(parent_id: str, index: int) -> str:
+    return parent_id if index == 0 else f"{parent_id}#{index}"
+
+def chunk_ids(parent_id: str, count: int) -> list:
+    return [chunk_id(parent_id, i) for i in range(count)]
+
+class TextChunker:
+    # tokenizer: a Hugging Face fast tokenizer (SentenceTransformer.tokenizer).
+    # Without one, whitespace-separated words stand in for tokens.
+    def __init__(self, tokenizer=None, max_tokens: int = CHUNK_MAX_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS):
+        if overlap >= max_tokens:
+            raise ValueError("CHUNK_OVERLAP_TOKENS must be smaller than CHUNK_MAX_TOKENS")
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.overlap = overlap
+
+    @classmethod
+    def for_model(cls, model, max_tokens: int = CHUNK_MAX_TOKENS, overlap: int = CHUNK_OVERLAP_TOKENS):
+        # Leave room for the [CLS]/[SEP] tokens the model adds itself.
+        limit = getattr(model, "max_seq_length", None)
+        if limit:
+            max_tokens = min(max_tokens, limit - 2)
+        return cls(getattr(model, "tokenizer", None), max_tokens, min(overlap, max_tokens // 2))
+
+    @property
+    def signature(self) -> str:
+        # Changes whenever re-chunking would produce different vectors.
+        name = getattr(self.tokenizer, "name_or_path", None) or "words"
+        return f"{name}:{self.max_tokens}:{self.overlap}"
+
+    def token_offsets(self, text: str) -> list:
+        if self.tokenizer is not None:
+            try:
+                encoded = self.tokenizer(
+                    text, add_special_tokens=False, return_offsets_mapping=True, verbose=False
+                )
+                return [tuple(span) for span in encoded["offset_mapping"]]
+            except (NotImplementedError, KeyError):
+                pass  # Slow tokenizers have no offset mapping
+        return [match.span() for match in WORD_SPAN_RE.finditer(text)]
+
+    def spans(self, text: str) -> list:
+        # (start, end) character offsets of each window into text.
+        offsets = self.token_offsets(text)
+        if len(offsets) <= self.max_tokens:
+            return [(0, len(text))]
+        spans, step = [], self.max_tokens - self.overlap
+        for first in range(0, len(offsets), step):
+            window = offsets[first:first + self.max_tokens]
+            spans.append((window[0][0], window[-1][1]))
+            if first + self.max_tokens >= len(offsets):
+                break
+        return spans
+
+    def chunk(self, parent_id: str, text: str, metadata: dict) -> list:
+        # Returns [(chunk_id, chunk_text, chunk_metadata)]; metadata is the
+        # parent's plus the chunk's position, with "text" set to the chunk.
+        spans = self.spans(text)
+        chunks = []
+        for index, (start, end) in enumerate(spans):
+            chunk_text = text[start:end]
+            chunk_metadata = dict(metadata)
+            chunk_metadata.update({
+                "text": chunk_text,
+                "parent_id": parent_id,
+                "chunk_index": index,
+                "chunk_count": len(spans),
+                "chunk_start": start,
+                "chunk_end": end,
+            })
+            chunks.append((chunk_id(parent_id, index), chunk_text, chunk_metadata))
+        return chunks
+
+def reassemble(pieces) -> str:
+    # pieces: (start, end, text) windows of one parent. Overlapping windows are
+    # merged on their offsets; gaps between non-adjacent windows are marked.
+    text, covered = "", None
+    for start, end, piece in sorted(pieces, key=lambda p: (p[0], p[1])):
+        if covered is None:
+            text = piece
+        elif start > covered:
+            text += "\n...\n" + piece
+        elif end > covered:
+            text += piece[covered - start:]
+        covered = end if covered is None else max(covered, end)
+    return text
+
+def merge_chunk_matches(matches, k: int) -> list:
+    # matches: vector query matches (best first) whose metadata may carry
+    # chunk fields. Returns up to k (parent_id, score, text, metadata) tuples,
+    # one per parent, scored by its best chunk.
+    parents = {}
+    for match in matches:
+        metadata = dict(match.get("metadata") or {})
+        text = metadata.pop("text", "")
+        parent_id = metadata.get("parent_id") or match["id"]
+        entry = parents.get(parent_id)
+        if entry is None:
+            if len(parents) >= k:
+                continue
+            base = {key: value for key, value in metadata.items() if key not in CHUNK_FIELDS}
+            entry = parents[parent_id] = {"score": match["score"], "metadata": base, "pieces": []}
+        start = metadata.get("chunk_start", 0)
+        entry["pieces"].append((start, metadata.get("chunk_end", start + len(text)), text))
+    return [
+        (parent_id, entry["score"], reassemble(entry["pieces"]), entry["metadata"])
+        for parent_id, entry in parents.items()
+    ]
@@ -1,76 +1,39 @@
 import os
-import sys
 import json
-import subprocess
-import time
+from document_store import DocumentStore, import_legacy_json
+from config import FEED_CURSORS_FILE
 
-def run_python_files(directory, timeout=30, poll_interval=0.5):
-    print("Running Python files concurrently...")
-    # Files we don't want to execute because they're not meant to be run standalone
-    exclude_files = {
-        'config.py', 'index.py', 'app.py', 'requirements.txt',
-        'interface.py', 'main.py', 'pinecone_setup.py',
-        'prompt_llm.py', 'retriever.py', 'try.py'
-    }
-    # Get list of Python files excluding this file and any in the exclude list
-    python_files = [
-        f for f in os.listdir(directory)
-        if f.endswith('.py') and f != os.path.basename(__file__) and f not in exclude_files
-    ]
-    # Start processes and track start times
-    processes = []
-    for filename in python_files:
-        file_path = os.path.join(directory, filename)
-        print(f"Executing: {filename}")
-        try:
-            # Use sys.executable to ensure the same interpreter (venv) is used
-            proc = subprocess.Popen([sys.executable, file_path])
-            processes.append({'filename': filename, 'process': proc, 'start_time': time.time()})
-        except Exception as e:
-            print(f"Failed to start {filename}: {e}")
-
-    # Poll until all processes have finished or been terminated
-    while processes:
-        for proc_info in processes.copy():
-            proc = proc_info['process']
-            filename = proc_info['filename']
-            elapsed = time.time() - proc_info['start_time']
-            if proc.poll() is not None:
-                print(f"{filename} completed.")
-                processes.remove(proc_info)
-            elif elapsed > timeout:
-                print(f"Timeout expired for {filename}; terminating process.")
-                proc.terminate()
-                proc.wait()
-                processes.remove(proc_info)
-        time.sleep(poll_interval)
-
-def combine_json_files(directory, output_file):
+def combine_json_files(directory, store=None):
+    # Sync every feed's JSON output into the append-only document store. Only
+    # documents that are new or changed since the last sync are appended, and
+    # documents a feed stopped reporting are tombstoned.
     print("Combining JSON files...")
-    combined_data = []
-    output_filename = os.path.basename(output_file)
+    store = store or DocumentStore()
+    import_legacy_json(store)
+    store_files = {os.path.basename(path) for path in (store.path, store.manifest_path, store.cursors_path, FEED_CURSORS_FILE)}
+    total_upserted = total_deleted = 0
 
-    for filename in os.listdir(directory):
-        # Skip the output file if it already exists
-        if filename.endswith('.json') and filename != output_filename:
+    for filename in sorted(os.listdir(directory)):
+        # Skip the legacy combined file and the store's own files
+        if filename.endswith('.json') and filename != 'data.json' and filename not in store_files:
             file_path = os.path.join(directory, filename)
             try:
                 with open(file_path, 'r') as f:
                     data = json.load(f)
-                if isinstance(data, list):
-                    combined_data.extend(data)
-                else:
-                    combined_data.append(data)
+                records = data if isinstance(data, list) else [data]
+                upserted, deleted = store.sync_source(filename, records)
+                total_upserted += upserted
+                total_deleted += deleted
             except Exception as e:
                 print(f"Skipping {filename} due to error: {e}")
 
-    with open(output_file, 'w') as f:
-        json.dump(combined_data, f, indent=4)
-    print(f"Combined data has been written to {output_file}")
+    print(f"Document store {store.path}: {total_upserted} new/changed, {total_deleted} removed")
+    return total_upserted + total_deleted
 
 if __name__ == "__main__":
     input_directory = './'
-    output_file = 'data.json'
 
-    run_python_files(input_directory)
-    combine_json_files(input_directory, output_file)
+    # Run each feed once in-process (see ingest.py), then combine.
+    from ingest import IngestionDaemon, load_feeds
+    IngestionDaemon(load_feeds()).run_once(index=False)
+    combine_json_files(input_directory)
@@ -24,4 +24,135 @@ MONGODB_DB = os.getenv("MONGODB_DB")
 MONGODB_COLLECTION = os.getenv("MONGODB_COLLECTION")
 
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-GROQ_MODEL = os.getenv("GROQ_MODEL")
\ No newline at end of file
+GROQ_MODEL = os.getenv("GROQ_MODEL")
+
+# Retriever configuration
+RETRIEVER_K = int(os.getenv("RETRIEVER_K", "5"))
+# Load the embedding model in the gunicorn master before forking workers.
+PRELOAD_RETRIEVER = os.getenv("PRELOAD_RETRIEVER", "false").lower() in ("1", "true", "yes")
+
+# Query cache configuration (normalized query -> embedding / retrieved documents)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", "300"))
+
+# LLM generation settings
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.2"))
+
+# Semantic answer cache (reuses answers for near-identical queries over the same documents)
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "512"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "1800"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+# Marker file touched by index.py after every upsert; invalidates query-side caches.
+INDEX_VERSION_FILE = os.getenv("INDEX_VERSION_FILE", "index_version.txt")
+
+# Threads available to the ASGI app for blocking retriever calls
+ASYNC_IO_THREADS = int(os.getenv("ASYNC_IO_THREADS", "64"))
+
+# Indexing pipeline (index.py)
+INDEX_ENCODE_BATCH_SIZE = int(os.getenv("INDEX_ENCODE_BATCH_SIZE", "64"))
+INDEX_UPSERT_BATCH_SIZE = int(os.getenv("INDEX_UPSERT_BATCH_SIZE", "100"))
+# Pinecone rejects upsert requests over 2MB; stay safely below it.
+INDEX_UPSERT_MAX_BYTES = int(os.getenv("INDEX_UPSERT_MAX_BYTES", "1500000"))
+INDEX_UPSERT_WORKERS = int(os.getenv("INDEX_UPSERT_WORKERS", "4"))
+INDEX_UPSERT_RETRIES = int(os.getenv("INDEX_UPSERT_RETRIES", "3"))
+# Log entries planned and indexed per pass, bounding memory on a full re-chunk
+INDEX_DELTA_BATCH_SIZE = int(os.getenv("INDEX_DELTA_BATCH_SIZE", "5000"))
+# SQLite file tracking indexed document IDs and content fingerprints
+PROCESSED_IDS_DB = os.getenv("PROCESSED_IDS_DB", "processed_ids.db")
+
+# Vector store backend: "pinecone" (hosted) or "local" (in-process numpy index)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+# "exact" brute-force search or "ivf" approximate (k-means inverted lists)
+LOCAL_INDEX_MODE = os.getenv("LOCAL_INDEX_MODE", "exact")
+LOCAL_IVF_NPROBE = int(os.getenv("LOCAL_IVF_NPROBE", "8"))
+
+# Feed ingestion daemon (ingest.py); per-feed intervals via INGEST_INTERVAL_<FEED>
+INGEST_INTERVAL_SECONDS = int(os.getenv("INGEST_INTERVAL_SECONDS", str(5 * 60 * 60)))
+INGEST_JITTER_SECONDS = int(os.getenv("INGEST_JITTER_SECONDS", "300"))
+INGEST_TIMEOUT_SECONDS = int(os.getenv("INGEST_TIMEOUT_SECONDS", "600"))
+
+# Append-only document log written by ingestion and read by index.py (".gz" to compress)
+DOCUMENT_STORE_PATH = os.getenv("DOCUMENT_STORE_PATH", "documents.jsonl")
+# Per-feed "modified since" cursors and retention for keyed feed files
+FEED_CURSORS_FILE = os.getenv("FEED_CURSORS_FILE", "feed_cursors.json")
+FEED_RETENTION_DAYS = float(os.getenv("FEED_RETENTION_DAYS", "30"))
+
+# Hybrid retrieval: BM25 + exact IOC matches fused with vector search (reciprocal rank fusion)
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() in ("1", "true", "yes")
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.db")
+HYBRID_FETCH_K = int(os.getenv("HYBRID_FETCH_K", "20"))
+RRF_K = int(os.getenv("RRF_K", "60"))
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Maximum indicators accepted per /ioc/lookup request
+IOC_LOOKUP_MAX_BATCH = int(os.getenv("IOC_LOOKUP_MAX_BATCH", "1000"))
+
+# Optional cross-encoder rerank stage: over-fetch RERANK_FETCH_K candidates,
+# keep the best RETRIEVER_K, give up (vector order) after RERANK_BUDGET_MS
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "false").lower() in ("1", "true", "yes")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_FETCH_K = int(os.getenv("RERANK_FETCH_K", "50"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", "300"))
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", "512"))
+
+# Context assembly: token budget for retrieved text in the prompt. Tokens are
+# counted with CONTEXT_TOKENIZER (a Hugging Face tokenizer matching GROQ_MODEL);
+# without one, a ~4 characters/token estimate is used.
+CONTEXT_TOKENIZER = os.getenv("CONTEXT_TOKENIZER", "")
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "3000"))
+CONTEXT_MAX_CHUNK_TOKENS = int(os.getenv("CONTEXT_MAX_CHUNK_TOKENS", "800"))
+CONTEXT_MIN_CHUNK_TOKENS = int(os.getenv("CONTEXT_MIN_CHUNK_TOKENS", "64"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.85"))
+
+# Chunking before embedding: token windows of CHUNK_MAX_TOKENS (capped by the
+# embedding model's max sequence length) overlapping by CHUNK_OVERLAP_TOKENS.
+# Queries fetch CHUNK_QUERY_FACTOR x k chunks and merge them per parent document.
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "32"))
+CHUNK_QUERY_FACTOR = int(os.getenv("CHUNK_QUERY_FACTOR", "3"))
+
+# Embedding runtime shared by indexing and queries: "torch" (fp32), "int8"
+# (PyTorch dynamic quantization of the Linear layers) or "onnx" (ONNX Runtime,
+# needs `pip install optimum[onnxruntime]`). EMBEDDING_ONNX_FILE optionally
+# picks a specific export, e.g. onnx/model_qint8_avx512_vnni.onnx.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_ONNX_FILE = os.getenv("EMBEDDING_ONNX_FILE", "")
+
+# Cross-request micro-batching of query embeddings: concurrent queries are
+# encoded together, waiting at most EMBED_BATCH_MAX_WAIT_MS for company when
+# several are already queued (a lone query is encoded at once). Needs
+# concurrent requests in one process: gunicorn threads (GUNICORN_THREADS) or
+# the ASGI app.
+EMBED_BATCHING = os.getenv("EMBED_BATCHING", "true").lower() in ("1", "true", "yes")
+EMBED_BATCH_MAX_SIZE = int(os.getenv("EMBED_BATCH_MAX_SIZE", "32"))
+EMBED_BATCH_MAX_WAIT_MS = float(os.getenv("EMBED_BATCH_MAX_WAIT_MS", "2"))
+# A caller gives up (and the request fails) if its batch takes longer than this
+EMBED_BATCH_TIMEOUT_SECONDS = float(os.getenv("EMBED_BATCH_TIMEOUT_SECONDS", "30"))
+
+# Per-stage latency histograms, the /metrics endpoint and Server-Timing headers
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Write-behind chat persistence: turns are queued and written with bulk_write
+# every CHAT_FLUSH_BATCH_SIZE turns or CHAT_FLUSH_INTERVAL_MS, whichever first
+CHAT_WRITE_BEHIND = os.getenv("CHAT_WRITE_BEHIND", "true").lower() in ("1", "true", "yes")
+CHAT_FLUSH_BATCH_SIZE = int(os.getenv("CHAT_FLUSH_BATCH_SIZE", "100"))
+CHAT_FLUSH_INTERVAL_MS = float(os.getenv("CHAT_FLUSH_INTERVAL_MS", "200"))
+CHAT_QUEUE_MAX = int(os.getenv("CHAT_QUEUE_MAX", "10000"))
+CHAT_FLUSH_RETRIES = int(os.getenv("CHAT_FLUSH_RETRIES", "3"))
+
+# /chats keyset pagination and /chats/<session_id> message slicing
+CHATS_PAGE_SIZE = int(os.getenv("CHATS_PAGE_SIZE", "20"))
+CHATS_MAX_PAGE_SIZE = int(os.getenv("CHATS_MAX_PAGE_SIZE", "100"))
+CHAT_MESSAGES_LIMIT = int(os.getenv("CHAT_MESSAGES_LIMIT", "50"))
+
+# Session documents keep only the latest CHAT_RECENT_MESSAGES messages; the
+# full history lives in buckets of CHAT_BUCKET_SIZE messages in
+# MONGODB_MESSAGES_COLLECTION (default "<MONGODB_COLLECTION>_messages")
+CHAT_RECENT_MESSAGES = int(os.getenv("CHAT_RECENT_MESSAGES", "20"))
+CHAT_BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", "100"))
+MONGODB_MESSAGES_COLLECTION = os.getenv("MONGODB_MESSAGES_COLLECTION")
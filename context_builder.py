@@ -0,0 +1,130 @@
+import re
+import threading
+from config import (
+    CONTEXT_TOKENIZER, CONTEXT_MAX_TOKENS, CONTEXT_MAX_CHUNK_TOKENS,
+    CONTEXT_MIN_CHUNK_TOKENS, CONTEXT_DEDUP_THRESHOLD,
+)
+
+_WORD_RE = re.compile(r"\w+")
+_SPACE_RE = re.compile(r"[ \t]+")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+class TokenCounter:
+    # Counts and truncates by tokens of the LLM's tokenizer. The tokenizer is
+    # loaded lazily; if none is configured (or it can't be loaded) counts
+    # fall back to a characters-per-token estimate.
+    CHARS_PER_TOKEN = 4
+
+    def __init__(self, name: str = CONTEXT_TOKENIZER):
+        self.name = name
+        self.tokenizer = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    if self.name:
+                        try:
+                            from transformers import AutoTokenizer
+                            self.tokenizer = AutoTokenizer.from_pretrained(self.name)
+                        except Exception as e:
+                            print(f"Could not load tokenizer {self.name}, estimating tokens: {e}")
+                    self._loaded = True
+        return self.tokenizer
+
+    def count(self, text: str) -> int:
+        tokenizer = self._load()
+        if tokenizer is None:
+            return -(-len(text) // self.CHARS_PER_TOKEN)
+        return len(tokenizer.encode(text, add_special_tokens=False))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        tokenizer = self._load()
+        if tokenizer is None:
+            return text[:max_tokens * self.CHARS_PER_TOKEN]
+        ids = tokenizer.encode(text, add_special_tokens=False)
+        if len(ids) <= max_tokens:
+            return text
+        return tokenizer.decode(ids[:max_tokens])
+
+def compact_text(text: str) -> str:
+    # Collapse runs of spaces and blank lines; feed text is full of both.
+    lines = [_SPACE_RE.sub(" ", line).strip() for line in text.splitlines()]
+    return _BLANK_LINES_RE.sub("\n\n", "\n".join(lines)).strip()
+
+def shingles(text: str, size: int = 3) -> set:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def doc_text(doc) -> str:
+    return doc.metadata.get("text") if doc.metadata.get("text") else doc.page_content
+
+class ContextBuilder:
+    # Assembles retrieved documents into prompt context, in retrieval order:
+    # near-duplicates of an earlier chunk are dropped, each chunk is capped at
+    # max_chunk_tokens, and chunks are added until max_tokens is reached (the
+    # last one truncated if at least min_chunk_tokens still fit).
+    def __init__(self, counter: TokenCounter = None, max_tokens: int = CONTEXT_MAX_TOKENS,
+                 max_chunk_tokens: int = CONTEXT_MAX_CHUNK_TOKENS,
+                 min_chunk_tokens: int = CONTEXT_MIN_CHUNK_TOKENS,
+                 dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD):
+        self.counter = counter or TokenCounter()
+        self.max_tokens = max_tokens
+        self.max_chunk_tokens = max_chunk_tokens
+        self.min_chunk_tokens = min_chunk_tokens
+        self.dedup_threshold = dedup_threshold
+
+    def dedupe(self, texts: list) -> list:
+        kept, kept_shingles = [], []
+        for text in texts:
+            current = shingles(text)
+            if any(jaccard(current, seen) >= self.dedup_threshold for seen in kept_shingles):
+                continue
+            kept.append(text)
+            kept_shingles.append(current)
+        return kept
+
+    def build(self, docs) -> tuple:
+        # Returns (context, stats) so callers can log what was trimmed.
+        texts = [compact_text(text) for text in (doc_text(doc) for doc in docs) if text]
+        unique = self.dedupe(texts)
+        separator_tokens = self.counter.count("\n\n")
+
+        parts, used, truncated = [], 0, 0
+        for text in unique:
+            remaining = self.max_tokens - used - (separator_tokens if parts else 0)
+            if remaining < self.min_chunk_tokens:
+                break
+            tokens = self.counter.count(text)
+            limit = min(self.max_chunk_tokens, remaining)
+            if tokens > limit:
+                text = self.counter.truncate(text, limit)
+                tokens = self.counter.count(text)
+                truncated += 1
+            used += tokens + (separator_tokens if parts else 0)
+            parts.append(text)
+
+        return "\n\n".join(parts), {
+            "chunks": len(texts),
+            "duplicates": len(texts) - len(unique),
+            "included": len(parts),
+            "truncated": truncated,
+            "tokens": used,
+        }
+
+_builder = None
+
+def get_context_builder() -> ContextBuilder:
+    global _builder
+    if _builder is None:
+        _builder = ContextBuilder()
+    return _builder
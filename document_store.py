@@ -0,0 +1,323 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from config import DOCUMENT_STORE_PATH, FEED_CURSORS_FILE, FEED_RETENTION_DAYS, VECTOR_BACKEND
+
+# Append-only, line-delimited document log that replaces the monolithic
+# data.json. Every line is one operation:
+#   {"op": "upsert", "id": ..., "fingerprint": ..., "origin": ..., "page_content": ..., "metadata": {...}}
+#   {"op": "delete", "id": ..., "origin": ...}
+# Readers stream lines from a saved byte offset, so each consumer only reads
+# what was appended since its last run. A ".gz" path stores every append as
+# its own gzip member, which keeps appends cheap and offsets seekable.
+
+def record_id(record) -> str:
+    # Derived from the content itself, so reordering never changes an ID and
+    # identical documents from repeated feed runs collapse to one.
+    source = (record.get("metadata") or {}).get("source", "")
+    text = record.get("page_content", "")
+    return "doc_" + hashlib.sha256(f"{source}\x00{text}".encode("utf-8")).hexdigest()[:32]
+
+def record_fingerprint(record) -> str:
+    # Changes whenever content or metadata changes, prompting a re-embed.
+    # Bookkeeping fields (first_seen/last_seen) are deliberately excluded.
+    document = {"page_content": record.get("page_content", ""), "metadata": record.get("metadata") or {}}
+    return hashlib.sha256(json.dumps(document, sort_keys=True).encode("utf-8")).hexdigest()
+
+# Read size for compressed logs.
+READ_SIZE = 1 << 20
+
+class DocumentStore:
+    def __init__(self, path: str = DOCUMENT_STORE_PATH):
+        self.path = path
+        self.compressed = path.endswith(".gz")
+        self.manifest_path = path + ".manifest.json"
+        self.cursors_path = path + ".cursors.json"
+        self._manifest = None
+
+    # -------------------- Manifest (id -> [origin, fingerprint]) --------------------
+    @property
+    def manifest(self) -> dict:
+        if self._manifest is None:
+            self._manifest = self._load_json(self.manifest_path, {})
+        return self._manifest
+
+    def _load_json(self, path, default):
+        try:
+            with open(path, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+    def _save_json(self, path, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    # -------------------- Writes --------------------
+    def append(self, entries):
+        if not entries:
+            return
+        payload = "".join(json.dumps(entry) + "\n" for entry in entries).encode("utf-8")
+        if self.compressed:
+            payload = gzip.compress(payload)
+        with open(self.path, "ab") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        for entry in entries:
+            if entry["op"] == "delete":
+                self.manifest.pop(entry["id"], None)
+            else:
+                self.manifest[entry["id"]] = [entry["origin"], entry["fingerprint"]]
+        self._save_json(self.manifest_path, self.manifest)
+
+    def sync_source(self, origin: str, records) -> tuple:
+        # Make the store reflect the latest snapshot from one source: append
+        # new/changed records and tombstone ones the source no longer has.
+        # Returns (upserted, deleted) counts.
+        entries, seen = [], set()
+        for record in records:
+            if not isinstance(record, dict) or not record.get("page_content"):
+                continue
+            doc_id = record_id(record)
+            if doc_id in seen:
+                continue
+            seen.add(doc_id)
+            fingerprint = record_fingerprint(record)
+            known = self.manifest.get(doc_id)
+            if known and known[1] == fingerprint:
+                continue
+            entries.append({
+                "op": "upsert",
+                "id": doc_id,
+                "fingerprint": fingerprint,
+                "origin": origin,
+                "page_content": record["page_content"],
+                "metadata": record.get("metadata") or {},
+            })
+        upserted = len(entries)
+        for doc_id, (doc_origin, _) in list(self.manifest.items()):
+            if doc_origin == origin and doc_id not in seen:
+                entries.append({"op": "delete", "id": doc_id, "origin": origin})
+        self.append(entries)
+        return upserted, len(entries) - upserted
+
+    # -------------------- Streaming reads --------------------
+    def size(self) -> int:
+        try:
+            return os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+
+    def iter_entries(self, offset: int = 0):
+        # Yields (next_offset, entry) for every complete entry after `offset`.
+        # Stops at the file size seen on entry, so a concurrent append is
+        # picked up on the next read rather than half-read now.
+        end = self.size()
+        if offset >= end:
+            return
+        with open(self.path, "rb") as raw:
+            raw.seek(offset)
+            if self.compressed:
+                yield from self._iter_gzip(raw, offset, end)
+            else:
+                position = offset
+                for line in raw:
+                    if position >= end or not line.endswith(b"\n"):
+                        return
+                    position += len(line)
+                    if line.strip():
+                        yield position, json.loads(line)
+
+    def _iter_gzip(self, raw, offset, end):
+        # Each append is a complete gzip member. Members are decompressed from
+        # fixed-size reads, so memory is bounded by one append rather than the
+        # unread tail; a member's entries are yielded once it is complete,
+        # with the offset after it as the resume point.
+        position, remaining = offset, end - offset
+        data, consumed, text = b"", 0, []
+        decompressor = gzip.zlib.decompressobj(16 + gzip.zlib.MAX_WBITS)
+        while True:
+            if not data:
+                if not remaining:
+                    return  # End of the snapshot (or a member still being written)
+                data = raw.read(min(READ_SIZE, remaining))
+                if not data:
+                    return
+                remaining -= len(data)
+            try:
+                text.append(decompressor.decompress(data))
+            except gzip.zlib.error:
+                return
+            consumed += len(data)
+            if not decompressor.eof:
+                data = b""
+                continue
+            data = decompressor.unused_data
+            position += consumed - len(data)
+            for line in io.BytesIO(b"".join(text)):
+                if line.strip():
+                    yield position, json.loads(line)
+            consumed, text = 0, []
+            decompressor = gzip.zlib.decompressobj(16 + gzip.zlib.MAX_WBITS)
+
+    def iter_documents(self):
+        # Current documents (latest upsert per id, minus deletes), streamed.
+        # Only the manifest and the set of emitted ids are held in memory.
+        emitted = set()
+        for _, entry in self.iter_entries(0):
+            if entry["op"] != "upsert" or entry["id"] in emitted:
+                continue
+            known = self.manifest.get(entry["id"])
+            if known and known[1] == entry["fingerprint"]:
+                emitted.add(entry["id"])
+                yield entry
+
+    # -------------------- Compaction --------------------
+    def compact(self, min_garbage_ratio: float = 0.5) -> bool:
+        # Rewrite the log with only the live documents once superseded and
+        # deleted entries make up at least `min_garbage_ratio` of it. Only
+        # safe when every consumer has read to the end, since offsets change.
+        size = self.size()
+        cursors = self._load_json(self.cursors_path, {})
+        if not size or any(offset < size for offset in cursors.values()):
+            return False
+        total_entries = sum(1 for _ in self.iter_entries(0))
+        if not total_entries or 1 - len(self.manifest) / total_entries < min_garbage_ratio:
+            return False
+
+        tmp_path = self.path + ".compact"
+        opener = gzip.open if self.compressed else open
+        with opener(tmp_path, "wt", encoding="utf-8") as f:
+            for entry in self.iter_documents():
+                f.write(json.dumps(entry) + "\n")
+        os.replace(tmp_path, self.path)
+        self._save_json(self.cursors_path, {name: self.size() for name in cursors})
+        print(f"Compacted {self.path}: {total_entries} entries -> {len(self.manifest)} documents")
+        return True
+
+    # -------------------- Consumer cursors --------------------
+    def read_cursor(self, name: str) -> int:
+        return self._load_json(self.cursors_path, {}).get(name, 0)
+
+    def behind(self, name: str) -> bool:
+        # True while the consumer has entries left to read (e.g. a failed run).
+        return self.read_cursor(name) < self.size()
+
+    def write_cursor(self, name: str, offset: int):
+        cursors = self._load_json(self.cursors_path, {})
+        cursors[name] = offset
+        self._save_json(self.cursors_path, cursors)
+
+def index_cursor(backend: str = VECTOR_BACKEND) -> str:
+    # One cursor per backend, so each index consumes the log independently.
+    return f"index-{backend}"
+
+# -------------------- Keyed feed files --------------------
+# Feeds keep their own JSON file keyed by a natural identifier (pulse id, URL,
+# IP). Each run merges into it instead of appending duplicates; entries the
+# source has not listed for FEED_RETENTION_DAYS are compacted away. Feeds
+# whose source never retires records pass retention_days=None.
+
+def load_feed_records(path: str) -> list:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+def merge_keyed_records(path: str, records, key_func, retention_days: float = FEED_RETENTION_DAYS, listed=()) -> dict:
+    # `listed` holds keys the source still lists but did not re-send (e.g.
+    # filtered out by an incremental cursor); they count as seen now.
+    existing = load_feed_records(path)
+    now = time.time()
+    merged, stats = {}, {"added": 0, "updated": 0, "unchanged": 0, "expired": 0}
+    for record in existing:
+        key = key_func(record)
+        if key is not None:
+            record.setdefault("last_seen", now)  # Rows from before merging start their retention now
+            merged[key] = record  # Later duplicates win, collapsing old repeats
+    for key in listed:
+        if key in merged:
+            merged[key]["last_seen"] = now
+    for record in records:
+        key = key_func(record)
+        if key is None:
+            continue
+        old = merged.get(key)
+        updated = dict(record)
+        updated["metadata"] = {**((old or {}).get("metadata") or {}), **(record.get("metadata") or {})}
+        updated["first_seen"] = (old or {}).get("first_seen", now)
+        updated["last_seen"] = now
+        if old is None:
+            stats["added"] += 1
+        elif record_fingerprint(old) != record_fingerprint(updated):
+            stats["updated"] += 1
+        else:
+            stats["unchanged"] += 1
+        merged[key] = updated
+
+    compacted = list(merged.values())
+    if retention_days is not None:
+        cutoff = now - retention_days * 86400
+        compacted = [record for record in compacted if record.get("last_seen", now) >= cutoff]
+        stats["expired"] = len(merged) - len(compacted)
+
+    # A torn write would read back as an empty feed and delete it from the
+    # index on the next sync, so replace the file atomically.
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(compacted, f, indent=4)
+    os.replace(tmp_path, path)
+    stats["total"] = len(compacted)
+    return stats
+
+def load_feed_cursor(source: str, default=None):
+    try:
+        with open(FEED_CURSORS_FILE, "r") as f:
+            return json.load(f).get(source, default)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return default
+
+# Feeds run on parallel threads (ingest.py) and share one cursors file.
+_feed_cursors_lock = threading.Lock()
+
+def save_feed_cursor(source: str, value):
+    with _feed_cursors_lock:
+        try:
+            with open(FEED_CURSORS_FILE, "r") as f:
+                cursors = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            cursors = {}
+        cursors[source] = value
+        tmp_path = FEED_CURSORS_FILE + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(cursors, f, indent=4)
+        os.replace(tmp_path, FEED_CURSORS_FILE)
+
+def legacy_documents(path: str = "data.json"):
+    # Records of the old combined data.json as store entries, for readers
+    # that run before ingestion has filled the store. Read-only.
+    try:
+        with open(path, "r") as f:
+            records = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return
+    for record in records:
+        if isinstance(record, dict) and record.get("page_content"):
+            yield {"id": record_id(record), "page_content": record["page_content"], "metadata": record.get("metadata") or {}}
+
+def import_legacy_json(store: DocumentStore, path: str = "data.json"):
+    # Seed an empty store from the old combined data.json, once.
+    if store.size() or not os.path.exists(path):
+        return
+    with open(path, "r") as f:
+        records = json.load(f)
+    upserted, _ = store.sync_source(os.path.basename(path), records)
+    print(f"Imported {upserted} documents from {path} into {store.path}")
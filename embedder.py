@@ -0,0 +1,63 @@
+import threading
+from langchain_core.embeddings import Embeddings
+from config import EMBEDDING_MODEL, EMBEDDING_BACKEND, EMBEDDING_ONNX_FILE, INDEX_ENCODE_BATCH_SIZE
+
+# One embedding model wrapper for both index.py and the retriever, so the
+# documents and the queries are always encoded by the same runtime.
+
+EMBEDDING_BACKENDS = ("torch", "int8", "onnx")
+
+def load_sentence_transformer(model_name: str, backend: str):
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        return SentenceTransformer(model_name, device="cpu")
+    if backend == "int8":
+        import torch
+        model = SentenceTransformer(model_name, device="cpu")
+        # Dynamic quantization: int8 weights for every Linear layer,
+        # activations quantized on the fly. CPU only.
+        return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if backend == "onnx":
+        model_kwargs = {"file_name": EMBEDDING_ONNX_FILE} if EMBEDDING_ONNX_FILE else None
+        return SentenceTransformer(model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
+    raise ValueError(f"Unknown EMBEDDING_BACKEND {backend!r}; expected one of {EMBEDDING_BACKENDS}")
+
+class Embedder(Embeddings):
+    # Unit-normalized float32 embeddings. encode() returns numpy rows for the
+    # indexer; embed_query/embed_documents return lists for LangChain.
+    def __init__(self, model_name: str = EMBEDDING_MODEL, backend: str = EMBEDDING_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self.model = load_sentence_transformer(model_name, backend)
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self):
+        return self.model.max_seq_length
+
+    def encode(self, texts, batch_size: int = INDEX_ENCODE_BATCH_SIZE, **kwargs):
+        kwargs.setdefault("normalize_embeddings", True)
+        kwargs.setdefault("convert_to_numpy", True)
+        kwargs.setdefault("show_progress_bar", False)
+        return self.model.encode(texts, batch_size=batch_size, **kwargs)
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text: str):
+        return self.encode([text])[0].tolist()
+
+_embedders = {}
+_embedders_lock = threading.Lock()
+
+def get_embedder(backend: str = EMBEDDING_BACKEND) -> Embedder:
+    # One loaded model per backend per process.
+    if backend not in _embedders:
+        with _embedders_lock:
+            if backend not in _embedders:
+                _embedders[backend] = Embedder(backend=backend)
+    return _embedders[backend]
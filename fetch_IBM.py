@@ -14,7 +14,7 @@ JSON_FILE = "ibm_security_blog.json"
 ARTICLE_LIMIT = 10
 
 def fetch_rss_feed(url):
-    response = requests.get(url)
+    response = requests.get(url, timeout=30)
     response.raise_for_status()  # Raise an error for bad status codes
     return response.content
 
@@ -64,5 +64,6 @@ def run():
     else:
         print("⚠️ No articles found.\n")
 
-# Execute the script
-run()
+# Scheduling lives in ingest.py; running this file directly does a single fetch.
+if __name__ == "__main__":
+    run()
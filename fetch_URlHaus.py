@@ -1,9 +1,7 @@
 import requests
-import json
-import schedule
-import time
 from langchain.schema import Document
 from datetime import datetime
+from document_store import merge_keyed_records, load_feed_cursor, save_feed_cursor
 
 # ✅ URLhaus API Endpoint
 URLHAUS_RECENT_URL = "https://urlhaus-api.abuse.ch/v1/urls/recent/"
@@ -14,19 +12,31 @@ JSON_FILE = "urlhaus_threats.json"
 # ✅ Number of URLs to fetch (Limit to avoid processing overload)
 URL_LIMIT = 50
 
+# ✅ Cursor name for the newest date_added already processed
+SOURCE = "URLhaus API"
+
+def is_date(value) -> bool:
+    # date_added is "YYYY-MM-DD HH:MM:SS UTC", so string order is time order;
+    # the "Unknown" placeholder would sort after every real date.
+    return isinstance(value, str) and value[:1].isdigit()
+
 # ✅ Function to Fetch the Latest Malicious URLs from URLhaus
-def fetch_recent_malware_urls():
+def fetch_recent_malware_urls(added_since=None):
+    # Returns (URLs added since the cursor, every URL URLhaus currently lists).
     headers = {"Accept": "application/json"}
     
     print("\n🚀 [1/4] Fetching latest malware URLs from URLhaus...")
-    response = requests.get(URLHAUS_RECENT_URL, headers=headers)  
+    response = requests.get(URLHAUS_RECENT_URL, headers=headers, timeout=30)
 
     if response.status_code == 200:
         url_data = response.json().get("urls", [])[:URL_LIMIT]
+        listed = [entry["url"] for entry in url_data if entry.get("url")]
+        if is_date(added_since):
+            url_data = [entry for entry in url_data if is_date(entry.get("date_added")) and entry["date_added"] > added_since]
 
         if not url_data:
             print("⚠️ No new threats found in URLhaus.")
-            return []
+            return [], listed
 
         # Extract relevant details and handle missing fields
         malicious_urls = []
@@ -43,10 +53,10 @@ def fetch_recent_malware_urls():
             print(f"🔍 [{idx}/{len(url_data)}] Retrieved: {url_info['url']} - {url_info['threat']}")
 
         print(f"✅ Total {len(malicious_urls)} malware URLs fetched.")
-        return malicious_urls
+        return malicious_urls, listed
     else:
         print(f"❌ Error {response.status_code}: {response.text}")
-        return []
+        return [], []
 
 # ✅ Function to Process Data and Convert to LangChain Document Format
 def process_malware_data(malicious_urls):
@@ -77,50 +87,39 @@ def process_malware_data(malicious_urls):
     return documents
 
 # ✅ Function to Save Data to JSON
-def save_to_json(documents):
-    if not documents:
+def save_to_json(documents, listed=()):
+    if not documents and not listed:
         print("⚠️ No data to save.")
         return
 
     formatted_data = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
 
-    try:
-        with open(JSON_FILE, "r") as file:
-            existing_data = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        existing_data = []
-
-    # Replace old data with only the latest threats
-    existing_data = formatted_data
-
+    # Merge by URL so earlier threats are kept and re-reported ones are updated.
+    # URLs URLhaus still lists stay fresh; retention drops them once it stops.
     print("\n💾 [3/4] Saving processed data to JSON...")
-    with open(JSON_FILE, "w") as file:
-        json.dump(existing_data, file, indent=4)
+    stats = merge_keyed_records(JSON_FILE, formatted_data, lambda record: record["metadata"].get("url"), listed=listed)
 
-    print(f"✅ Data saved to {JSON_FILE} (Total records: {len(formatted_data)})")
+    print(f"✅ Data saved to {JSON_FILE} ({stats['added']} new, {stats['updated']} updated, {stats['expired']} expired; {stats['total']} total)")
 
 # ✅ Function to Run the Full Process
 def run():
     print(f"\n🔄 Fetching URLhaus Threat Data at {datetime.now()}")
     
-    # Step 1: Fetch URLs
-    malicious_urls = fetch_recent_malware_urls()
+    # Step 1: Fetch URLs added since the last run
+    added_since = load_feed_cursor(SOURCE)
+    malicious_urls, listed = fetch_recent_malware_urls(added_since)
 
     # Step 2: Process Data
     documents = process_malware_data(malicious_urls)
 
     # Step 3: Save Data
-    save_to_json(documents)
+    save_to_json(documents, listed)
+    latest = max((entry["date_added"] for entry in malicious_urls if is_date(entry["date_added"])), default=None)
+    if latest and (not is_date(added_since) or latest > added_since):
+        save_feed_cursor(SOURCE, latest)
 
     print("🎉 [4/4] Data update complete!\n")
 
-# ✅ Schedule to Run Every 5 Hours
-schedule.every(5).hours.do(run)
-
-# ✅ Initial Run
-run()
-
-# ✅ Keep Running in Background
-while True:
-    schedule.run_pending()
-    time.sleep(60)
+# Scheduling lives in ingest.py; running this file directly does a single fetch.
+if __name__ == "__main__":
+    run()
@@ -1,11 +1,14 @@
 import requests
-import json
-import schedule
 import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from langchain.schema import Document
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from document_store import merge_keyed_records, load_feed_records
 
 # Load environment variables from .env file
 load_dotenv()
@@ -23,16 +26,49 @@ ABUSEIPDB_CHECK_URL = "https://api.abuseipdb.com/api/v2/check"
 # ✅ JSON File to Store Data
 JSON_FILE = "abuseipdb_threats.json"
 
-# ✅ Number of malicious IPs to retrieve (max = 10000, but limit to avoid rate limits)
-IP_LIMIT = 50
+# ✅ Number of malicious IPs to retrieve (max = 10000; bounded in practice by the daily check quota)
+IP_LIMIT = int(os.getenv("ABUSE_IP_LIMIT", "50"))
+
+# ✅ IPs checked more recently than this are not re-checked (saves quota)
+RECHECK_HOURS = float(os.getenv("ABUSE_RECHECK_HOURS", "24"))
+
+# ✅ Concurrent detail lookups (each worker reuses a pooled connection)
+MAX_WORKERS = int(os.getenv("ABUSE_MAX_WORKERS", "8"))
+
+# ✅ Shared session: connection pooling plus retry with exponential backoff on
+# transient server errors. 429s are not retried: AbuseIPDB quotas are daily,
+# so a 429 ends the cycle instead (see update_rate_limit).
+session = requests.Session()
+session.headers.update({"Key": ABUSEIPDB_API_KEY, "Accept": "application/json"})
+retry_policy = Retry(
+    total=4,
+    backoff_factor=1,
+    status_forcelist=[500, 502, 503, 504],
+    allowed_methods=["GET"],
+)
+adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS, max_retries=retry_policy)
+session.mount("https://", adapter)
+
+# ✅ Rate-limit state reported by AbuseIPDB on every response
+rate_limit = {"remaining": None, "reset": None, "exhausted": False}
+rate_limit_lock = threading.Lock()
+
+def update_rate_limit(response):
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    with rate_limit_lock:
+        if remaining is not None:
+            rate_limit["remaining"] = int(remaining)
+            rate_limit["reset"] = response.headers.get("X-RateLimit-Reset")
+        if response.status_code == 429 or (remaining is not None and int(remaining) <= 0):
+            rate_limit["exhausted"] = True
+            rate_limit["reset"] = response.headers.get("X-RateLimit-Reset") or response.headers.get("Retry-After")
 
 # Function to Fetch the Latest Malicious IPs from AbuseIPDB Blacklist
 def fetch_blacklisted_ips():
-    headers = {"Key": ABUSEIPDB_API_KEY, "Accept": "application/json"}
-    params = {"confidenceMinimum": 90}  # Only get high-confidence malicious IPs
+    params = {"confidenceMinimum": 90, "limit": IP_LIMIT}  # Only get high-confidence malicious IPs
 
     print("\n🔄 Fetching latest blacklisted IPs...")
-    response = requests.get(ABUSEIPDB_BLACKLIST_URL, headers=headers, params=params)
+    response = session.get(ABUSEIPDB_BLACKLIST_URL, params=params, timeout=30)
 
     if response.status_code == 200:
         ip_data = response.json().get("data", [])[:IP_LIMIT]
@@ -45,11 +81,18 @@ def fetch_blacklisted_ips():
 
 # Function to Fetch Detailed Reports for Each IP
 def fetch_ip_details(ip, index, total):
-    headers = {"Key": ABUSEIPDB_API_KEY, "Accept": "application/json"}
     params = {"ipAddress": ip, "maxAgeInDays": 30}  # Get last 30 days of reports
 
+    if rate_limit["exhausted"]:
+        return None  # Quota used up; skip the rest of this cycle
+
     print(f"📄 [{index}/{total}] Checking detailed report for IP: {ip}...")
-    response = requests.get(ABUSEIPDB_CHECK_URL, headers=headers, params=params)
+    try:
+        response = session.get(ABUSEIPDB_CHECK_URL, params=params, timeout=15)
+    except requests.RequestException as e:
+        print(f"⚠️ [{index}/{total}] Error fetching details for {ip}: {e}")
+        return None
+    update_rate_limit(response)
 
     if response.status_code == 200:
         ip_data = response.json().get("data", {})
@@ -77,9 +120,20 @@ def fetch_ip_details(ip, index, total):
 # Function to Process Data and Convert to LangChain Document Format
 def process_ip_data(malicious_ips):
     documents = []
+    total = len(malicious_ips)
+    rate_limit["exhausted"] = False
+
+    # Detail lookups run concurrently; results keep the blacklist order.
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        details = list(executor.map(
+            lambda item: fetch_ip_details(item[1], item[0], total),
+            enumerate(malicious_ips, start=1),
+        ))
+
+    if rate_limit["exhausted"]:
+        print(f"⚠️ AbuseIPDB rate limit reached (resets at {rate_limit['reset']}); remaining IPs skipped this cycle.")
 
-    for index, ip in enumerate(malicious_ips, start=1):
-        ip_details = fetch_ip_details(ip, index, len(malicious_ips))
+    for ip_details in details:
         if ip_details:
             doc = Document(
                 page_content=f"IP {ip_details['ip']} has been reported {ip_details['total_reports']} times. Abuse Score: {ip_details['abuse_score']}. ISP: {ip_details['isp']}. Country: {ip_details['country']}.",
@@ -93,25 +147,28 @@ def process_ip_data(malicious_ips):
 def save_to_json(documents):
     formatted_data = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
 
-    try:
-        with open(JSON_FILE, "r") as file:
-            existing_data = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        existing_data = []
-
-    # Replace old data with only the latest malicious IPs
-    existing_data = formatted_data
+    # Merge by IP so each address has one up-to-date record
+    stats = merge_keyed_records(JSON_FILE, formatted_data, lambda record: record["metadata"].get("ip"))
 
-    with open(JSON_FILE, "w") as file:
-        json.dump(existing_data, file, indent=4)
+    print(f"✅ Data saved to {JSON_FILE} ({stats['added']} new, {stats['updated']} updated, {stats['expired']} expired; {stats['total']} total)")
 
-    print(f"✅ Data saved to {JSON_FILE} (Total records: {len(formatted_data)})")
+def recently_checked_ips():
+    cutoff = time.time() - RECHECK_HOURS * 3600
+    return {
+        record["metadata"].get("ip")
+        for record in load_feed_records(JSON_FILE)
+        if record.get("last_seen", 0) >= cutoff
+    }
 
 # Function to Run the Full Process
 def run():
     print(f"\n🔄 Fetching AbuseIPDB Data at {datetime.now()}")
     malicious_ips = fetch_blacklisted_ips()
 
+    # Only look up IPs that are new or whose details are stale
+    fresh = recently_checked_ips()
+    malicious_ips = [ip for ip in malicious_ips if ip not in fresh]
+
     if malicious_ips:
         print(f"🛠️ Processing {len(malicious_ips)} IPs...")
         documents = process_ip_data(malicious_ips)
@@ -120,13 +177,6 @@ def run():
     else:
         print("⚠️ No new malicious IPs found.\n")
 
-# Schedule to Run Every 5 Hours
-schedule.every(5).hours.do(run)
-
-# Initial Run
-run()
-
-# Keep Running in Background
-while True:
-    schedule.run_pending()
-    time.sleep(60)
+# Scheduling lives in ingest.py; running this file directly does a single fetch.
+if __name__ == "__main__":
+    run()
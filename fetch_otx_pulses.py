@@ -1,11 +1,9 @@
 import requests
-import json
-import schedule
-import time
 from langchain.schema import Document
 from datetime import datetime
 import os
 from dotenv import load_dotenv
+from document_store import merge_keyed_records, load_feed_cursor, save_feed_cursor
 
 # Load environment variables from .env file
 load_dotenv()
@@ -17,17 +15,31 @@ api_key = os.getenv("OTX_API_KEY")
 API_KEY = api_key
 OTX_URL = "https://otx.alienvault.com/api/v1/pulses/subscribed"
 JSON_FILE = "otx_threat_intelligence.json"
+SOURCE = "AlienVault OTX"
+
+# Pages of 50 pulses to follow per run
+MAX_PAGES = int(os.getenv("OTX_MAX_PAGES", "20"))
 
 # Function to Fetch Threat Intelligence Data
-def fetch_pulses():
+def fetch_pulses(modified_since=None):
+    # Only pulses modified after the last run's cursor, following pagination.
     headers = {"X-OTX-API-KEY": API_KEY}
-    response = requests.get(OTX_URL, headers=headers)
-
-    if response.status_code == 200:
-        return response.json().get("results", [])
-    else:
-        print(f"Error: {response.status_code}")
-        return []
+    params = {"limit": 50}
+    if modified_since:
+        params["modified_since"] = modified_since
+
+    pulses, url = [], OTX_URL
+    for _ in range(MAX_PAGES):
+        response = requests.get(url, headers=headers, params=params, timeout=30)
+        if response.status_code != 200:
+            print(f"Error: {response.status_code}")
+            break
+        payload = response.json()
+        pulses.extend(payload.get("results", []))
+        url, params = payload.get("next"), None  # "next" already carries the query string
+        if not url:
+            break
+    return pulses
 
 # Function to Convert Data into LangChain Document Format
 def process_pulses(pulses):
@@ -37,9 +49,12 @@ def process_pulses(pulses):
         doc = Document(
             page_content=pulse.get("description", "No description available."),
             metadata={
+                "pulse_id": pulse.get("id"),
+                "source": SOURCE,
                 "title": pulse.get("name"),
                 "author": pulse.get("author_name"),
                 "created": pulse.get("created"),
+                "modified": pulse.get("modified"),
                 "tags": pulse.get("tags", []),
                 "indicators": [indicator["indicator"] for indicator in pulse.get("indicators", [])]
             }
@@ -48,39 +63,37 @@ def process_pulses(pulses):
 
     return documents
 
+def pulse_key(record):
+    # Keyed by pulse id; rows saved before ids were recorded fall back to title.
+    metadata = record.get("metadata") or {}
+    return metadata.get("pulse_id") or metadata.get("title")
+
 # Function to Save Data as JSON
 def save_to_json(documents):
     formatted_data = [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents]
 
-    try:
-        with open(JSON_FILE, "r") as file:
-            existing_data = json.load(file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        existing_data = []
-
-    # Append new data to existing file
-    existing_data.extend(formatted_data)
+    # Merge by pulse id instead of appending, so re-sent pulses replace their old copy.
+    # The modified_since cursor only re-sends pulses that changed, so a pulse's
+    # age says nothing about whether OTX still publishes it: never expire them.
+    stats = merge_keyed_records(JSON_FILE, formatted_data, pulse_key, retention_days=None)
 
-    with open(JSON_FILE, "w") as file:
-        json.dump(existing_data, file, indent=4)
-
-    print(f"✅ Data saved to {JSON_FILE} (Updated {len(formatted_data)} records)")
+    print(f"✅ Data saved to {JSON_FILE} ({stats['added']} new, {stats['updated']} updated, {stats['expired']} expired; {stats['total']} total)")
 
 # Function to Run the Full Process
 def run():
     print(f"🔄 Fetching data at {datetime.now()}")
-    pulses = fetch_pulses()
+    modified_since = load_feed_cursor(SOURCE)
+    pulses = fetch_pulses(modified_since)
     if pulses:
         documents = process_pulses(pulses)
         save_to_json(documents)
+        # Advance the cursor to the newest modification we have seen
+        latest = max((pulse.get("modified") or "" for pulse in pulses), default="")
+        if latest and latest > (modified_since or ""):
+            save_feed_cursor(SOURCE, latest)
+    else:
+        print("⚠️ No new or modified pulses.")
 
-# Schedule to Run Every 5 Hours
-schedule.every(5).hours.do(run)
-
-# Initial Run
-run()
-
-# Keep Running in Background
-while True:
-    schedule.run_pending()
-    time.sleep(60)
+# Scheduling lives in ingest.py; running this file directly does a single fetch.
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,48 @@
+import os
+import sys
+from config import PRELOAD_RETRIEVER
+
+# When preloading, app.py loads the retriever's weights in the master so every
+# worker inherits the already-loaded embedding model. Nothing fork-unsafe (a
+# torch encode, a MongoClient) is started there.
+preload_app = PRELOAD_RETRIEVER
+
+# More than one thread turns gunicorn's default sync worker into gthread, so a
+# worker serves concurrent requests that share its model (and its embedding
+# micro-batches). Ignored by the uvicorn worker of asgi.py.
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+def on_starting(server):
+    # Chat indexes and the one-off move of inline chat history into message
+    # buckets happen once in the master, before any worker writes a turn.
+    from pymongo import MongoClient
+    from config import MONGODB_URI, MONGODB_DB, MONGODB_COLLECTION
+    from chat_store import prepare_chat_collection
+    client = MongoClient(MONGODB_URI)
+    try:
+        prepare_chat_collection(client[MONGODB_DB][MONGODB_COLLECTION])
+    finally:
+        client.close()
+
+def post_fork(server, worker):
+    # Connections opened in the master must not be shared across workers.
+    if PRELOAD_RETRIEVER:
+        from retriever import get_retriever_service
+        get_retriever_service().reset_connections()
+        # app.py was imported by the master; asgi.py connects in its startup hook.
+        flask_app = sys.modules.get("app")
+        if flask_app is not None:
+            flask_app.connect_chat_store()
+
+def post_worker_init(worker):
+    # Load the model (if not preloaded) and open the index before serving traffic.
+    from retriever import get_retriever_service
+    try:
+        get_retriever_service().warm_up()
+    except Exception as e:
+        worker.log.error("Retriever warm-up failed: %s", e)
+
+def worker_exit(server, worker):
+    # Flush chat turns still queued in the write-behind writer (app.py).
+    from chat_store import drain_chat_writers
+    drain_chat_writers()
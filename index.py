@@ -1,80 +1,355 @@
 import json
 import os
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-from config import PINECONE_API_KEY, INDEX_NAME, EMBEDDING_MODEL
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from embedder import get_embedder
+from cache import bump_index_version
+from vector_backend import LocalVectorIndex, get_vector_index
+from config import (
+    EMBEDDING_MODEL, INDEX_VERSION_FILE,
+    INDEX_ENCODE_BATCH_SIZE, INDEX_UPSERT_BATCH_SIZE, INDEX_UPSERT_MAX_BYTES,
+    INDEX_UPSERT_WORKERS, INDEX_UPSERT_RETRIES, INDEX_DELTA_BATCH_SIZE, PROCESSED_IDS_DB, VECTOR_BACKEND, LOCAL_INDEX_DIR,
+    EMBEDDING_BACKEND,
+)
+from processed_store import ProcessedStore, load_legacy_ids
+from document_store import DocumentStore, import_legacy_json, index_cursor
+from lexical_index import LexicalIndex, TOKENIZER_VERSION
+from chunker import TextChunker, chunk_ids
+
+legacy_processed_ids_file = "processed_ids.json"
+
+# Pinecone accepts at most 1000 IDs per delete request.
+DELETE_BATCH_SIZE = 1000
+
+# -------------------- Initialize Vector Index --------------------
+def get_index():
+    # Pinecone or the local index, per VECTOR_BACKEND in config.py.
+    return get_vector_index()
 
-# -------------------- Initialize Pinecone --------------------
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index(INDEX_NAME)
+def processed_db_path():
+    # Each backend tracks its own contents, so switching backends re-indexes.
+    if VECTOR_BACKEND == "local":
+        os.makedirs(LOCAL_INDEX_DIR, exist_ok=True)
+        return os.path.join(LOCAL_INDEX_DIR, "processed_ids.db")
+    return PROCESSED_IDS_DB
+
+def flush_index(index):
+    # The local backend buffers writes; Pinecone applies them immediately.
+    if hasattr(index, "flush"):
+        index.flush()
 
 # -------------------- Load the Embedding Model --------------------
-model = SentenceTransformer(EMBEDDING_MODEL)
-
-# -------------------- Load Processed Record IDs --------------------
-processed_ids_file = "processed_ids.json"
-if os.path.exists(processed_ids_file):
-    with open(processed_ids_file, "r") as f:
-        processed_ids = json.load(f)
-else:
-    processed_ids = []
-
-# -------------------- Load JSON Data --------------------
-with open("data.json", "r") as f:
-    records = json.load(f)
-
-# -------------------- Generate Embeddings for New Records --------------------
-new_vectors = []
-new_ids = []
-print("Generating embeddings for new records...")
-for i, record in enumerate(records):
-    record_id = f"record_{i}"
-    if record_id in processed_ids:
-        continue  # Skip records that have already been processed
-
-    text = record.get("page_content", "")
-    if not text:
-        continue
-
-    # Generate embedding using the specified model
-    embedding = model.encode(text).tolist()
-
-    # For debugging: print the first 5 dimensions for the first 2 new records
-    if len(new_vectors) < 2:
-        print(f"Embedding for {record_id} (first 5 dims): {embedding[:5]} ... (Total dimensions: {len(embedding)})")
-
-    # Get metadata (if any) and ensure it contains a 'text' key with the document content
-    metadata = record.get("metadata", {})
-    metadata["text"] = text
-
-    new_vectors.append((record_id, embedding, metadata))
-    new_ids.append(record_id)
-
-if new_vectors:
-    upsert_response = index.upsert(vectors=new_vectors)
-    print(f"Successfully inserted {len(new_vectors)} new vectors into Pinecone!")
-    processed_ids.extend(new_ids)
-    with open(processed_ids_file, "w") as f:
-        json.dump(processed_ids, f)
-else:
-    print("No new records to process.")
+def load_model():
+    # Same embedder (and EMBEDDING_BACKEND runtime) the retriever queries with.
+    return get_embedder()
+
+def encode_texts(model, texts, batch_size=INDEX_ENCODE_BATCH_SIZE):
+    # One call per batch; unit-normalized float32 numpy rows.
+    return model.encode(texts, batch_size=batch_size)
+
+def chunking_signature(model) -> str:
+    # Stored with the processed IDs; a change means every record is re-embedded.
+    # Built from the chunker the model actually gets (limits capped to its
+    # sequence length) and the embedding runtime, whose vectors differ too.
+    name = getattr(model, "model_name", EMBEDDING_MODEL)
+    backend = getattr(model, "backend", EMBEDDING_BACKEND)
+    return f"{name}:{backend}:{TextChunker.for_model(model).signature}"
+
+# -------------------- Plan the Delta --------------------
+def plan_changes(entries, indexed, reindex=False, rechunked=frozenset()):
+    # entries: (offset, entry) pairs streamed from the document store since
+    # this index's cursor; indexed: {id: fingerprint} from the processed store.
+    # Later entries for an id supersede earlier ones. With reindex, records
+    # are re-embedded even if unchanged, except those in `rechunked` (already
+    # redone by this re-chunk). Returns (pending, stale_ids, end_offset).
+    pending, deleted, end_offset = {}, set(), None
+    for end_offset, entry in entries:
+        doc_id = entry["id"]
+        if entry["op"] == "delete":
+            pending.pop(doc_id, None)
+            deleted.add(doc_id)
+            continue
+        deleted.discard(doc_id)
+        if indexed.get(doc_id) == entry["fingerprint"] and (not reindex or doc_id in rechunked):
+            pending.pop(doc_id, None)
+            continue  # Skip records that have already been processed
+
+        # Ensure the metadata contains a 'text' key with the document content
+        text = entry["page_content"]
+        metadata = dict(entry.get("metadata") or {})
+        metadata["text"] = text
+        pending[doc_id] = (doc_id, text, metadata, entry["fingerprint"])
+
+    stale_ids = [doc_id for doc_id in deleted if doc_id in indexed]
+    return list(pending.values()), stale_ids, end_offset
+
+def iter_batches(entries, size):
+    # Groups (offset, entry) pairs into lists of about `size`. Entries of one
+    # compressed member share a resume offset, so a batch only ends where the
+    # offset changes; the cursor never lands inside a member.
+    batch = []
+    for item in entries:
+        if len(batch) >= size and item[0] != batch[-1][0]:
+            yield batch
+            batch = []
+        batch.append(item)
+    if batch:
+        yield batch
+
+def backfill_lexical(lexical, documents, store):
+    # Records indexed before the lexical index existed would only reach it on
+    # a re-embed; copy the indexed ones over from the document store once.
+    # Terms stored under older tokenizer rules are recomputed once as well.
+    if lexical.get_setting("tokenizer") != TOKENIZER_VERSION:
+        if len(lexical):
+            print(f"Re-tokenized {lexical.retokenize()} lexical index documents.")
+        else:
+            lexical.set_setting("tokenizer", TOKENIZER_VERSION)
+    if lexical.get_setting("backfilled"):
+        return
+    added = 0
+    entries = enumerate(documents.iter_documents())
+    for batch in iter_batches(entries, INDEX_DELTA_BATCH_SIZE):
+        indexed = store.fingerprints({entry["id"] for _, entry in batch})
+        for _, entry in batch:
+            if indexed.get(entry["id"]) == entry["fingerprint"] and entry["id"] not in lexical:
+                lexical.add(entry["id"], entry["page_content"], entry.get("metadata") or {})
+                added += 1
+        lexical.flush()
+    if added:
+        print(f"Backfilled {added} indexed records into the lexical index.")
+    lexical.set_setting("backfilled", str(added))
+    lexical.flush()
+
+def delete_vectors(index, ids):
+    for start in range(0, len(ids), DELETE_BATCH_SIZE):
+        index.delete(ids=ids[start:start + DELETE_BATCH_SIZE])
+
+def migrate_legacy_ids(index, store):
+    # Vectors written under positional "record_N" IDs are re-indexed under
+    # content-hash IDs, so remove the old ones once. Only Pinecone ever held
+    # them; completion is recorded in its processed store and the tracked
+    # processed_ids.json is left alone.
+    if VECTOR_BACKEND != "pinecone" or isinstance(index, LocalVectorIndex):
+        return
+    if store.get_setting("legacy_ids_migrated"):
+        return
+    legacy_ids = load_legacy_ids(legacy_processed_ids_file)
+    if legacy_ids:
+        print(f"Removing {len(legacy_ids)} vectors with legacy positional IDs...")
+        delete_vectors(index, legacy_ids)
+    store.set_setting("legacy_ids_migrated", str(len(legacy_ids)))
+
+# -------------------- Size-Bounded Upsert Chunks --------------------
+def vector_size(vector) -> int:
+    # Rough wire size of one (id, values, metadata) entry.
+    record_id, values, metadata = vector
+    return len(record_id) + 12 * len(values) + len(json.dumps(metadata))
+
+def chunk_vectors(vectors, max_count=INDEX_UPSERT_BATCH_SIZE, max_bytes=INDEX_UPSERT_MAX_BYTES):
+    # Split into upsert requests bounded by both vector count and payload size.
+    chunk, chunk_bytes = [], 0
+    for vector in vectors:
+        size = vector_size(vector)
+        if chunk and (len(chunk) >= max_count or chunk_bytes + size > max_bytes):
+            yield chunk
+            chunk, chunk_bytes = [], 0
+        chunk.append(vector)
+        chunk_bytes += size
+    if chunk:
+        yield chunk
+
+def upsert_with_retry(index, chunk, retries=INDEX_UPSERT_RETRIES):
+    for attempt in range(retries + 1):
+        try:
+            index.upsert(vectors=chunk)
+            return [vector[0] for vector in chunk]
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = 2 ** attempt
+            print(f"Upsert of {len(chunk)} vectors failed ({e}); retrying in {delay}s...")
+            time.sleep(delay)
+
+def rechunk_start(store, signature) -> float:
+    # When the re-chunk to `signature` began; kept across failed runs so they
+    # resume it rather than start over.
+    progress = json.loads(store.get_setting("rechunk") or "{}")
+    if progress.get("signature") != signature:
+        progress = {"signature": signature, "started": time.time()}
+        store.set_setting("rechunk", json.dumps(progress))
+    return progress["started"]
+
+# -------------------- Indexing Pipeline --------------------
+def run_indexing(index=None, model=None, documents=None):
+    index = index or get_index()
+    documents = documents or DocumentStore()
+    import_legacy_json(documents)
+
+    store = ProcessedStore(processed_db_path())
+    # BM25/IOC index for hybrid retrieval, kept in step with the vectors.
+    lexical = LexicalIndex()
+    cursor_name = index_cursor()
+    try:
+        migrate_legacy_ids(index, store)
+        backfill_lexical(lexical, documents, store)
+        # The signature needs the loaded model (tokenizer, sequence length);
+        # an empty store has nothing to re-chunk, so it skips the check.
+        reindex, rechunk_started = False, None
+        if len(store):
+            model = model or load_model()
+            signature = chunking_signature(model)
+            reindex = store.get_setting("chunking") != signature
+        if reindex:
+            rechunk_started = rechunk_start(store, signature)
+            print("Chunking settings changed; re-chunking all records...")
+        start_offset = 0 if reindex else documents.read_cursor(cursor_name)
+        # The delta is planned and indexed a bounded batch of log entries at a
+        # time, so a full re-chunk never holds the whole corpus in memory. The
+        # cursor moves past each batch once all of it made it into the index;
+        # after a failure the next run re-reads from there, skipping finished
+        # records. A re-chunk re-reads the whole log but skips records marked
+        # since it started, so a failed batch only redoes what is left.
+        upserted, removed, failed = 0, 0, 0
+        for batch in iter_batches(documents.iter_entries(start_offset), INDEX_DELTA_BATCH_SIZE):
+            ids = {entry["id"] for _, entry in batch}
+            rechunked = frozenset()
+            if reindex:
+                rechunked = {doc_id for doc_id, at in store.indexed_at(ids).items() if at >= rechunk_started}
+            pending, stale_ids, end_offset = plan_changes(batch, store.fingerprints(ids), reindex, rechunked)
+            chunk_counts = store.chunk_counts(ids)
+            if stale_ids:
+                print(f"Deleting {len(stale_ids)} stale records...")
+                delete_vectors(index, [
+                    vector_id for doc_id in stale_ids for vector_id in chunk_ids(doc_id, chunk_counts.get(doc_id, 1))
+                ])
+                flush_index(index)
+                store.remove(stale_ids)
+                lexical.remove(stale_ids)
+                removed += len(stale_ids)
+            if pending:
+                model = model or load_model()
+                batch_upserted, failed = embed_and_upsert(index, model, pending, store, lexical, chunk_counts)
+                upserted += batch_upserted
+            lexical.flush()
+            if failed:
+                break
+            documents.write_cursor(cursor_name, end_offset)
+        if not upserted and not removed and not failed:
+            print("No new or changed records to process.")
+        if upserted or removed:
+            # Let the API drop cached retrievals and answers built on the old index.
+            bump_index_version(INDEX_VERSION_FILE)
+        if not failed and model is not None:
+            store.set_setting("chunking", chunking_signature(model))
+        return upserted
+    finally:
+        store.close()
+
+def embed_and_upsert(index, model, pending, store, lexical, chunk_counts=None):
+    # Records are split into token windows; a record is marked processed (and
+    # added to the lexical index) once all of its chunks have been upserted.
+    chunker = TextChunker.for_model(model)
+    parents, chunks, superseded = {}, [], []
+    for doc_id, text, metadata, fingerprint in pending:
+        pieces = chunker.chunk(doc_id, text, metadata)
+        parents[doc_id] = {"text": text, "metadata": metadata, "fingerprint": fingerprint,
+                           "count": len(pieces), "remaining": len(pieces)}
+        chunks.extend((chunk_id, chunk_text, chunk_metadata, doc_id) for chunk_id, chunk_text, chunk_metadata in pieces)
+        # A shorter new version leaves trailing chunks of the old one behind.
+        superseded.extend(chunk_ids(doc_id, (chunk_counts or {}).get(doc_id, 0))[len(pieces):])
+    if superseded:
+        delete_vectors(index, superseded)
+    chunk_parent = {chunk_id: doc_id for chunk_id, _, _, doc_id in chunks}
+
+    print(f"Generating embeddings for {len(chunks)} chunks of {len(pending)} new or changed records...")
+    started = time.perf_counter()
+    encode_seconds = 0.0
+    completed, upserted_vectors, failed = [], 0, 0
+
+    with ThreadPoolExecutor(max_workers=INDEX_UPSERT_WORKERS) as executor:
+        in_flight = set()
+
+        def collect(done):
+            nonlocal failed, upserted_vectors
+            for future in done:
+                try:
+                    ids = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Upsert chunk failed permanently: {e}")
+                    continue
+                upserted_vectors += len(ids)
+                finished = []
+                for chunk_id in ids:
+                    parent = parents[chunk_parent[chunk_id]]
+                    parent["remaining"] -= 1
+                    if parent["remaining"] == 0:
+                        finished.append(chunk_parent[chunk_id])
+                # Recorded as records finish so an interrupted run doesn't redo them.
+                store.mark((doc_id, parents[doc_id]["fingerprint"], parents[doc_id]["count"]) for doc_id in finished)
+                for doc_id in finished:
+                    parent = parents[doc_id]
+                    lexical.add(doc_id, parent["text"], {key: value for key, value in parent["metadata"].items() if key != "text"})
+                completed.extend(finished)
+
+        for start in range(0, len(chunks), INDEX_ENCODE_BATCH_SIZE):
+            batch = chunks[start:start + INDEX_ENCODE_BATCH_SIZE]
+            encode_started = time.perf_counter()
+            embeddings = encode_texts(model, [text for _, text, _, _ in batch])
+            encode_seconds += time.perf_counter() - encode_started
+
+            if start == 0:
+                print(f"Embedding for {batch[0][0]} (first 5 dims): {embeddings[0][:5].tolist()} ... (Total dimensions: {embeddings.shape[1]})")
+
+            vectors = [
+                (chunk_id, embedding.tolist(), metadata)
+                for (chunk_id, _, metadata, _), embedding in zip(batch, embeddings)
+            ]
+            for chunk in chunk_vectors(vectors):
+                # Bound the number of outstanding upserts so encoding can't run far ahead.
+                if len(in_flight) >= INDEX_UPSERT_WORKERS * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(executor.submit(upsert_with_retry, index, chunk))
+
+        collect(wait(in_flight)[0])
+
+    flush_index(index)
+    elapsed = time.perf_counter() - started
+
+    print(f"Successfully upserted {upserted_vectors} vectors ({len(completed)} records) into the {VECTOR_BACKEND} index!")
+    if failed:
+        print(f"{failed} upsert chunk(s) failed; their records will be retried on the next run.")
+    print(
+        f"Throughput: {len(chunks) / encode_seconds if encode_seconds else 0:.1f} chunks/s encode, "
+        f"{upserted_vectors / elapsed if elapsed else 0:.1f} vectors/s end-to-end ({elapsed:.2f}s total)"
+    )
+    return len(completed), failed
 
 # -------------------- Sample Query Demonstration --------------------
-sample_query = "What suspicious IP addresses have been reported?"
-print("\nProcessing sample query:")
-print("User Query:", sample_query)
-query_embedding = model.encode(sample_query).tolist()
-print("Query Embedding (first 5 dims):", query_embedding[:5])
-query_results = index.query(
-    vector=query_embedding,
-    top_k=5,
-    include_metadata=True
-)
-print("\nQuery Results:")
-for match in query_results["matches"]:
-    print(f"ID: {match['id']}, Score: {match['score']}")
-    if "title" in match.get("metadata", {}):
-        print(f"Title: {match['metadata']['title']}")
-    snippet = match['metadata'].get("snippet", "") or "No snippet available."
-    print("Snippet:", snippet)
-    print("-" * 40)
+def run_sample_query(index, model):
+    sample_query = "What suspicious IP addresses have been reported?"
+    print("\nProcessing sample query:")
+    print("User Query:", sample_query)
+    query_embedding = encode_texts(model, [sample_query])[0].tolist()
+    print("Query Embedding (first 5 dims):", query_embedding[:5])
+    query_results = index.query(
+        vector=query_embedding,
+        top_k=5,
+        include_metadata=True
+    )
+    print("\nQuery Results:")
+    for match in query_results["matches"]:
+        print(f"ID: {match['id']}, Score: {match['score']}")
+        if "title" in match.get("metadata", {}):
+            print(f"Title: {match['metadata']['title']}")
+        snippet = match['metadata'].get("snippet", "") or "No snippet available."
+        print("Snippet:", snippet)
+        print("-" * 40)
+
+if __name__ == "__main__":
+    index = get_index()
+    model = load_model()
+    run_indexing(index, model)
+    run_sample_query(index, model)
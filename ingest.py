@@ -0,0 +1,160 @@
+import hashlib
+import importlib
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from combine_json_file import combine_json_files
+from document_store import DocumentStore, index_cursor
+from config import INGEST_INTERVAL_SECONDS, INGEST_JITTER_SECONDS, INGEST_TIMEOUT_SECONDS
+
+# Feed plugins: each module exposes run() and the JSON_FILE it writes.
+FEEDS = {
+    "urlhaus": "fetch_URlHaus",
+    "abuseipdb": "fetch_abuseIP",
+    "otx": "fetch_otx_pulses",
+    "ibm": "fetch_IBM",
+}
+
+DATA_DIRECTORY = "./"
+# Pause between attempts while indexing keeps failing (e.g. Pinecone is down).
+INDEX_RETRY_SECONDS = 60
+
+def file_fingerprint(path: str):
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+class Feed:
+    def __init__(self, name: str, module_name: str):
+        self.name = name
+        self.module = importlib.import_module(module_name)
+        self.interval = int(os.getenv(f"INGEST_INTERVAL_{name.upper()}", INGEST_INTERVAL_SECONDS))
+        self.next_run = 0.0
+        self.future = None
+        self.started_at = None
+        self.timed_out = False
+
+    def run(self) -> bool:
+        # Returns True when the feed wrote different documents than before.
+        before = file_fingerprint(self.module.JSON_FILE)
+        self.module.run()
+        return file_fingerprint(self.module.JSON_FILE) != before
+
+def load_feeds() -> list:
+    feeds = []
+    for name, module_name in FEEDS.items():
+        try:
+            feeds.append(Feed(name, module_name))
+        except Exception as e:
+            print(f"Skipping feed {name}: failed to load {module_name} ({e})")
+    return feeds
+
+def reindex() -> bool:
+    # Returns True when records are still waiting to be indexed afterwards
+    # (a failed or partly failed run), so the caller retries.
+    print("Combining feed output and indexing new documents...")
+    store = DocumentStore()
+    if not combine_json_files(DATA_DIRECTORY, store) and not store.behind(index_cursor()):
+        print("Document store unchanged and fully indexed; skipping indexing.")
+        return False
+    from index import run_indexing  # Loads the embedding model; only needed once feeds change.
+    run_indexing(documents=store)
+    # Drop superseded/deleted entries from the log once every consumer has caught up.
+    store.compact()
+    return store.behind(index_cursor())
+
+class IngestionDaemon:
+    # Runs every feed on its own interval (plus jitter so feeds don't fire in
+    # lockstep), each on its own worker thread. A feed that overruns its
+    # timeout is reported and not rescheduled until it returns. Indexing runs
+    # on a separate single worker after a feed produced new documents, and is
+    # retried while the index cursor lags the document store.
+    def __init__(self, feeds, timeout: int = INGEST_TIMEOUT_SECONDS, jitter: int = INGEST_JITTER_SECONDS):
+        self.feeds = feeds
+        self.timeout = timeout
+        self.jitter = jitter
+        self.feed_pool = ThreadPoolExecutor(max_workers=max(1, len(feeds)), thread_name_prefix="feed")
+        self.index_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index")
+        self.index_future = None
+        self.pending_index = False
+        self.index_retry_at = 0.0
+
+    def _schedule_next(self, feed):
+        feed.next_run = time.time() + feed.interval + random.uniform(0, self.jitter)
+
+    def _check_feed(self, feed, now):
+        if feed.future is None:
+            if now >= feed.next_run:
+                print(f"Starting feed {feed.name}")
+                feed.started_at = now
+                feed.timed_out = False
+                feed.future = self.feed_pool.submit(feed.run)
+            return
+        if feed.future.done():
+            try:
+                if feed.future.result():
+                    print(f"Feed {feed.name} produced new documents.")
+                    self.pending_index = True
+                else:
+                    print(f"Feed {feed.name} had no changes.")
+            except Exception as e:
+                print(f"Feed {feed.name} failed: {e}")
+            feed.future = None
+            self._schedule_next(feed)
+        elif not feed.timed_out and now - feed.started_at > self.timeout:
+            feed.timed_out = True
+            print(f"Feed {feed.name} exceeded {self.timeout}s; it will not be rescheduled until it returns.")
+
+    def _check_index(self):
+        if self.index_future is not None and self.index_future.done():
+            try:
+                incomplete = self.index_future.result()
+            except Exception as e:
+                print(f"Indexing failed: {e}")
+                incomplete = True
+            if incomplete:
+                # The index cursor is still behind the store; retry even if no
+                # feed changes in the meantime.
+                print(f"Indexing incomplete; retrying in {INDEX_RETRY_SECONDS}s.")
+                self.pending_index = True
+                self.index_retry_at = time.time() + INDEX_RETRY_SECONDS
+            self.index_future = None
+        if self.pending_index and self.index_future is None and time.time() >= self.index_retry_at:
+            self.pending_index = False
+            self.index_future = self.index_pool.submit(reindex)
+
+    def tick(self):
+        now = time.time()
+        for feed in self.feeds:
+            self._check_feed(feed, now)
+        self._check_index()
+
+    def run_forever(self, poll_interval: float = 1.0):
+        print(f"Ingestion daemon started with feeds: {', '.join(feed.name for feed in self.feeds)}")
+        # Catch up on anything a previous run left unindexed.
+        self.pending_index = True
+        while True:
+            self.tick()
+            time.sleep(poll_interval)
+
+    def run_once(self, index: bool = True):
+        # Run every feed once concurrently, then index if anything changed.
+        for feed in self.feeds:
+            feed.next_run = 0.0
+            self._check_feed(feed, time.time())
+        wait([feed.future for feed in self.feeds if feed.future], timeout=self.timeout)
+        for feed in self.feeds:
+            if feed.future is not None and not feed.future.done():
+                print(f"Feed {feed.name} exceeded {self.timeout}s; skipping it this run.")
+                feed.future = None
+                continue
+            self._check_feed(feed, time.time())
+        if index and self.pending_index:
+            self.pending_index = False
+            reindex()
+
+if __name__ == "__main__":
+    IngestionDaemon(load_feeds()).run_forever()
@@ -0,0 +1,272 @@
+import ipaddress
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+from cache import IndexVersionWatcher
+from config import INDEX_VERSION_FILE
+from document_store import DocumentStore, legacy_documents
+
+# Indicator-of-compromise extraction shared by indexing and query parsing.
+
+IPV4_RE = re.compile(r"\b(?:(?:25[0-5]|2[0-4]\d|1?\d?\d)\.){3}(?:25[0-5]|2[0-4]\d|1?\d?\d)(?:/\d{1,2})?\b")
+URL_RE = re.compile(r"\b(?:https?|ftp)://[^\s\"'<>]+", re.IGNORECASE)
+HASH_RE = re.compile(r"\b(?:[a-f0-9]{64}|[a-f0-9]{40}|[a-f0-9]{32})\b", re.IGNORECASE)
+DOMAIN_RE = re.compile(r"\b(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z]{2,24}\b", re.IGNORECASE)
+
+# Free-text "domains" must end in a real TLD: any two-letter country code
+# that doesn't double as a common file extension, or a generic TLD from this
+# list. Keeps "node.js", "index.html" and "config.py" out of the indicators.
+GENERIC_TLDS = frozenset("""
+    com net org info biz edu gov mil int arpa name pro mobi asia tel travel
+    xyz top online site club shop store app dev cloud live life space website tech
+    icu cfd sbs lol buzz monster rest bond cyou click link work fun world today
+    support services digital network email host page win bid vip ltd group
+""".split())
+FILE_EXTENSIONS = frozenset("js ts py sh rs cs go md pl rb cc so db gz".split())
+# Product names that are spelled like domains.
+NOT_DOMAINS = frozenset(("asp.net", "vb.net", "ado.net"))
+
+# Metadata fields that hold indicators in the feed documents.
+IOC_FIELDS = ("ip", "url", "domain", "indicators")
+
+def normalize_ioc(value: str) -> str:
+    return value.strip().strip(".,;)]}>\"'").lower()
+
+def extract_iocs(text: str) -> set:
+    iocs = set()
+    for pattern in (URL_RE, IPV4_RE, HASH_RE):
+        iocs.update(normalize_ioc(match) for match in pattern.findall(text))
+    # Domains, excluding ones that are only the host part of a URL already matched
+    without_urls = URL_RE.sub(" ", text)
+    for match in DOMAIN_RE.findall(without_urls):
+        domain = normalize_ioc(match)
+        if looks_like_domain(domain):
+            iocs.add(domain)
+    return {ioc for ioc in iocs if ioc}
+
+def looks_like_domain(name: str) -> bool:
+    tld = name.rsplit(".", 1)[-1]
+    if name in NOT_DOMAINS:
+        return False
+    if len(tld) == 2:
+        return tld not in FILE_EXTENSIONS
+    return tld in GENERIC_TLDS
+
+def document_iocs(metadata: dict, text: str = "") -> set:
+    # Structured indicators from feed metadata plus any found in the text.
+    iocs = set()
+    for field in IOC_FIELDS:
+        value = metadata.get(field)
+        if isinstance(value, str) and value and value != "Unknown":
+            iocs.add(normalize_ioc(value))
+        elif isinstance(value, list):
+            iocs.update(normalize_ioc(item) for item in value if isinstance(item, str) and item)
+    if text:
+        iocs.update(extract_iocs(text))
+    return iocs
+
+# -------------------- In-memory IOC index --------------------
+# Exact hash lookups for every indicator, a binary prefix (radix) trie over
+# IP addresses so CIDR indicators match the addresses they contain, and a
+# reversed-label trie over domains so "example.com" matches its subdomains.
+
+class _PrefixTrie:
+    # Binary trie keyed by the leading bits of an address; each node can hold
+    # the doc ids of the network ending there.
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, network, doc_id):
+        node = self.root
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            node = node.setdefault((bits >> (width - 1 - i)) & 1, {})
+        node.setdefault("ids", set()).add(doc_id)
+
+    def covering(self, network):
+        # Networks that contain `network` (including itself): walk its prefix.
+        found = []
+        node = self.root
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen + 1):
+            if "ids" in node:
+                found.append((i, node["ids"]))
+            if i == network.prefixlen:
+                break
+            node = node.get((bits >> (width - 1 - i)) & 1)
+            if node is None:
+                break
+        return found
+
+    def within(self, network, limit=1000):
+        # Networks/addresses inside `network`: collect its subtree.
+        node = self.root
+        bits = int(network.network_address)
+        width = network.max_prefixlen
+        for i in range(network.prefixlen):
+            node = node.get((bits >> (width - 1 - i)) & 1)
+            if node is None:
+                return set()
+        found, stack = set(), [node]
+        while stack and len(found) < limit:
+            current = stack.pop()
+            found.update(current.get("ids", ()))
+            stack.extend(child for key, child in current.items() if key != "ids")
+        return found
+
+class _DomainTrie:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, domain, doc_id):
+        node = self.root
+        for label in reversed(domain.split(".")):
+            node = node.setdefault(label, {})
+        node.setdefault("\0ids", set()).add(doc_id)
+
+    def covering(self, domain):
+        # Indicators equal to the domain or any parent domain of it.
+        found = []
+        node = self.root
+        labels = list(reversed(domain.split(".")))
+        for depth, label in enumerate(labels, start=1):
+            node = node.get(label)
+            if node is None:
+                break
+            if "\0ids" in node:
+                found.append((".".join(reversed(labels[:depth])), node["\0ids"]))
+        return found
+
+def _parse_network(value):
+    try:
+        return ipaddress.ip_network(value, strict=False)
+    except ValueError:
+        return None
+
+def _host_of(value):
+    if "://" in value:
+        return (urlsplit(value).hostname or "").lower()
+    return value
+
+class IOCIndex:
+    def __init__(self):
+        self.exact = {}     # normalized indicator -> set of doc ids
+        self.networks = {4: _PrefixTrie(), 6: _PrefixTrie()}  # one trie per IP version
+        self.domains = _DomainTrie()
+        self.records = {}   # doc id -> summary returned to callers
+        self.built_at = None
+
+    def add(self, doc_id, text, metadata):
+        iocs = document_iocs(metadata, text)
+        if not iocs:
+            return
+        self.records[doc_id] = {
+            "id": doc_id,
+            "page_content": text,
+            "metadata": {key: value for key, value in metadata.items() if key != "indicators"},
+        }
+        for ioc in iocs:
+            self.exact.setdefault(ioc, set()).add(doc_id)
+            network = _parse_network(ioc)
+            if network is not None:
+                self.networks[network.version].insert(network, doc_id)
+                continue
+            host = _host_of(ioc)
+            if host and DOMAIN_RE.fullmatch(host):
+                self.domains.insert(host, doc_id)
+
+    @classmethod
+    def from_documents(cls, documents):
+        # documents: iterable of store entries ({"id", "page_content", "metadata"}).
+        index = cls()
+        for entry in documents:
+            index.add(entry["id"], entry["page_content"], entry.get("metadata") or {})
+        index.built_at = time.time()
+        return index
+
+    def lookup(self, indicator: str) -> list:
+        # Returns [{"match": kind, "matched": indicator, "record": {...}}].
+        value = normalize_ioc(indicator)
+        hits = {}
+
+        def collect(kind, matched, ids):
+            for doc_id in ids:
+                hits.setdefault(doc_id, (kind, matched))
+
+        collect("exact", value, self.exact.get(value, ()))
+        network = _parse_network(value)
+        if network is not None:
+            networks = self.networks[network.version]
+            for prefixlen, ids in networks.covering(network):
+                covering = ipaddress.ip_network((network.network_address, prefixlen), strict=False)
+                collect("exact" if prefixlen == network.prefixlen else "cidr", str(covering), ids)
+            if network.prefixlen < network.max_prefixlen:
+                collect("within", value, networks.within(network))
+        else:
+            host = _host_of(value)
+            if host and DOMAIN_RE.fullmatch(host):
+                for matched, ids in self.domains.covering(host):
+                    collect("domain" if matched != host else "exact", matched, ids)
+
+        return [
+            {"match": kind, "matched": matched, "record": self.records[doc_id]}
+            for doc_id, (kind, matched) in hits.items()
+            if doc_id in self.records
+        ]
+
+    def lookup_many(self, indicators) -> dict:
+        return {indicator: self.lookup(indicator) for indicator in indicators}
+
+    def stats(self) -> dict:
+        return {"indicators": len(self.exact), "records": len(self.records), "built_at": self.built_at}
+
+_ioc_index = None
+_ioc_lock = threading.Lock()
+_ioc_watcher = None
+_ioc_builder = None
+_ioc_build_again = False
+
+def _build_ioc_index() -> IOCIndex:
+    store = DocumentStore()
+    # A fresh checkout has no store until ingestion runs; use data.json then.
+    documents = store.iter_documents() if store.size() else legacy_documents()
+    return IOCIndex.from_documents(documents)
+
+def _rebuild_loop():
+    # Full-store scan off the request path; lookups keep using the previous
+    # index until the new one is swapped in. A bump mid-build runs one more.
+    global _ioc_index, _ioc_builder, _ioc_build_again
+    while True:
+        try:
+            index = _build_ioc_index()
+            with _ioc_lock:
+                _ioc_index = index
+        except Exception as e:
+            print(f"IOC index rebuild failed: {e}")
+        with _ioc_lock:
+            if not _ioc_build_again:
+                _ioc_builder = None
+                return
+            _ioc_build_again = False
+
+def get_ioc_index() -> IOCIndex:
+    # Process-wide index built from the document store; rebuilt in the
+    # background when the indexer publishes a new index version. Only the
+    # very first call builds on the caller's thread.
+    global _ioc_index, _ioc_watcher, _ioc_builder, _ioc_build_again
+    with _ioc_lock:
+        if _ioc_watcher is None:
+            _ioc_watcher = IndexVersionWatcher(INDEX_VERSION_FILE)
+        if _ioc_index is None:
+            _ioc_watcher.changed()
+            _ioc_index = _build_ioc_index()
+        elif _ioc_watcher.changed():
+            if _ioc_builder is not None:
+                _ioc_build_again = True
+            else:
+                _ioc_builder = threading.Thread(target=_rebuild_loop, name="ioc-rebuild", daemon=True)
+                _ioc_builder.start()
+        return _ioc_index
@@ -0,0 +1,232 @@
+import json
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from ioc_index import document_iocs, extract_iocs
+from config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B
+
+# BM25 inverted index plus an exact indicator -> document map, maintained by
+# index.py alongside the vector index and used by the hybrid retriever.
+# Documents (text, metadata) and their term counts and indicators are kept in
+# SQLite; only the postings live in memory. A reload rebuilds postings from
+# the stored term counts without re-tokenizing, off the lock, and swaps them
+# in, so searches keep answering from the previous set meanwhile.
+
+WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Bump when tokenize() or the indicator rules change; index.py then
+# recomputes the stored terms of every document once.
+TOKENIZER_VERSION = "2"
+
+def tokenize(text: str) -> list:
+    # Plain words plus whole indicators, so "45.12.3.4" is also one term.
+    return WORD_RE.findall(text.lower()) + sorted(extract_iocs(text))
+
+class _Postings:
+    def __init__(self):
+        self.postings = {}   # term -> {doc_id: term frequency}
+        self.lengths = {}
+        self.total_length = 0
+        self.iocs = {}       # indicator -> set of doc ids
+
+    def add(self, doc_id, terms: dict, iocs):
+        self.lengths[doc_id] = sum(terms.values())
+        self.total_length += self.lengths[doc_id]
+        for term, count in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+        for ioc in iocs:
+            self.iocs.setdefault(ioc, set()).add(doc_id)
+
+    def remove(self, doc_id, terms: dict, iocs):
+        self.total_length -= self.lengths.pop(doc_id, 0)
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self.postings[term]
+        for ioc in iocs:
+            matches = self.iocs.get(ioc)
+            if matches is not None:
+                matches.discard(doc_id)
+                if not matches:
+                    del self.iocs[ioc]
+
+class LexicalIndex:
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path = path
+        self._lock = threading.RLock()
+        self._reloader = None
+        self._reload_again = False
+        self.conn = self._connect()
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL,"
+            " terms TEXT NOT NULL, iocs TEXT NOT NULL)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        self.state = _Postings()
+        self.dirty = False
+        self.reload()
+
+    def _connect(self):
+        # WAL lets API workers read while index.py writes.
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def reopen(self):
+        # SQLite connections must not cross a fork (gunicorn post_fork).
+        with self._lock:
+            self.conn = self._connect()
+
+    # -------------------- Persistence --------------------
+    def reload(self):
+        # Builds fresh postings on its own connection, then swaps them in.
+        state = _Postings()
+        conn = sqlite3.connect(self.path)
+        try:
+            for doc_id, terms, iocs in conn.execute("SELECT id, terms, iocs FROM docs"):
+                state.add(doc_id, json.loads(terms), json.loads(iocs))
+        finally:
+            conn.close()
+        with self._lock:
+            self.state = state
+
+    def reload_async(self):
+        # For readers noticing an index bump: rebuild on a background thread
+        # instead of the request's. A bump during a rebuild triggers one more.
+        with self._lock:
+            if self._reloader is not None:
+                self._reload_again = True
+                return
+            self._reloader = threading.Thread(target=self._reload_loop, name="lexical-reload", daemon=True)
+            self._reloader.start()
+
+    def _reload_loop(self):
+        while True:
+            try:
+                self.reload()
+            except Exception as e:
+                print(f"Lexical index reload failed: {e}")
+            with self._lock:
+                if not self._reload_again:
+                    self._reloader = None
+                    return
+                self._reload_again = False
+
+    def flush(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            self.conn.commit()
+            self.dirty = False
+
+    def get_setting(self, name: str):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, name: str, value: str):
+        with self._lock:
+            self.conn.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, value))
+            self.dirty = True
+
+    # -------------------- Writes --------------------
+    def add(self, doc_id: str, text: str, metadata: dict):
+        terms = Counter(tokenize(text))
+        iocs = sorted(document_iocs(metadata, text))
+        with self._lock:
+            self.remove([doc_id])
+            self.conn.execute(
+                "INSERT INTO docs (id, text, metadata, terms, iocs) VALUES (?, ?, ?, ?, ?)",
+                (doc_id, text, json.dumps(metadata), json.dumps(terms), json.dumps(iocs)),
+            )
+            self.state.add(doc_id, terms, iocs)
+            self.dirty = True
+
+    def remove(self, ids):
+        with self._lock:
+            for doc_id in ids:
+                row = self.conn.execute("SELECT terms, iocs FROM docs WHERE id = ?", (doc_id,)).fetchone()
+                if row is None:
+                    continue
+                self.state.remove(doc_id, json.loads(row[0]), json.loads(row[1]))
+                self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+                self.dirty = True
+
+    def retokenize(self) -> int:
+        # Recompute stored terms and indicators from the stored text.
+        conn = sqlite3.connect(self.path)
+        count = 0
+        try:
+            for doc_id, text, metadata in conn.execute("SELECT id, text, metadata FROM docs"):
+                self.add(doc_id, text, json.loads(metadata))
+                count += 1
+        finally:
+            conn.close()
+        self.set_setting("tokenizer", TOKENIZER_VERSION)
+        self.flush()
+        return count
+
+    # -------------------- Search --------------------
+    def lookup_iocs(self, query: str) -> list:
+        # Exact indicator matches: one dict lookup per indicator in the query,
+        # ranked by their BM25 score for the query (ties by id).
+        with self._lock:
+            ids = set()
+            for ioc in extract_iocs(query):
+                ids.update(self.state.iocs.get(ioc, ()))
+            scores = self._scores(query, ids)
+        return sorted(ids, key=lambda doc_id: (-scores.get(doc_id, 0.0), doc_id))
+
+    def search(self, query: str, k: int = 10) -> list:
+        # Returns [(doc_id, bm25 score)], best first.
+        with self._lock:
+            return self._scores(query).most_common(k)
+
+    def _scores(self, query: str, ids=None) -> Counter:
+        # BM25 scores of every matching document, or only of `ids`.
+        state = self.state
+        n = len(state.lengths)
+        scores = Counter()
+        if not n or ids is not None and not ids:
+            return scores
+        avg_length = state.total_length / n
+        for term in set(tokenize(query)):
+            postings = state.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            matches = postings.items() if ids is None else ((doc_id, postings[doc_id]) for doc_id in ids if doc_id in postings)
+            for doc_id, tf in matches:
+                norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * state.lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (BM25_K1 + 1) / norm
+        return scores
+
+    def get(self, doc_id: str):
+        # Text and metadata are read from disk; only lexical-only hits need them.
+        with self._lock:
+            row = self.conn.execute("SELECT text, metadata FROM docs WHERE id = ?", (doc_id,)).fetchone()
+        if row is None:
+            return None
+        return {"text": row[0], "metadata": json.loads(row[1])}
+
+    def __contains__(self, doc_id: str) -> bool:
+        with self._lock:
+            return doc_id in self.state.lengths
+
+    def __len__(self):
+        with self._lock:
+            return len(self.state.lengths)
+
+def reciprocal_rank_fusion(rankings, k: int = 60) -> list:
+    # rankings: lists of doc ids, best first. Returns ids by fused score.
+    scores = Counter()
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (k + rank + 1)
+    return [doc_id for doc_id, _ in scores.most_common()]
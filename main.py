@@ -1,21 +1,14 @@
-from retriever import get_retriever
+from retriever import get_retriever_service
 from prompt_llm import build_prompt, get_llm_response
+from context_builder import get_context_builder
 
 def main():
     user_query = input("Enter your cybersecurity query: ")
-    retriever = get_retriever()
-    docs = retriever.invoke(user_query)
-    
-    context_parts = []
-    for doc in docs:
-        # Use the 'text' key from metadata if available; otherwise, use page_content.
-        text = doc.metadata.get("text") if "text" in doc.metadata and doc.metadata.get("text") else doc.page_content
-        if text:
-            context_parts.append(text)
-        else:
-            print("Found document with no text content. Skipping.")
-    context = "\n\n".join(context_parts)
+    docs = get_retriever_service().invoke(user_query)
     
+    context, stats = get_context_builder().build(docs)
+    print("Context:", stats)
+
     print("Retrieved Context (first 500 characters):\n", context[:500], "\n")
     
     final_prompt = build_prompt(user_query, context)
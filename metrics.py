@@ -0,0 +1,141 @@
+import bisect
+import contextvars
+import threading
+import time
+from config import METRICS_ENABLED
+
+# Latency histograms for the query hot path (embed, vector search, rerank,
+# prompt build, LLM, persistence) rendered in the Prometheus text format.
+# Values are per process: with several gunicorn workers each one reports its
+# own series, so scrape every worker or sum them downstream. When disabled,
+# timed() hands back a shared no-op and nothing is recorded.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = METRICS_ENABLED):
+        self.enabled = enabled
+        self.histograms = {}   # (name, labels) -> Histogram
+        self.help = {}
+        self.gauges = {}       # name -> (help, callable returning a number)
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float, help_text: str = "", **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+                self.help.setdefault(name, help_text)
+            histogram.observe(value)
+
+    def gauge(self, name: str, help_text: str, func):
+        # Sampled at scrape time, e.g. queue depths.
+        self.gauges[name] = (help_text, func)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            by_name = {}
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                by_name.setdefault(name, []).append((labels, histogram))
+            for name, series in by_name.items():
+                lines.append(f"# HELP {name} {self.help.get(name) or name}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series:
+                    cumulative = 0
+                    for bound, count in zip(list(histogram.buckets) + ["+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {histogram.total}")
+                    lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+        for name, (help_text, func) in sorted(self.gauges.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+registry = MetricsRegistry()
+
+# Stage timings of the request being handled, for the Server-Timing header.
+# asyncio.to_thread copies the context, so stages run in worker threads still
+# land in the same dict.
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+def start_request() -> dict:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+def request_timings() -> dict:
+    return _request_timings.get() or {}
+
+def record_stage(stage: str, seconds: float):
+    if not registry.enabled:
+        return
+    registry.observe("rag_stage_seconds", seconds, "Time spent per query pipeline stage.", stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds * 1000
+
+class _StageTimer:
+    __slots__ = ("stage", "started")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record_stage(self.stage, time.perf_counter() - self.started)
+        return False
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NOOP = _NoopTimer()
+
+def timed(stage: str):
+    # with timed("embed"): ...
+    return _StageTimer(stage) if registry.enabled else _NOOP
+
+def observe_request(endpoint: str, seconds: float):
+    registry.observe("rag_request_seconds", seconds, "End-to-end request latency.", endpoint=endpoint)
+
+def server_timing_header(timings: dict, total_ms: float = None) -> str:
+    # Server-Timing: embed;dur=12.1, vector_search;dur=40.3, total;dur=...
+    parts = [f"{stage};dur={ms:.1f}" for stage, ms in timings.items()]
+    if total_ms is not None:
+        parts.append(f"total;dur={total_ms:.1f}")
+    return ", ".join(parts)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
@@ -0,0 +1,82 @@
+import json
+from retriever import get_retriever_service, document_ids
+from context_builder import get_context_builder
+from metrics import timed
+from prompt_llm import (
+    build_prompt, get_cached_llm_response, lookup_cached_answer,
+    store_cached_answer, stream_llm_response,
+    aget_cached_llm_response, astream_llm_response,
+)
+
+def build_context(docs) -> str:
+    # Deduplicated, token-budgeted context from the retrieved documents.
+    return get_context_builder().build(docs)[0]
+
+def _prepared(user_query: str, docs, query_embedding, retrieval: dict) -> dict:
+    with timed("prompt_build"):
+        prompt = build_prompt(user_query, build_context(docs))
+    return {
+        "docs": docs,
+        "prompt": prompt,
+        "query_embedding": query_embedding,
+        "doc_ids": document_ids(docs),
+        "retrieval": retrieval,
+    }
+
+def prepare_query(user_query: str) -> dict:
+    # Retrieval and prompt construction shared by the blocking and streaming paths.
+    service = get_retriever_service()
+    docs, retrieval = service.retrieve(user_query)
+    return _prepared(user_query, docs, service.embed_query(user_query), retrieval)
+
+def answer_query(user_query: str) -> dict:
+    prepared = prepare_query(user_query)
+    answer, cached = get_cached_llm_response(
+        prepared["prompt"], prepared["query_embedding"], prepared["doc_ids"]
+    )
+    return {"answer": answer, "docs": prepared["docs"], "cached": cached, "retrieval": prepared["retrieval"]}
+
+def stream_answer(user_query: str):
+    # Yields answer text pieces; a cache hit is yielded as a single piece.
+    prepared = prepare_query(user_query)
+    cached = lookup_cached_answer(prepared["query_embedding"], prepared["doc_ids"])
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    for token in stream_llm_response(prepared["prompt"]):
+        parts.append(token)
+        yield token
+    store_cached_answer(prepared["query_embedding"], prepared["doc_ids"], "".join(parts).strip())
+
+# -------------------- Async variants (asgi.py) --------------------
+async def aprepare_query(user_query: str) -> dict:
+    service = get_retriever_service()
+    docs, retrieval = await service.aretrieve(user_query)
+    return _prepared(user_query, docs, await service.aembed_query(user_query), retrieval)
+
+async def aanswer_query(user_query: str) -> dict:
+    prepared = await aprepare_query(user_query)
+    answer, cached = await aget_cached_llm_response(
+        prepared["prompt"], prepared["query_embedding"], prepared["doc_ids"]
+    )
+    return {"answer": answer, "docs": prepared["docs"], "cached": cached, "retrieval": prepared["retrieval"]}
+
+async def astream_answer(user_query: str):
+    prepared = await aprepare_query(user_query)
+    cached = lookup_cached_answer(prepared["query_embedding"], prepared["doc_ids"])
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async for token in astream_llm_response(prepared["prompt"]):
+        parts.append(token)
+        yield token
+    store_cached_answer(prepared["query_embedding"], prepared["doc_ids"], "".join(parts).strip())
+
+def sse_event(data: dict, event: str = None) -> str:
+    # Format one server-sent event for the /query/stream endpoints.
+    message = f"event: {event}\n" if event else ""
+    return message + f"data: {json.dumps(data)}\n\n"
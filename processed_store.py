@@ -0,0 +1,83 @@
+import json
+import os
+import sqlite3
+import time
+
+# On-disk record of which document IDs are in the vector index and the
+# fingerprint of the content they were indexed from. Replaces the old
+# processed_ids.json list (linear membership checks, positional IDs).
+
+# Stay under SQLite's default limit on bound parameters per statement.
+SQLITE_MAX_PARAMS = 500
+
+class ProcessedStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed ("
+            " id TEXT PRIMARY KEY,"
+            " fingerprint TEXT NOT NULL,"
+            " indexed_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(processed)")}
+        if "chunks" not in columns:
+            # Stores created before chunking hold one vector per record.
+            self.conn.execute("ALTER TABLE processed ADD COLUMN chunks INTEGER NOT NULL DEFAULT 1")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def _select(self, column: str, ids=None) -> dict:
+        # {id: column} for every record, or only for `ids`.
+        if ids is None:
+            return dict(self.conn.execute(f"SELECT id, {column} FROM processed"))
+        ids, result = list(ids), {}
+        for start in range(0, len(ids), SQLITE_MAX_PARAMS):
+            batch = ids[start:start + SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(batch))
+            result.update(self.conn.execute(f"SELECT id, {column} FROM processed WHERE id IN ({placeholders})", batch))
+        return result
+
+    def fingerprints(self, ids=None) -> dict:
+        return self._select("fingerprint", ids)
+
+    def chunk_counts(self, ids=None) -> dict:
+        # Number of vectors each record was indexed as.
+        return self._select("chunks", ids)
+
+    def indexed_at(self, ids=None) -> dict:
+        return self._select("indexed_at", ids)
+
+    def mark(self, items):
+        # items: iterable of (id, fingerprint, chunks)
+        now = time.time()
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO processed (id, fingerprint, indexed_at, chunks) VALUES (?, ?, ?, ?)",
+                [(record_id, fingerprint, now, chunks) for record_id, fingerprint, chunks in items],
+            )
+
+    def remove(self, ids):
+        with self.conn:
+            self.conn.executemany("DELETE FROM processed WHERE id = ?", [(record_id,) for record_id in ids])
+
+    def get_setting(self, name: str):
+        row = self.conn.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def set_setting(self, name: str, value: str):
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO settings (name, value) VALUES (?, ?)", (name, value))
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM processed").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+def load_legacy_ids(path: str) -> list:
+    # IDs from the positional processed_ids.json ("record_0", ...), if present.
+    if not os.path.exists(path):
+        return []
+    with open(path, "r") as f:
+        return json.load(f)
@@ -1,34 +1,133 @@
-from groq import Groq
+import hashlib
+import time
+from groq import AsyncGroq, Groq
 from langchain.prompts import PromptTemplate
-from config import GROQ_API_KEY, GROQ_MODEL
+from cache import SemanticAnswerCache, IndexVersionWatcher
+from metrics import timed, record_stage
+from config import (
+    GROQ_API_KEY, GROQ_MODEL, LLM_TEMPERATURE, INDEX_VERSION_FILE,
+    ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD,
+)
 
 # Instantiate the Groq client using the API key from config
 client = Groq(
     api_key=GROQ_API_KEY,
 )
+# Async client for the ASGI app; shares nothing with the sync client above.
+async_client = AsyncGroq(
+    api_key=GROQ_API_KEY,
+)
 
-def build_prompt(query: str, context: str) -> str:
-    prompt_template = """
+# Answers keyed on query-embedding similarity within (retrieved docs, model, temperature).
+answer_cache = SemanticAnswerCache(ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+_index_watcher = IndexVersionWatcher(INDEX_VERSION_FILE)
+
+# Compiled once at import; build_prompt only fills in the variables.
+PROMPT_TEMPLATE = PromptTemplate(
+    input_variables=["query", "context"],
+    template="""
 You are a cybersecurity assistant. Based on the following context, provide a well informed answer to the user , Refer to the context but do not be limited to it.provide answer in a completely formatted manner with spaces at appropriate places for better reading experience.orovide answer as if you are the personal assistant ready to help out the user that is entering queries and are willing to help , still be a bit concise ,also in the end ask questions like do u want to do this or do u want to know more about this -questions like these at the end would be great . Also tell about how to safeguard against such attacks.
 Query: {query}
 Context: {context}
 Answer:
-"""
-    prompt = PromptTemplate(input_variables=["query", "context"], template=prompt_template)
-    return prompt.format(query=query, context=context)
+""",
+)
+
+def build_prompt(query: str, context: str) -> str:
+    return PROMPT_TEMPLATE.format(query=query, context=context)
+
+def chat_messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": "You are a cybersecurity assistant."},
+        {"role": "user", "content": prompt}
+    ]
 
 def get_llm_response(prompt: str) -> str:
-    response = client.chat.completions.create(
-        model=GROQ_MODEL,  # This value is loaded from your .env via config.py
-        messages=[
-            {"role": "system", "content": "You are a cybersecurity assistant."},
-            {"role": "user", "content": prompt}
-        ],
-        
-        temperature=0.2
-    )
+    with timed("llm"):
+        response = client.chat.completions.create(
+            model=GROQ_MODEL,  # This value is loaded from your .env via config.py
+            messages=chat_messages(prompt),
+            temperature=LLM_TEMPERATURE
+        )
     return response.choices[0].message.content.strip()
 
+async def aget_llm_response(prompt: str) -> str:
+    with timed("llm"):
+        response = await async_client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=chat_messages(prompt),
+            temperature=LLM_TEMPERATURE
+        )
+    return response.choices[0].message.content.strip()
+
+def answer_cache_bucket(doc_ids) -> tuple:
+    digest = hashlib.sha1("\x1f".join(sorted(doc_ids)).encode("utf-8")).hexdigest()
+    return (digest, GROQ_MODEL, LLM_TEMPERATURE)
+
+def stream_llm_response(prompt: str):
+    # Yields completion text deltas as Groq produces them. "llm" covers the
+    # whole stream, "llm_first_token" the wait for the first delta.
+    with timed("llm"):
+        started = time.perf_counter()
+        stream = client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=chat_messages(prompt),
+            temperature=LLM_TEMPERATURE,
+            stream=True
+        )
+        first_token = True
+        for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if first_token:
+                    record_stage("llm_first_token", time.perf_counter() - started)
+                    first_token = False
+                yield delta
+
+async def astream_llm_response(prompt: str):
+    with timed("llm"):
+        started = time.perf_counter()
+        stream = await async_client.chat.completions.create(
+            model=GROQ_MODEL,
+            messages=chat_messages(prompt),
+            temperature=LLM_TEMPERATURE,
+            stream=True
+        )
+        first_token = True
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if first_token:
+                    record_stage("llm_first_token", time.perf_counter() - started)
+                    first_token = False
+                yield delta
+
+def lookup_cached_answer(query_embedding, doc_ids):
+    # Cached answers are dropped as soon as the indexer publishes new vectors.
+    if _index_watcher.changed():
+        answer_cache.clear()
+    return answer_cache.lookup(query_embedding, answer_cache_bucket(doc_ids))
+
+def store_cached_answer(query_embedding, doc_ids, answer: str):
+    answer_cache.store(query_embedding, answer_cache_bucket(doc_ids), answer)
+
+def get_cached_llm_response(prompt: str, query_embedding, doc_ids) -> tuple:
+    # Returns (answer, cache_hit).
+    answer = lookup_cached_answer(query_embedding, doc_ids)
+    if answer is not None:
+        return answer, True
+    answer = get_llm_response(prompt)
+    store_cached_answer(query_embedding, doc_ids, answer)
+    return answer, False
+
+async def aget_cached_llm_response(prompt: str, query_embedding, doc_ids) -> tuple:
+    answer = lookup_cached_answer(query_embedding, doc_ids)
+    if answer is not None:
+        return answer, True
+    answer = await aget_llm_response(prompt)
+    store_cached_answer(query_embedding, doc_ids, answer)
+    return answer, False
+
 if __name__ == "__main__":
     sample_query = "How do malicious scripts compromise systems?"
     sample_context = "Malicious scripts manipulate system files and initiate unauthorized network connections."
@@ -0,0 +1,77 @@
+import threading
+import time
+from config import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_BUDGET_MS, RERANK_MAX_LENGTH
+
+class CrossEncoderReranker:
+    # Scores (query, passage) pairs with a CPU cross-encoder and reorders the
+    # vector candidates. Scoring runs in batches against a per-request time
+    # budget; if the next batch would overrun it, the candidates are returned
+    # in their original (vector/fusion) order instead.
+    def __init__(self, model_name: str = RERANK_MODEL, batch_size: int = RERANK_BATCH_SIZE,
+                 budget_ms: float = RERANK_BUDGET_MS):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        self.model = None
+        self.warmed = False
+        self.calls = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+
+    def load(self, warm: bool = True):
+        # warm=False only loads the weights (the gunicorn master, before fork).
+        if self.model is None or (warm and not self.warmed):
+            with self._lock:
+                if self.model is None:
+                    from sentence_transformers import CrossEncoder
+                    self.model = CrossEncoder(self.model_name, max_length=RERANK_MAX_LENGTH, device="cpu")
+                if warm and not self.warmed:
+                    # Warm-up pass so the first request doesn't pay for lazy init.
+                    self.model.predict([("warm up", "warm up")], show_progress_bar=False)
+                    self.warmed = True
+        return self
+
+    def rerank(self, query: str, docs: list, top_n: int, budget_ms: float = None) -> tuple:
+        # Returns (docs, info) where info records timing and whether the
+        # budget forced a fallback to the incoming order.
+        budget = (self.budget_ms if budget_ms is None else budget_ms) / 1000.0
+        self.load()
+        start = time.perf_counter()
+        self.calls += 1
+        scores = []
+        batches = 0
+        for i in range(0, len(docs), self.batch_size):
+            elapsed = time.perf_counter() - start
+            # Stop before a batch that would likely push past the budget.
+            per_batch = elapsed / batches if batches else 0.0
+            if elapsed + per_batch > budget:
+                self.fallbacks += 1
+                return docs[:top_n], {
+                    "rerank_ms": (time.perf_counter() - start) * 1000,
+                    "reranked": False,
+                    "scored": len(scores),
+                }
+            pairs = [(query, doc.page_content) for doc in docs[i:i + self.batch_size]]
+            scores.extend(float(s) for s in self.model.predict(pairs, show_progress_bar=False))
+            batches += 1
+
+        order = sorted(range(len(docs)), key=lambda j: scores[j], reverse=True)[:top_n]
+        ranked = []
+        for j in order:
+            doc = docs[j]
+            doc.metadata["rerank_score"] = scores[j]
+            ranked.append(doc)
+        return ranked, {
+            "rerank_ms": (time.perf_counter() - start) * 1000,
+            "reranked": True,
+            "scored": len(scores),
+        }
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            "loaded": self.model is not None,
+            "budget_ms": self.budget_ms,
+            "calls": self.calls,
+            "fallbacks": self.fallbacks,
+        }
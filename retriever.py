@@ -1,25 +1,351 @@
+import asyncio
+import hashlib
 import os
-from config import INDEX_NAME, PINECONE_API_KEY, PINECONE_ENVIRONMENT, EMBEDDING_MODEL
-os.environ["PINECONE_API_KEY"] = PINECONE_API_KEY
-os.environ["PINECONE_ENVIRONMENT"] = PINECONE_ENVIRONMENT
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from config import (
+    INDEX_NAME, EMBEDDING_MODEL, EMBEDDING_BACKEND, RETRIEVER_K, VECTOR_BACKEND,
+    QUERY_CACHE_SIZE, QUERY_CACHE_TTL, RETRIEVAL_CACHE_TTL, INDEX_VERSION_FILE,
+    HYBRID_RETRIEVAL, HYBRID_FETCH_K, RRF_K, RERANK_ENABLED, RERANK_FETCH_K,
+    CHUNK_QUERY_FACTOR, EMBED_BATCHING, EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS,
+    EMBED_BATCH_TIMEOUT_SECONDS,
+)
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from cache import TTLCache, IndexVersionWatcher, normalize_query
+from vector_backend import get_vector_index
+from embedder import get_embedder
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+from reranker import CrossEncoderReranker
+from chunker import merge_chunk_matches
+from metrics import timed
 
-from langchain_community.vectorstores import Pinecone
-from langchain_huggingface import HuggingFaceEmbeddings
-import pinecone
+class CachedEmbeddings(Embeddings):
+    # Wraps an embeddings model with a normalized-query -> vector cache so
+    # repeated questions skip model inference. Documents are never cached.
+    def __init__(self, embeddings: Embeddings, cache: TTLCache):
+        self.embeddings = embeddings
+        self.cache = cache
 
-# Initialize Pinecone client
-pc = pinecone.Pinecone(api_key=PINECONE_API_KEY)
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str):
+        key = normalize_query(text)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.embeddings.embed_query(key)
+            self.cache.set(key, vector)
+        return vector
+
+class MicroBatchEmbeddings(Embeddings):
+    # Collects query texts from concurrent requests and encodes them in one
+    # model call: a background thread takes the first waiting query plus any
+    # already queued behind it. A lone query is encoded at once; otherwise it
+    # gathers more for up to max_wait_ms or max_size items, encodes the batch
+    # and hands each caller its vector. Queries arriving during an encode
+    # queue up for the next batch. The thread starts on first use (so after a
+    # gunicorn fork, never in the master) and is restarted if it died.
+    def __init__(self, embeddings: Embeddings, max_size: int = EMBED_BATCH_MAX_SIZE,
+                 max_wait_ms: float = EMBED_BATCH_MAX_WAIT_MS, timeout: float = EMBED_BATCH_TIMEOUT_SECONDS):
+        self.embeddings = embeddings
+        self.max_size = max_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self.batches = 0
+        self.items = 0
+        self.max_batch = 0
+        self.sizes = {}     # batch size -> number of batches
+        self._queue = queue.Queue()
+        self._worker = None
+        self._worker_pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._queue = queue.Queue()
+            if self._worker_pid != os.getpid() or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._worker.start()
+                self._worker_pid = os.getpid()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            deadline = time.perf_counter() + self.max_wait
+            # Only wait for company when there is concurrency to batch.
+            while 1 < len(batch) < self.max_size:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._encode(batch)
+
+    def _encode(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            # Sentence-transformer models encode queries and documents alike.
+            vectors = dict(zip(texts, self.embeddings.embed_documents(texts)))
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        for text, future in batch:
+            future.set_result(vectors[text])
+        self.batches += 1
+        self.items += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+        self.sizes[len(batch)] = self.sizes.get(len(batch), 0) + 1
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def embed_query(self, text: str):
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((text, future))
+        # Raises concurrent.futures.TimeoutError rather than hanging the request.
+        return future.result(timeout=self.timeout)
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "mean_batch_size": self.items / self.batches if self.batches else 0.0,
+            "max_batch_size": self.max_batch,
+            "batch_sizes": dict(sorted(self.sizes.items())),
+            "max_size": self.max_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "timeout_seconds": self.timeout,
+        }
+
+class RetrieverService:
+    # Long-lived holder for the embedding model and the vector index
+    # (Pinecone or local, per VECTOR_BACKEND). The model is loaded once per
+    # process; the index handle can be reset after a fork so workers don't
+    # share the parent's HTTP connections.
+    def __init__(self, k: int = RETRIEVER_K, backend: str = VECTOR_BACKEND, hybrid: bool = HYBRID_RETRIEVAL,
+                 rerank: bool = RERANK_ENABLED):
+        self.k = k
+        self.backend = backend
+        self.hybrid = hybrid
+        self.embeddings = None
+        self.index = None
+        self.lexical = None
+        self.reranker = CrossEncoderReranker() if rerank else None
+        self.batcher_enabled = EMBED_BATCHING
+        self.batcher = None
+        self.warmed_at = None
+        self.encoded = False
+        self.last_error = None
+        self.query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+        self.retrieval_cache = TTLCache(QUERY_CACHE_SIZE, RETRIEVAL_CACHE_TTL)
+        self.index_watcher = IndexVersionWatcher(INDEX_VERSION_FILE)
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.index is not None
+
+    def warm_up(self, encode: bool = True):
+        # encode=False loads the weights and opens the index without running
+        # the model: the gunicorn master preloads that way, because the torch /
+        # OpenMP thread pools an encode starts don't survive fork. The worker's
+        # own warm_up() then runs the warm-up pass.
+        if self.ready and (self.encoded or not encode):
+            return self
+        with self._lock:
+            try:
+                if not self.ready:
+                    if self.embeddings is None:
+                        # Same embedder and runtime as index.py (EMBEDDING_BACKEND).
+                        embeddings = get_embedder()
+                        if self.batcher_enabled:
+                            self.batcher = MicroBatchEmbeddings(embeddings)
+                            embeddings = self.batcher
+                        self.embeddings = CachedEmbeddings(embeddings, self.query_cache)
+                    if self.hybrid and self.lexical is None:
+                        self.lexical = LexicalIndex()
+                    if self.reranker is not None:
+                        self.reranker.load(warm=False)
+                    self.index = get_vector_index(self.backend)
+                    self.warmed_at = time.time()
+                if encode and not self.encoded:
+                    # One encode so lazy weights/tokenizer are fully initialised.
+                    self.embeddings.embed_query("warm up")
+                    if self.reranker is not None:
+                        self.reranker.load()
+                    self.encoded = True
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                raise
+        return self
+
+    def reset_connections(self):
+        # Drop the index handle but keep the loaded model (used after fork).
+        with self._lock:
+            self.index = None
+            if self.lexical is not None:
+                self.lexical.reopen()
+
+    def embed_query(self, query: str):
+        return self.warm_up().embeddings.embed_query(query)
+
+    def search_by_vector(self, embedding, k: int = None) -> list:
+        # Matches become Documents the same way LangChain's Pinecone store
+        # builds them: the "text" metadata key moves into page_content.
+        # Long records are indexed as several chunks, so over-fetch and merge
+        # the chunks of each parent back into one Document.
+        k = k or self.k
+        results = self.warm_up().index.query(vector=embedding, top_k=k * CHUNK_QUERY_FACTOR, include_metadata=True)
+        docs = []
+        for parent_id, score, text, metadata in merge_chunk_matches(results["matches"], k):
+            metadata["score"] = score
+            docs.append(Document(id=parent_id, page_content=text, metadata=metadata))
+        return docs
+
+    def hybrid_search(self, query: str, embedding, k: int = None) -> list:
+        # Exact IOC matches first, then vector and BM25 rankings fused with
+        # reciprocal rank fusion. Exact matches keep their fused order (those
+        # outside it follow by BM25 score), so when an indicator appears in
+        # more than k records the best of them win. Lexical-only hits are
+        # rebuilt from the lexical index's stored text and metadata.
+        k = k or self.k
+        vector_docs = self.search_by_vector(embedding, k=max(k, HYBRID_FETCH_K))
+        by_id = {doc.id: doc for doc in vector_docs}
+        exact_ids = self.lexical.lookup_iocs(query)
+        lexical_ids = [doc_id for doc_id, _ in self.lexical.search(query, HYBRID_FETCH_K)]
+        fused_ids = reciprocal_rank_fusion([[doc.id for doc in vector_docs], lexical_ids], RRF_K)
+        fused_rank = {doc_id: rank for rank, doc_id in enumerate(fused_ids)}
+        exact_ids = sorted(exact_ids, key=lambda doc_id: fused_rank.get(doc_id, len(fused_ids)))
+        exact = set(exact_ids)
+
+        docs = []
+        for doc_id in exact_ids + [doc_id for doc_id in fused_ids if doc_id not in exact]:
+            doc = by_id.get(doc_id)
+            if doc is None:
+                stored = self.lexical.get(doc_id)
+                if stored is None:
+                    continue
+                doc = Document(id=doc_id, page_content=stored["text"], metadata=dict(stored["metadata"]))
+            docs.append(doc)
+            if len(docs) >= k:
+                break
+        return docs
+
+    def retrieve(self, query: str) -> tuple:
+        # Returns (docs, info): retrieval cache outcome and rerank details.
+        # Stage latencies go to the metrics registry and Server-Timing header.
+        if self.index_watcher.changed():
+            # New vectors were indexed; cached retrievals may be missing them.
+            # The lexical postings are rebuilt in the background and swapped in.
+            self.retrieval_cache.clear()
+            if hasattr(self.index, "reload"):
+                self.index.reload()
+            if self.lexical is not None:
+                self.lexical.reload_async()
+        key = normalize_query(query)
+        docs = self.retrieval_cache.get(key)
+        if docs is not None:
+            return list(docs), {"retrieval_cache": "hit"}
+
+        info = {"retrieval_cache": "miss"}
+        with timed("embed"):
+            embedding = self.embed_query(query)
+
+        # With a reranker, over-fetch candidates and let it pick the top k.
+        fetch_k = max(self.k, RERANK_FETCH_K) if self.reranker is not None else self.k
+        with timed("vector_search"):
+            if self.lexical is not None:
+                docs = self.hybrid_search(query, embedding, k=fetch_k)
+            else:
+                docs = self.search_by_vector(embedding, k=fetch_k)
+
+        if self.reranker is not None:
+            with timed("rerank"):
+                docs, rerank_info = self.reranker.rerank(query, docs, self.k)
+            info.update(rerank_info)
+        self.retrieval_cache.set(key, docs)
+        return list(docs), info
+
+    def invoke(self, query: str):
+        return self.retrieve(query)[0]
+
+    # Async variants for the ASGI app. Embedding is CPU-bound and the Pinecone
+    # client is blocking, so both run on the default thread pool rather than
+    # the event loop.
+    async def aembed_query(self, query: str):
+        return await asyncio.to_thread(self.embed_query, query)
+
+    async def ainvoke(self, query: str):
+        return await asyncio.to_thread(self.invoke, query)
+
+    async def aretrieve(self, query: str):
+        return await asyncio.to_thread(self.retrieve, query)
+
+    def clear_caches(self):
+        self.query_cache.clear()
+        self.retrieval_cache.clear()
+
+    def health(self) -> dict:
+        return {
+            "ready": self.ready,
+            "model_loaded": self.embeddings is not None,
+            "embedding_model": EMBEDDING_MODEL,
+            "embedding_backend": EMBEDDING_BACKEND,
+            "backend": self.backend,
+            "hybrid": self.lexical is not None,
+            "index": INDEX_NAME,
+            "k": self.k,
+            "warmed_at": self.warmed_at,
+            "last_error": self.last_error,
+            "query_cache": self.query_cache.stats(),
+            "retrieval_cache": self.retrieval_cache.stats(),
+            "reranker": self.reranker.stats() if self.reranker is not None else None,
+            "embed_batcher": self.batcher.stats() if self.batcher is not None else None,
+        }
+
+def document_ids(docs) -> list:
+    # Vector IDs when the store provides them, otherwise a content hash.
+    ids = []
+    for doc in docs:
+        doc_id = getattr(doc, "id", None)
+        if not doc_id:
+            doc_id = hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+        ids.append(doc_id)
+    return ids
+
+_service = None
+_service_lock = threading.Lock()
+
+def get_retriever_service() -> RetrieverService:
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = RetrieverService()
+    return _service
 
 def get_retriever():
-    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
-    vector_store = Pinecone.from_existing_index(INDEX_NAME, embeddings)
-    retriever = vector_store.as_retriever(search_kwargs={"k": 5})
-    return retriever
+    # The warmed service exposes the same invoke(query) -> [Document] API.
+    return get_retriever_service().warm_up()
 
 if __name__ == "__main__":
-    retriever = get_retriever()
+    service = get_retriever_service().warm_up()
     test_query = "What suspicious IP addresses are reported?"
-    docs = retriever.invoke(test_query)
+    docs = service.invoke(test_query)
     for i, doc in enumerate(docs):
         text = doc.metadata.get("text") if "text" in doc.metadata and doc.metadata.get("text") else doc.page_content
         print(f"Doc {i+1}: {text[:200]}...\n")
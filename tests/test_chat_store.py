@@ -0,0 +1,91 @@
+import pytest
+import chat_store
+from chat_store import (
+    TurnBatch, ensure_indexes, get_chat, list_chats, message_window, migrate_legacy_sessions, page_filter,
+)
+
+mongomock = pytest.importorskip("mongomock")
+
+@pytest.fixture
+def collection(monkeypatch):
+    # Small buckets and recent window so a few turns span several of each.
+    monkeypatch.setattr(chat_store, "CHAT_BUCKET_SIZE", 4)
+    monkeypatch.setattr(chat_store, "CHAT_RECENT_MESSAGES", 3)
+    collection = mongomock.MongoClient().db.chats
+    ensure_indexes(collection)
+    return collection
+
+def contents(chat):
+    return [message["content"] for message in chat["messages"]]
+
+def test_turns_fill_buckets_by_message_number(collection):
+    TurnBatch([("s", f"q{i}", f"a{i}") for i in range(3)]).apply(collection)
+    TurnBatch([("s", "q3", "a3")]).apply(collection)
+    session = collection.find_one({"session_id": "s"})
+    assert session["title"] == "q0"
+    assert session["message_count"] == 8
+    assert [message["content"] for message in session["messages"]] == ["a2", "q3", "a3"]
+    buckets = {doc["bucket"]: doc["messages"] for doc in chat_store.messages_collection(collection).find()}
+    assert sorted(buckets) == [0, 1]
+    assert buckets[0]["3"]["content"] == "a1" and buckets[1]["3"]["content"] == "a3"
+
+def test_apply_is_safe_to_retry(collection):
+    batch = TurnBatch([("s", "q0", "a0"), ("t", "q1", "a1")])
+    batch.apply(collection)
+    batch.apply(collection)
+    assert collection.find_one({"session_id": "s"})["message_count"] == 2
+    assert collection.find_one({"session_id": "t"})["message_count"] == 2
+
+@pytest.mark.parametrize("offset, limit, expected", [
+    (-3, 3, ["a2", "q3", "a3"]),            # served from the session's recent window
+    (0, 3, ["q0", "a0", "q1"]),            # from bucket 0
+    (2, 4, ["q1", "a1", "q2", "a2"]),      # spans buckets 0 and 1
+    (6, 10, ["q3", "a3"]),
+    (-100, 2, ["q0", "a0"]),
+    (20, 5, []),
+])
+def test_window(collection, offset, limit, expected):
+    TurnBatch([("s", f"q{i}", f"a{i}") for i in range(4)]).apply(collection)
+    chat = get_chat(collection, "s", offset, limit)
+    assert contents(chat) == expected
+    assert chat["message_count"] == 8
+
+def test_legacy_session_is_migrated_on_write(collection):
+    history = [{"role": "user", "content": f"m{i}"} for i in range(5)]
+    collection.insert_one({"session_id": "old", "title": "old", "messages": history})
+    TurnBatch([("old", "q", "a")]).apply(collection)
+    assert collection.count_documents({"session_id": "old"}) == 1
+    assert contents(get_chat(collection, "old", 0, 100)) == ["m0", "m1", "m2", "m3", "m4", "q", "a"]
+    assert migrate_legacy_sessions(collection) == 0
+
+def test_legacy_session_migrated_at_startup(collection):
+    history = [{"role": "user", "content": f"m{i}"} for i in range(5)]
+    collection.insert_one({"session_id": "old", "messages": history})
+    assert migrate_legacy_sessions(collection) == 1
+    session = collection.find_one({"session_id": "old"})
+    assert session["message_count"] == 5 and len(session["messages"]) == 3
+    assert contents(get_chat(collection, "old", 0, 100)) == [m["content"] for m in history]
+
+def test_message_window_bounds():
+    assert message_window() == (-chat_store.CHAT_MESSAGES_LIMIT, chat_store.CHAT_MESSAGES_LIMIT)
+    assert message_window("5", "0") == (5, 1)
+    assert message_window("0", "100000") == (0, chat_store.MAX_MESSAGES_PER_REQUEST)
+    with pytest.raises(ValueError):
+        message_window("x")
+
+def test_list_chats_pages_with_cursor(collection):
+    for i in range(5):
+        TurnBatch([(f"s{i}", f"q{i}", f"a{i}")]).apply(collection)
+    seen, cursor = [], None
+    while True:
+        page = list_chats(collection, cursor, limit=2)
+        seen.extend(chat["session_id"] for chat in page["chats"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == ["s4", "s3", "s2", "s1", "s0"]
+
+def test_page_filter_rejects_bad_cursor():
+    assert page_filter(None) == {}
+    with pytest.raises(ValueError):
+        page_filter("not-a-cursor")
@@ -0,0 +1,96 @@
+import gzip
+import json
+import pytest
+import document_store
+from document_store import DocumentStore
+
+def records(prefix, count):
+    return [{"page_content": f"{prefix} record {i}", "metadata": {"source": prefix}} for i in range(count)]
+
+@pytest.fixture(params=["documents.jsonl", "documents.jsonl.gz"])
+def store(request, tmp_path):
+    return DocumentStore(str(tmp_path / request.param))
+
+def test_iter_entries_resumes_from_offsets(store):
+    store.sync_source("a", records("a", 3))
+    entries = list(store.iter_entries(0))
+    assert len(entries) == 3
+    assert entries[-1][0] == store.size()
+    # Resuming from an offset yields only what was appended after it.
+    store.sync_source("b", records("b", 2))
+    later = list(store.iter_entries(entries[-1][0]))
+    assert [entry["origin"] for _, entry in later] == ["b", "b"]
+    assert list(store.iter_entries(store.size())) == []
+
+def test_incomplete_tail_is_not_read(store):
+    store.sync_source("a", records("a", 2))
+    complete = store.size()
+    with open(store.path, "ab") as f:
+        if store.compressed:
+            f.write(gzip.compress(b'{"op": "upsert"}\n')[:10])
+        else:
+            f.write(b'{"op": "upsert", "id"')
+    assert [offset for offset, _ in store.iter_entries(0)][-1] == complete
+
+def test_gzip_members_span_reads(tmp_path, monkeypatch):
+    monkeypatch.setattr(document_store, "READ_SIZE", 7)
+    store = DocumentStore(str(tmp_path / "documents.jsonl.gz"))
+    for i in range(3):
+        store.sync_source(f"s{i}", records(f"s{i}", 4))
+    offsets = [offset for offset, _ in store.iter_entries(0)]
+    assert len(offsets) == 12 and offsets[-1] == store.size()
+    assert len(set(offsets)) == 3   # one resume point per appended member
+
+def test_compact_keeps_live_documents(store):
+    store.sync_source("a", records("a", 4))
+    store.sync_source("a", records("a", 1))   # three tombstones
+    store.sync_source("b", records("b", 1))
+    store.write_cursor("index", 0)
+    assert not store.compact()                 # a consumer is still behind
+    store.write_cursor("index", store.size())
+    assert store.compact()
+    live = sorted(entry["page_content"] for entry in store.iter_documents())
+    assert live == ["a record 0", "b record 0"]
+    assert len(list(store.iter_entries(0))) == 2
+    assert not store.behind("index")
+
+def feed_record(url, status="online"):
+    return {"page_content": f"Malicious URL: {url} ({status})", "metadata": {"url": url, "status": status}}
+
+def url_key(record):
+    return record["metadata"]["url"]
+
+def age(path, days):
+    # Pretend every record was last seen `days` ago.
+    rows = document_store.load_feed_records(path)
+    for row in rows:
+        row["last_seen"] -= days * 86400
+    with open(path, "w") as f:
+        json.dump(rows, f)
+
+def test_merge_keyed_records_updates_in_place(tmp_path):
+    path = str(tmp_path / "feed.json")
+    document_store.merge_keyed_records(path, [feed_record("http://a"), feed_record("http://b")], url_key)
+    stats = document_store.merge_keyed_records(path, [feed_record("http://a", "offline")], url_key)
+    assert (stats["added"], stats["updated"], stats["total"]) == (0, 1, 2)
+    rows = {url_key(row): row for row in document_store.load_feed_records(path)}
+    assert rows["http://a"]["metadata"]["status"] == "offline"
+    assert not (tmp_path / "feed.json.tmp").exists()
+
+def test_retention_follows_what_the_source_still_lists(tmp_path):
+    path = str(tmp_path / "feed.json")
+    document_store.merge_keyed_records(path, [feed_record("http://a"), feed_record("http://b")], url_key)
+    age(path, 29)
+    # "a" is still listed by the source but not re-sent; only "b" lapses.
+    document_store.merge_keyed_records(path, [], url_key, retention_days=30, listed=["http://a"])
+    age(path, 2)
+    stats = document_store.merge_keyed_records(path, [], url_key, retention_days=30)
+    assert stats["expired"] == 1
+    assert [url_key(row) for row in document_store.load_feed_records(path)] == ["http://a"]
+
+def test_no_retention_keeps_records(tmp_path):
+    path = str(tmp_path / "feed.json")
+    document_store.merge_keyed_records(path, [feed_record("http://a")], url_key, retention_days=None)
+    age(path, 365)
+    stats = document_store.merge_keyed_records(path, [], url_key, retention_days=None)
+    assert (stats["expired"], stats["total"]) == (0, 1)
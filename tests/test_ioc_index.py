@@ -0,0 +1,73 @@
+from ioc_index import IOCIndex, extract_iocs
+
+def build(*documents):
+    index = IOCIndex()
+    for doc_id, text, metadata in documents:
+        index.add(doc_id, text, metadata)
+    return index
+
+def matches(index, indicator):
+    return sorted((hit["match"], hit["matched"], hit["record"]["id"]) for hit in index.lookup(indicator))
+
+def test_exact_ip_and_hash():
+    digest = "a" * 64
+    index = build(("a", f"Seen at 45.12.3.4 dropping {digest}", {}), ("b", "unrelated", {"ip": "10.0.0.1"}))
+    assert matches(index, "45.12.3.4") == [("exact", "45.12.3.4", "a")]
+    assert matches(index, digest.upper()) == [("exact", digest, "a")]
+    assert matches(index, "10.0.0.1") == [("exact", "10.0.0.1", "b")]
+    assert matches(index, "10.0.0.2") == []
+
+def test_cidr_contains_address():
+    index = build(("net", "Block 45.12.0.0/16", {}))
+    assert matches(index, "45.12.3.4") == [("cidr", "45.12.0.0/16", "net")]
+    assert matches(index, "45.13.3.4") == []
+
+def test_within_range_query():
+    index = build(("a", "host 45.12.3.4", {}), ("b", "host 45.12.200.1", {}), ("c", "host 46.0.0.1", {}))
+    assert [hit[2] for hit in matches(index, "45.12.0.0/16")] == ["a", "b"]
+
+def test_parent_domain():
+    index = build(("d", "C2 at evil.com", {}))
+    assert matches(index, "login.evil.com") == [("domain", "evil.com", "d")]
+    assert matches(index, "http://cdn.evil.com/payload") == [("domain", "evil.com", "d")]
+    assert matches(index, "evil.com") == [("exact", "evil.com", "d")]
+    assert matches(index, "notevil.com") == []
+
+def test_ipv6_networks_do_not_cover_ipv4():
+    # ::/96 spans the same integers as the whole IPv4 space.
+    index = build(("v6", "", {"ip": "::/96"}), ("v4", "", {"ip": "1.2.3.0/24"}))
+    assert matches(index, "1.2.3.4") == [("cidr", "1.2.3.0/24", "v4")]
+    assert matches(index, "::102:304") == [("cidr", "::/96", "v6")]
+
+def test_file_and_product_names_are_not_domains():
+    iocs = extract_iocs("Built with node.js and ASP.NET; see index.html and config.py, beacon to bad.ru")
+    assert iocs == {"bad.ru"}
+
+def test_get_ioc_index_falls_back_to_data_json_and_rebuilds_in_background(tmp_path, monkeypatch):
+    import json
+    import os
+    import time
+    import ioc_index
+    from document_store import DocumentStore, legacy_documents
+
+    data = tmp_path / "data.json"
+    data.write_text(json.dumps([{"page_content": "C2 at 45.12.3.4", "metadata": {"source": "seed"}}]))
+    store_path, version = str(tmp_path / "documents.jsonl"), tmp_path / "index_version.txt"
+    monkeypatch.setattr(ioc_index, "DocumentStore", lambda: DocumentStore(store_path))
+    monkeypatch.setattr(ioc_index, "legacy_documents", lambda: legacy_documents(str(data)))
+    monkeypatch.setattr(ioc_index, "INDEX_VERSION_FILE", str(version))
+    monkeypatch.setattr(ioc_index, "_ioc_index", None)
+    monkeypatch.setattr(ioc_index, "_ioc_watcher", None)
+
+    first = ioc_index.get_ioc_index()
+    assert [hit["match"] for hit in first.lookup("45.12.3.4")] == ["exact"]
+
+    DocumentStore(store_path).sync_source("feed", [{"page_content": "Scanner 10.9.8.7", "metadata": {}}])
+    version.write_text("2")
+    os.utime(version, ns=(time.time_ns() + 10**9,) * 2)
+    assert ioc_index.get_ioc_index() is first   # served from the old index while rebuilding
+    deadline = time.time() + 5
+    while ioc_index.get_ioc_index() is first and time.time() < deadline:
+        time.sleep(0.01)
+    rebuilt = ioc_index.get_ioc_index()
+    assert rebuilt.lookup("10.9.8.7") and not rebuilt.lookup("45.12.3.4")
@@ -0,0 +1,24 @@
+from lexical_index import LexicalIndex, reciprocal_rank_fusion
+
+def test_exact_ioc_hits_ranked_by_score(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical_index.db"))
+    index.add("a", "Unrelated record that lists 45.12.3.4 among many other things and words", {})
+    index.add("b", "45.12.3.4 botnet 45.12.3.4 botnet controller", {})
+    index.add("c", "Nothing to see here", {})
+    index.flush()
+    assert index.lookup_iocs("botnet on 45.12.3.4") == ["b", "a"]
+    assert [doc_id for doc_id, _ in index.search("botnet")] == ["b"]
+
+def test_reload_and_remove(tmp_path):
+    path = str(tmp_path / "lexical_index.db")
+    index = LexicalIndex(path)
+    index.add("a", "ransomware note", {"url": "http://bad.ru/x"})
+    index.flush()
+    reopened = LexicalIndex(path)
+    assert "a" in reopened and reopened.lookup_iocs("http://bad.ru/x") == ["a"]
+    assert reopened.get("a") == {"text": "ransomware note", "metadata": {"url": "http://bad.ru/x"}}
+    reopened.remove(["a"])
+    assert len(reopened) == 0 and reopened.search("ransomware") == []
+
+def test_reciprocal_rank_fusion():
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "c"]]) == ["b", "a", "c"]
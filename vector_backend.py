@@ -0,0 +1,192 @@
+import json
+import os
+import threading
+import numpy as np
+from config import (
+    VECTOR_BACKEND, PINECONE_API_KEY, INDEX_NAME,
+    LOCAL_INDEX_DIR, LOCAL_INDEX_MODE, LOCAL_IVF_NPROBE,
+)
+
+# Vector store backends. Both expose the subset of the Pinecone Index API the
+# indexer and retriever use: upsert(vectors=...), delete(ids=...),
+# query(vector=..., top_k=..., include_metadata=...) -> {"matches": [...]}.
+
+IVF_MIN_ROWS = 256
+
+def _inverted_lists(assignments, nlist: int) -> list:
+    # Row numbers per cluster, from each row's cluster id.
+    order = np.argsort(assignments, kind="stable")
+    bounds = np.searchsorted(assignments[order], np.arange(nlist + 1))
+    return [order[bounds[c]:bounds[c + 1]] for c in range(nlist)]
+
+class LocalVectorIndex:
+    # In-process index over a float32 matrix persisted as a .npy file (memory
+    # mapped on load) plus a JSON sidecar of IDs and metadata. Vectors are
+    # expected to be unit-normalized, so inner product == cosine similarity.
+    # mode "exact" scores every row; mode "ivf" clusters rows with k-means and
+    # only scores the `nprobe` nearest clusters. The clustering is computed by
+    # the writer in flush() and persisted next to the vectors, so readers only
+    # load it; until one exists for the current rows, queries scan exactly.
+    def __init__(self, path: str = LOCAL_INDEX_DIR, mode: str = LOCAL_INDEX_MODE, nprobe: int = LOCAL_IVF_NPROBE):
+        self.path = path
+        self.mode = mode
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self.reload()
+
+    # -------------------- Persistence --------------------
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def reload(self):
+        with self._lock:
+            self.ids, self.metadata = [], []
+            self.matrix = None
+            if os.path.exists(self._file("records.json")):
+                with open(self._file("records.json"), "r") as f:
+                    records = json.load(f)
+                self.ids = records["ids"]
+                self.metadata = records["metadata"]
+                self.matrix = np.load(self._file("vectors.npy"), mmap_mode="r")
+            self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            self._pending = []
+            self.ivf = self._load_ivf() if self.mode == "ivf" else None
+            self.dirty = False
+
+    def _load_ivf(self):
+        # None when missing or written for a different set of rows (a reader
+        # racing the writer's file replacements); queries then scan exactly.
+        try:
+            with np.load(self._file("ivf.npz")) as data:
+                centroids, assignments = data["centroids"], data["assignments"]
+        except (FileNotFoundError, OSError, KeyError, ValueError):
+            return None
+        if len(assignments) != len(self.ids):
+            return None
+        return centroids, _inverted_lists(assignments, len(centroids))
+
+    def flush(self):
+        # Write pending upserts/deletes; readers pick them up via reload().
+        with self._lock:
+            if not self.dirty:
+                return
+            self._materialize()
+            os.makedirs(self.path, exist_ok=True)
+            matrix = self.matrix if self.matrix is not None else np.zeros((0, 0), dtype=np.float32)
+            np.save(self._file("vectors.tmp.npy"), np.asarray(matrix, dtype=np.float32))
+            with open(self._file("records.tmp.json"), "w") as f:
+                json.dump({"ids": self.ids, "metadata": self.metadata}, f)
+            os.replace(self._file("vectors.tmp.npy"), self._file("vectors.npy"))
+            os.replace(self._file("records.tmp.json"), self._file("records.json"))
+            if self.mode == "ivf" and len(self.ids) >= IVF_MIN_ROWS:
+                centroids, assignments = self._build_ivf()
+                np.savez(self._file("ivf.tmp.npz"), centroids=centroids, assignments=assignments)
+                os.replace(self._file("ivf.tmp.npz"), self._file("ivf.npz"))
+                self.ivf = centroids, _inverted_lists(assignments, len(centroids))
+            elif os.path.exists(self._file("ivf.npz")):
+                os.remove(self._file("ivf.npz"))
+            self.dirty = False
+
+    # -------------------- Writes --------------------
+    def _materialize(self):
+        # Fold appended rows into the matrix; copies a memory-mapped matrix
+        # into memory the first time it is modified.
+        if isinstance(self.matrix, np.memmap):
+            self.matrix = np.array(self.matrix)
+        if self._pending:
+            new_rows = np.asarray(self._pending, dtype=np.float32)
+            if self.matrix is None or not len(self.matrix):
+                self.matrix = new_rows
+            else:
+                self.matrix = np.vstack([self.matrix, new_rows])
+            self._pending = []
+
+    def upsert(self, vectors):
+        with self._lock:
+            for doc_id, values, metadata in vectors:
+                row = self.rows.get(doc_id)
+                if row is None:
+                    self.rows[doc_id] = len(self.ids)
+                    self.ids.append(doc_id)
+                    self.metadata.append(metadata)
+                    self._pending.append(values)
+                else:
+                    self._materialize()
+                    self.matrix[row] = values
+                    self.metadata[row] = metadata
+            self.ivf = None
+            self.dirty = True
+        return {"upserted_count": len(vectors)}
+
+    def delete(self, ids):
+        with self._lock:
+            drop = {self.rows[doc_id] for doc_id in ids if doc_id in self.rows}
+            if not drop:
+                return {}
+            self._materialize()
+            keep = [row for row in range(len(self.ids)) if row not in drop]
+            self.matrix = self.matrix[keep]
+            self.ids = [self.ids[row] for row in keep]
+            self.metadata = [self.metadata[row] for row in keep]
+            self.rows = {doc_id: row for row, doc_id in enumerate(self.ids)}
+            self.ivf = None
+            self.dirty = True
+        return {}
+
+    # -------------------- Search --------------------
+    def _build_ivf(self, iterations: int = 10):
+        # Plain k-means over the rows; sqrt(n) lists is the usual starting point.
+        # Returns (centroids, cluster of each row).
+        n = len(self.ids)
+        nlist = max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(0)
+        data = np.asarray(self.matrix)
+        centroids = data[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignments = np.argmax(data @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = data[assignments == c]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        return centroids, np.argmax(data @ centroids.T, axis=1).astype(np.int32)
+
+    def _candidates(self, query):
+        # Small indexes are faster to scan exactly; no clustering is ever
+        # built on the query path.
+        if self.mode != "ivf" or self.ivf is None or len(self.ids) < IVF_MIN_ROWS:
+            return None
+        centroids, lists = self.ivf
+        probe = np.argsort(-(centroids @ query))[:self.nprobe]
+        return np.concatenate([lists[c] for c in probe])
+
+    def query(self, vector, top_k: int = 5, include_metadata: bool = True, **kwargs):
+        with self._lock:
+            if not self.ids:
+                return {"matches": []}
+            if self._pending:
+                self._materialize()
+            query = np.asarray(vector, dtype=np.float32)
+            rows = self._candidates(query)
+            scores = np.asarray(self.matrix if rows is None else self.matrix[rows]) @ query
+            k = min(top_k, len(scores))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            matches = []
+            for position in best:
+                row = int(position if rows is None else rows[position])
+                match = {"id": self.ids[row], "score": float(scores[position])}
+                if include_metadata:
+                    match["metadata"] = dict(self.metadata[row])
+                matches.append(match)
+            return {"matches": matches}
+
+    def describe_index_stats(self):
+        return {"total_vector_count": len(self.ids), "dimension": 0 if self.matrix is None else int(self.matrix.shape[1])}
+
+def get_vector_index(backend: str = VECTOR_BACKEND):
+    if backend == "local":
+        return LocalVectorIndex()
+    from pinecone import Pinecone
+    pc = Pinecone(api_key=PINECONE_API_KEY)
+    return pc.Index(INDEX_NAME)